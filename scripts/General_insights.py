@@ -2,8 +2,12 @@
 import streamlit as st
 import pandas as pd
 import datetime
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import part1
 import part5
+import correlations
+import instrumentation
 import plots_general_insights as plots
 
 st.set_page_config(
@@ -13,6 +17,258 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+def timed_fragment(func):
+    # Section fragment whose spans are collected and shown in the section itself. A fragment rerun (e.g. after
+    # selecting other hours) does not rerun the page, so the sidebar panel would still show the previous run.
+    @st.fragment
+    @functools.wraps(func)
+    def fragment(*args, **kwargs):
+        enabled = st.session_state.get("performance", False)
+
+        with instrumentation.section(enabled):
+            func(*args, **kwargs)
+
+            if enabled:
+                plots.performance_panel(sidebar=False)
+
+    return fragment
+
+# Period graphs
+@timed_fragment
+def show_period(dates):
+    st.plotly_chart(plots.plot_steps_calories_combined_general(dates), use_container_width=True)
+
+# Daily graphs
+@timed_fragment
+def show_daily(dates):
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.plotly_chart(plots.bar_chart_hourly_average_steps(dates), use_container_width=True)
+
+    with col2:
+        st.plotly_chart(plots.plot_heart_rate(dates), use_container_width=True)
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.plotly_chart(plots.bar_chart_hourly_average_calories(dates), use_container_width=True)
+
+    with col2:
+        st.plotly_chart(plots.bar_chart_daily_intensity(dates), use_container_width=True)
+
+    st.plotly_chart(plots.bar_chart_daily_sleep(dates), use_container_width=True)
+
+# Weekly graphs
+@timed_fragment
+def show_weekly(dates):
+    col1, col2 = st.columns(2) 
+
+    with col1:
+        st.plotly_chart(plots.bar_chart_average_distance_per_week(dates), use_container_width=True)
+    with col2:
+        st.plotly_chart(plots.bar_chart_average_steps_per_week(dates), use_container_width=True)
+
+    col1, col2 = st.columns(2)  
+
+    with col1:
+        st.plotly_chart(plots.bar_chart_average_calories_per_day_for_week(dates), use_container_width=True)
+
+    with col2:
+        st.plotly_chart(plots.bar_chart_weekly_sleep(dates), use_container_width=True)
+
+    st.plotly_chart(plots.plot_active_minutes_bar_chart_per_day(dates), use_container_width=True)
+
+# Sleep insights
+@timed_fragment
+def show_sleep(dates):
+    with st.popover("Correlation explained"):
+        st.write("Correlation is a measure of how two variables are related to each other, with values ranging from -1 to 1. If the correlation is 1, it means the two variables move together perfectly in the same direction. If the correlation is -1, the variables move in exactly opposite directions. A correlation of 0 means there's no clear connection between them.")
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        fig, corr = plots.plot_correlation_sleep_sedentary_minutes(dates)
+        st.plotly_chart(fig, use_container_width=True)
+        plots.create_correlation_block("Correlation coefficient:", corr, "")
+
+    with col2:
+        fig, corr = plots.plot_correlation_sleep_active_minutes(dates)
+        st.plotly_chart(fig, use_container_width=True)
+        plots.create_correlation_block("Correlation coefficient:", corr, "")
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        fig, corr = plots.plot_correlation_sleep_steps(dates)
+        st.plotly_chart(fig, use_container_width=True)
+        plots.create_correlation_block("Correlation coefficient:", corr, "")
+
+    with col2:
+        fig, corr = plots.plot_correlation_sleep_calories(dates)
+        st.plotly_chart(fig, use_container_width=True)
+        plots.create_correlation_block("Correlation coefficient:", corr, "")
+
+# Weather insights
+@timed_fragment
+def show_weather(dates):
+    with st.popover("Correlation explained"):
+        st.write("Correlation is a measure of how two variables are related to each other, with values ranging from -1 to 1. If the correlation is 1, it means the two variables move together perfectly in the same direction. If the correlation is -1, the variables move in exactly opposite directions. A correlation of 0 means there's no clear connection between them.")
+
+    col1, col2 = st.columns(2)
+    hour_selection = ["0-4", "4-8", "8-12", "12-16", "16-20", "20-24"]
+    days_selection = ["Weekdays", "Weekend"]
+
+    with col1:
+        st.markdown("</br>", unsafe_allow_html=True)
+        hours = st.segmented_control("Hours", hour_selection, key="Hours", default=["4-8", "8-12", "12-16", "16-20"], selection_mode="multi")
+        days = st.pills("Time of the week", days_selection, key="Days", default=["Weekend"], selection_mode="multi")
+
+        fig, corr = plots.plot_correlation_weather_steps(hours, days, dates)
+        st.plotly_chart(fig, use_container_width=True)
+        plots.create_correlation_block("Correlation coefficient:", corr, "")
+
+    with col2:
+        st.markdown("</br>", unsafe_allow_html=True)
+        hours2 = st.segmented_control("Hours", hour_selection, key="Hours2", default=["4-8", "8-12", "12-16", "16-20"], selection_mode="multi")
+        days2 = st.pills("Time of the week", days_selection, key="Days2", default=["Weekend"], selection_mode="multi")
+
+        fig, corr = plots.plot_correlation_weather_intensity(hours2, days2, dates)
+        st.plotly_chart(fig, use_container_width=True)
+        plots.create_correlation_block("Correlation coefficient:", corr, "")
+
+# Statistics
+@timed_fragment
+def show_statistics(dates):
+    col1, col2, col3 = st.columns([4, 5, 12])
+    with col1:
+        with st.popover("Median explained"):
+            st.write("The median is the middle value of a dataset when it is ordered from smallest to largest.")
+    with col2: 
+        with st.popover("Upper quartile explained"):
+            st.write("The upper quartile represents the value below which 75% of the data points fall. It is also known as the third quartile or 75th percentile.")
+
+    with col3:
+        with st.popover("Lower quartile explained"):
+            st.write("The lower quartile represents the value below which 25% of the data points fall, and it is also called the first quartile or 25th percentile.")
+
+    col1, col2, col3 = st.columns([2, 0.25, 2])
+
+    with col1:
+        fig, summary = plots.plot_boxplot("TotalSteps", "Total Steps", dates)
+        st.plotly_chart(fig, use_container_width=True)
+        plots.get_stats(summary, "TotalSteps", 0, "steps")
+
+    with col3:
+        fig, summary = plots.plot_boxplot("Calories", "Calories", dates)
+        st.plotly_chart(fig, use_container_width=True)
+        plots.get_stats(summary, "Calories", 0, "kcal")
+
+    col1, col2, col3 = st.columns([2, 0.25, 2])
+
+    with col1:
+        fig, summary = plots.plot_boxplot("TotalDistance", "Total Distance", dates)
+        st.plotly_chart(fig, use_container_width=True)
+        plots.get_stats(summary, "TotalDistance", 2, "km")
+
+    with col3:
+        fig, summary = plots.plot_boxplot("TotalActiveMinutes", "Total Active Minutes", dates)
+        st.plotly_chart(fig, use_container_width=True)
+        plots.get_stats(summary, "TotalActiveMinutes", 0, "min")
+
+    fig, summary = plots.plot_boxplot("SedentaryMinutes", "Sedentary Minutes", dates)
+    st.plotly_chart(fig, use_container_width=True)
+    plots.get_stats(summary, "SedentaryMinutes", 0, "min")
+
+# Correlations
+@timed_fragment
+def show_correlations(dates):
+    with st.popover("Correlation explained"):
+        st.write("Correlation is a measure of how two variables are related to each other, with values ranging from -1 to 1. If the correlation is 1, it means the two variables move together perfectly in the same direction. If the correlation is -1, the variables move in exactly opposite directions. A correlation of 0 means there's no clear connection between them.")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        fig, corr = plots.scatterplot_heart_rate_intensityvity(dates)
+        st.plotly_chart(fig, use_container_width=True)
+        plots.create_correlation_block("Correlation coefficient:", corr, "")
+
+    with col2:
+        fig, corr = plots.scatterplot_calories_and_active_minutes(dates)
+        st.plotly_chart(fig, use_container_width=True)
+        plots.create_correlation_block("Correlation coefficient:", corr, "")
+
+    st.plotly_chart(plots.plot_active_minutes_active_distance(dates), use_container_width=True)
+
+# Other insights
+@timed_fragment
+def show_other(dates):
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.plotly_chart(plots.plot_activity_pie_chart(dates), use_container_width=True)
+
+    with col2:
+        st.plotly_chart(plots.plot_weight_pie_chart(), use_container_width=True)
+        plots.create_correlation_block("Note:<br>This graph is not affected by the specified date range.", "", "")
+
+    col1, col2, = st.columns(2)
+
+    with col1:
+        st.plotly_chart(plots.plot_user_pie_chart(), use_container_width=True)
+        plots.create_correlation_block("Note:<br>This graph is not affected by the specified date range.", "", "")
+
+    with col2: 
+        st.plotly_chart(plots.bar_chart_total_workout_frequency_for_period(dates), use_container_width=True)
+        plots.create_correlation_block("Note:<br>This graph is not affected by the specified date range.", "", "")
+
+# Sections of the page, only the selected one is rendered on a run
+SECTIONS = {
+    "Period": show_period,
+    "Daily": show_daily,
+    "Weekly": show_weekly,
+    "Sleep insights": show_sleep,
+    "Weather insights": show_weather,
+    "Statistics": show_statistics,
+    "Correlations": show_correlations,
+    "Other": show_other,
+}
+
+def section_data(dates):
+    # Cached part5 data functions behind the charts of each section, as (function, *arguments)
+    return {
+        "Period": [(part5.average_steps_calories_per_period, dates)],
+        "Daily": [(part5.average_steps_per_hour, dates), (part5.hourly_average_heart_rate_dates, dates),
+                  (part5.hourly_average_calories, dates), (part5.hourly_weather_activity, dates),
+                  (part5.sleep_data, dates)],
+        "Weekly": [(part5.average_distance_per_week, dates), (part5.average_steps_per_week, dates),
+                   (part5.average_calories_per_week, dates), (part5.average_active_minutes_per_week, dates)],
+        "Sleep insights": [(correlations.correlation_matrix, dates, "pearson")],
+        "Weather insights": [(part5.hourly_weather_activity, dates)],
+        "Statistics": [(part5.daily_activity_summary, dates)],
+        "Correlations": [(part5.heart_rate_and_intensitivity, dates), (correlations.correlation_matrix, dates, "pearson"), (part5.daily_activity, dates)],
+        "Other": [(part5.activity_sum_data, dates), (part5.categorized_weight_data,), (part5.workout_frequency_per_period, dates)],
+    }
+
+@st.cache_resource
+def prefetch_executor():
+    # One small pool per server process that warms the caches in the background
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch")
+
+def prefetch_other_sections(section, dates):
+    # Load the data of the sections that are not shown yet, so switching to them only builds the figures.
+    # Only part5 functions are prefetched, they do not use Streamlit or pyplot and are safe to run in a thread.
+    prefetched = st.session_state.setdefault("prefetched", set())
+    executor = prefetch_executor()
+
+    for name, calls in section_data(dates).items():
+        if name == section or (name, tuple(dates)) in prefetched:
+            continue
+
+        for func, *args in calls:
+            executor.submit(func, *args)
+
+        prefetched.add((name, tuple(dates)))
+
 st.sidebar.image("images/logo_title.png")
 st.sidebar.markdown("<div style='margin: 25px 0px;'></div>", unsafe_allow_html=True)
 
@@ -20,11 +276,14 @@ st.sidebar.page_link("General_insights.py", label="General Analysis", icon=":mat
 st.sidebar.page_link("pages/1_User-specific_data.py", label="User-specific Analysis", icon=":material/person:")
 st.sidebar.markdown("---")
 
+# Optional timing of the queries, parsing, transformations and figures of this run
+show_performance = st.sidebar.toggle("Performance panel", key="performance")
+instrumentation.start(show_performance)
 
 with st.sidebar:
     user = st.selectbox(
         "Select a user",
-        sorted(part1.data["Id"].unique()),
+        sorted(part1.get_data()["Id"].unique()),
         index=None,
         placeholder="Select a user",
     )
@@ -64,186 +323,11 @@ if start_date <= end_date:
     plots.create_metric_block(col6, "Avr. Sedentary Min", sedentary_minutes, "")
 
     st.markdown("</br>", unsafe_allow_html=True)
-    tab0, tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs(["Period", "Daily", "Weekly", "Sleep insights", "Weather insights", "Statistics", "Correlations", "Other"])
-
-    # Period graphs
-    with tab0:
-        st.plotly_chart(plots.plot_steps_calories_combined_general(dates), use_container_width=True)
-
-    # Daily graphs
-    with tab1:
-        col1, col2 = st.columns(2)
-
-        with col1:
-            st.plotly_chart(plots.bar_chart_hourly_average_steps(dates), use_container_width=True)
-        
-        with col2:
-            st.plotly_chart(plots.plot_heart_rate(dates), use_container_width=True)
-
-        col1, col2 = st.columns(2)
-
-        with col1:
-            st.plotly_chart(plots.bar_chart_hourly_average_calories(dates), use_container_width=True)
-
-        with col2:
-            st.plotly_chart(plots.bar_chart_daily_intensity(dates), use_container_width=True)
-
-        st.plotly_chart(plots.bar_chart_daily_sleep(dates), use_container_width=True)
-    
-    # Weekly graphs
-    with tab2:
-        col1, col2 = st.columns(2) 
-
-        with col1:
-            st.plotly_chart(plots.bar_chart_average_distance_per_week(dates), use_container_width=True)
-        with col2:
-            st.plotly_chart(plots.bar_chart_average_steps_per_week(dates), use_container_width=True)
-
-        col1, col2 = st.columns(2)  
-
-        with col1:
-            st.plotly_chart(plots.bar_chart_average_calories_per_day_for_week(dates), use_container_width=True)
-        
-        with col2:
-            st.plotly_chart(plots.bar_chart_weekly_sleep(dates), use_container_width=True)
-            
-        st.plotly_chart(plots.plot_active_minutes_bar_chart_per_day(dates), use_container_width=True)
-
-    # Sleep insights
-    with tab3:
-        with st.popover("Correlation explained"):
-                st.write("Correlation is a measure of how two variables are related to each other, with values ranging from -1 to 1. If the correlation is 1, it means the two variables move together perfectly in the same direction. If the correlation is -1, the variables move in exactly opposite directions. A correlation of 0 means there's no clear connection between them.")
-
-        col1, col2 = st.columns(2)
-
-        with col1:
-            fig, corr = plots.plot_correlation_sleep_sedentary_minutes(dates)
-            st.plotly_chart(fig, use_container_width=True)
-            plots.create_correlation_block("Correlation coefficient:", corr, "")
-
-        with col2:
-            fig, corr = plots.plot_correlation_sleep_active_minutes(dates)
-            st.plotly_chart(fig, use_container_width=True)
-            plots.create_correlation_block("Correlation coefficient:", corr, "")
-        
-        col1, col2 = st.columns(2)
-
-        with col1:
-            fig, corr = plots.plot_correlation_sleep_steps(dates)
-            st.plotly_chart(fig, use_container_width=True)
-            plots.create_correlation_block("Correlation coefficient:", corr, "")
-
-        with col2:
-            fig, corr = plots.plot_correlation_sleep_calories(dates)
-            st.plotly_chart(fig, use_container_width=True)
-            plots.create_correlation_block("Correlation coefficient:", corr, "")
-    
-    # Weather insights
-    with tab4:
-        with st.popover("Correlation explained"):
-            st.write("Correlation is a measure of how two variables are related to each other, with values ranging from -1 to 1. If the correlation is 1, it means the two variables move together perfectly in the same direction. If the correlation is -1, the variables move in exactly opposite directions. A correlation of 0 means there's no clear connection between them.")
-          
-        col1, col2 = st.columns(2)
-        hour_selection = ["0-4", "4-8", "8-12", "12-16", "16-20", "20-24"]
-        days_selection = ["Weekdays", "Weekend"]
-
-        with col1:
-            st.markdown("</br>", unsafe_allow_html=True)
-            hours = st.segmented_control("Hours", hour_selection, key="Hours", default=["4-8", "8-12", "12-16", "16-20"], selection_mode="multi")
-            days = st.pills("Time of the week", days_selection, key="Days", default=["Weekend"], selection_mode="multi")
-
-            fig, corr = plots.plot_correlation_weather_steps(hours, days, dates)
-            st.plotly_chart(fig, use_container_width=True)
-            plots.create_correlation_block("Correlation coefficient:", corr, "")
-
-        with col2:
-            st.markdown("</br>", unsafe_allow_html=True)
-            hours2 = st.segmented_control("Hours", hour_selection, key="Hours2", default=["4-8", "8-12", "12-16", "16-20"], selection_mode="multi")
-            days2 = st.pills("Time of the week", days_selection, key="Days2", default=["Weekend"], selection_mode="multi")
-
-            fig, corr = plots.plot_correlation_weather_intensity(hours2, days2, dates)
-            st.plotly_chart(fig, use_container_width=True)
-            plots.create_correlation_block("Correlation coefficient:", corr, "")
-
-    # Statistics
-    with tab5:
-        col1, col2, col3 = st.columns([4, 5, 12])
-        with col1:
-            with st.popover("Median explained"):
-                st.write("The median is the middle value of a dataset when it is ordered from smallest to largest.")
-        with col2: 
-            with st.popover("Upper quartile explained"):
-                st.write("The upper quartile represents the value below which 75% of the data points fall. It is also known as the third quartile or 75th percentile.")
-        
-        with col3:
-            with st.popover("Lower quartile explained"):
-                st.write("The lower quartile represents the value below which 25% of the data points fall, and it is also called the first quartile or 25th percentile.")
-        
-        col1, col2, col3 = st.columns([2, 0.25, 2])
-
-        with col1:
-            fig, data = plots.plot_boxplot("TotalSteps", "Total Steps", dates)
-            st.plotly_chart(fig, use_container_width=True)
-            plots.get_stats(data, "TotalSteps", 0, "steps")
-
-        with col3:
-            fig, data = plots.plot_boxplot("Calories", "Calories", dates)
-            st.plotly_chart(fig, use_container_width=True)
-            plots.get_stats(data, "Calories", 0, "kcal")
-
-        col1, col2, col3 = st.columns([2, 0.25, 2])
-
-        with col1:
-            fig, data = plots.plot_boxplot("TotalDistance", "Total Distance", dates)
-            st.plotly_chart(fig, use_container_width=True)
-            plots.get_stats(data, "TotalDistance", 2, "km")
-
-        with col3:
-            fig, data = plots.plot_boxplot("TotalActiveMinutes", "Total Active Minutes", dates)
-            st.plotly_chart(fig, use_container_width=True)
-            plots.get_stats(data, "TotalActiveMinutes", 0, "min")
-
-        fig, data = plots.plot_boxplot("SedentaryMinutes", "Sedentary Minutes", dates)
-        st.plotly_chart(fig, use_container_width=True)
-        plots.get_stats(data, "SedentaryMinutes", 0, "min")
-    
-    # Correlations
-    with tab6:
-        with st.popover("Correlation explained"):
-            st.write("Correlation is a measure of how two variables are related to each other, with values ranging from -1 to 1. If the correlation is 1, it means the two variables move together perfectly in the same direction. If the correlation is -1, the variables move in exactly opposite directions. A correlation of 0 means there's no clear connection between them.")
-          
-        col1, col2 = st.columns(2)
-        with col1:
-            fig, corr = plots.scatterplot_heart_rate_intensityvity(dates)
-            st.plotly_chart(fig, use_container_width=True)
-            plots.create_correlation_block("Correlation coefficient:", corr, "")
-        
-        with col2:
-            fig, corr = plots.scatterplot_calories_and_active_minutes(dates)
-            st.plotly_chart(fig, use_container_width=True)
-            plots.create_correlation_block("Correlation coefficient:", corr, "")
-
-        st.plotly_chart(plots.plot_active_minutes_active_distance(dates), use_container_width=True)
-
-    # Other insights
-    with tab7:
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            st.plotly_chart(plots.plot_activity_pie_chart(dates), use_container_width=True)
-
-        with col2:
-            st.plotly_chart(plots.plot_weight_pie_chart(), use_container_width=True)
-            plots.create_correlation_block("Note:<br>This graph is not affected by the specified date range.", "", "")
-
-        col1, col2, = st.columns(2)
-
-        with col1:
-            st.plotly_chart(plots.plot_user_pie_chart(), use_container_width=True)
-            plots.create_correlation_block("Note:<br>This graph is not affected by the specified date range.", "", "")
-
-        with col2: 
-            st.plotly_chart(plots.bar_chart_total_workout_frequency_for_period(dates), use_container_width=True)
-            plots.create_correlation_block("Note:<br>This graph is not affected by the specified date range.", "", "")
+    section = st.segmented_control("Section", list(SECTIONS), default="Period", key="section", label_visibility="collapsed")
 
+    # Only the selected section queries its data and builds its figures
+    SECTIONS[section or "Period"](dates)
+    prefetch_other_sections(section or "Period", dates)
 
+if show_performance:
+    plots.performance_panel()
@@ -0,0 +1,154 @@
+# IMPORTS
+import os
+import sqlite3
+import threading
+import pandas as pd
+import pyarrow as pa
+import database
+import instrumentation
+import schema
+import time_ranges
+
+# Directory of the Arrow files exported next to the cleaned database
+ARROW_DIR = "data/arrow"
+
+# Cleaned tables that are exported as Arrow files
+EXPORT_TABLES = ["daily_activity", "heart_rate", "hourly_calories", "hourly_intensity",
+                 "hourly_steps", "minute_sleep", "weight_log"]
+
+# Rows per record batch in the exported files
+BATCH_SIZE = 65536
+
+# Memory-mapped tables by file path, together with the modification time they were opened at
+_tables = {}
+_tables_lock = threading.Lock()
+
+def table_path(table, arrow_dir=ARROW_DIR):
+    return os.path.join(arrow_dir, f"{table}.arrow")
+
+def column_types(table, db_path=database.CLEANED_DB):
+    # Arrow type of every column, the type pandas gives the whole column when it is read from SQLite:
+    # integers (int64), integers with NULLs or reals (float64), text (string) or only NULLs (null)
+    with database.connection(db_path) as con:
+        columns = [row[1] for row in con.execute(f"PRAGMA table_info({table})")]
+        typeofs = ", ".join(f'typeof("{column}")' for column in columns)
+        combinations = con.execute(f"SELECT DISTINCT {typeofs} FROM {table}").fetchall()
+
+    types = {}
+
+    for i, column in enumerate(columns):
+        storage = {combination[i] for combination in combinations} - {"null"}
+        has_null = any(combination[i] == "null" for combination in combinations)
+
+        if not storage:
+            types[column] = pa.null()
+        elif storage == {"text"}:
+            types[column] = pa.string()
+        elif storage == {"integer"} and not has_null:
+            types[column] = pa.int64()
+        else:
+            types[column] = pa.float64()
+
+    return types
+
+def version(table, db_path=database.CLEANED_DB):
+    # Version of the rows of a table: its high-water marks in ingest_state, which every cleaning run that reads new rows
+    # of the table moves forward. None for a database without ingest_state, whose files are never used.
+    try:
+        with database.connection(db_path) as con:
+            marks, total = con.execute("SELECT COUNT(*), SUM(ts) FROM ingest_state WHERE TableName = ?", (table,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+
+    return f"{marks}:{total}"
+
+def export_tables(db_path=database.CLEANED_DB, arrow_dir=ARROW_DIR, tables=EXPORT_TABLES, chunk_size=BATCH_SIZE):
+    # Write every cleaned table as an uncompressed Arrow IPC file, sorted by (Id, ts), with its time column already parsed.
+    # Tables are streamed in record batches of chunk_size rows, so the export does not hold a whole table in memory.
+    os.makedirs(arrow_dir, exist_ok=True)
+
+    for table in tables:
+        column, _ = database.TIME_COLUMNS[table]
+        types = column_types(table, db_path)
+        types[column] = pa.timestamp("ns")
+        # the version is read before the rows, a file can only hold rows that are newer than its version, never older ones
+        arrow_schema = pa.schema(list(types.items()), metadata={"version": version(table, db_path) or ""})
+
+        path = table_path(table, arrow_dir)
+
+        # write to a temporary file first so a running dashboard never maps a half written file
+        with pa.OSFile(path + ".tmp", "wb") as sink, pa.ipc.new_file(sink, arrow_schema) as writer:
+            with database.connection(db_path) as con:
+                for df in pd.read_sql_query(f"SELECT * FROM {table} ORDER BY Id, ts", con, chunksize=chunk_size):
+                    df[column] = pd.to_datetime(df["ts"], unit="s")
+                    batch = pa.Table.from_pandas(df, schema=arrow_schema, preserve_index=False).replace_schema_metadata(None)
+                    writer.write_table(batch, max_chunksize=chunk_size)
+
+        os.replace(path + ".tmp", path)
+
+def is_fresh(table, db_path=database.CLEANED_DB, arrow_dir=ARROW_DIR):
+    # An exported file is only used when it was written from the current version of the table
+    path = table_path(table, arrow_dir)
+    current = version(table, db_path)
+
+    if current is None or not os.path.exists(path):
+        return False
+
+    arrow_table, _ = open_table(path)
+
+    return (arrow_table.schema.metadata or {}).get(b"version") == current.encode()
+
+def open_table(path):
+    # Memory-map the file once; the returned table references the mapped pages without copying them.
+    # The rows of every user are located once per version of the file, the file is sorted by (Id, ts).
+    mtime = os.path.getmtime(path)
+
+    with _tables_lock:
+        if path not in _tables or _tables[path][0] != mtime:
+            arrow_table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+            _tables[path] = (mtime, arrow_table, time_ranges.user_blocks(arrow_table["Id"].to_numpy()))
+
+        return _tables[path][1:]
+
+@instrumentation.timed("sql")
+def load(table, columns=None, dates=None, user=None, db_path=database.CLEANED_DB, arrow_dir=ARROW_DIR):
+    # Load the requested columns of a cleaned table for the given dates and user, with its time column parsed.
+    # The rows are found by binary search on (Id, ts) and sliced from the mapped file without copying it.
+    if not is_fresh(table, db_path, arrow_dir):
+        return load_from_sqlite(table, columns, dates, user, db_path)
+
+    arrow_table, blocks = open_table(table_path(table, arrow_dir))
+
+    if user is not None or dates is not None:
+        blocks = list(blocks.values()) if user is None else [blocks.get(int(user), (0, 0))]
+        windows = None
+
+        if dates is not None:
+            windows = [(start.value // 10**9, end.value // 10**9) for start, end in time_ranges.day_windows(dates)]
+
+        ts = arrow_table["ts"]
+        slices = time_ranges.positions(blocks, lambda first, last: ts.slice(first, last - first).to_numpy(), windows)
+        arrow_table = pa.concat_tables([arrow_table.slice(0, 0)] + [arrow_table.slice(first, last - first) for first, last in slices])
+
+    if columns is not None:
+        arrow_table = arrow_table.select(columns)
+
+    return schema.cast(arrow_table.to_pandas(), table)
+
+def load_from_sqlite(table, columns=None, dates=None, user=None, db_path=database.CLEANED_DB):
+    # Same result as load(), read from the database when the table has not been exported (yet)
+    column, _ = database.TIME_COLUMNS[table]
+    clause, params = database.where("ts", dates, user)
+
+    if columns is None:
+        df = database.query(f"SELECT * FROM {table}{clause} ORDER BY Id, ts", params, db_path=db_path)
+        df[column] = pd.to_datetime(df["ts"], unit="s")
+        return schema.cast(df, table)
+
+    selected = ", ".join(f"ts AS {name}" if name == column else name for name in columns)
+    df = database.query(f"SELECT {selected} FROM {table}{clause} ORDER BY Id, ts", params, db_path=db_path)
+
+    if column in columns:
+        df[column] = pd.to_datetime(df[column], unit="s")
+
+    return schema.cast(df, table)
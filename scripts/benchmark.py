@@ -0,0 +1,404 @@
+# IMPORTS
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import logging
+import warnings
+import platform
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import matplotlib
+import database
+import cleaning_fitbit_database
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Synthetic datasets are generated (once) in one directory per number of users, laid out like the repository root
+BENCHMARK_DIR = "benchmark"
+RESULTS_FILE = os.path.join(BENCHMARK_DIR, "benchmark_results.json")
+
+# Number of users and widths of the selected date range (in days) that are benchmarked by default
+DEFAULT_USERS = [33, 330, 3300]
+DEFAULT_WIDTHS = [1, 7, 31]
+
+# Period of the generated data, the same month as the Fitbit sample
+START_DATE = "2016-03-12"
+DAYS = 31
+
+# Share of the users with heart rate, sleep and weight records and the density of those records,
+# modeled on the Fitbit sample (14, 24 and 8 of its 33 users)
+HEART_RATE_SHARE = 14 / 33
+HEART_RATE_INTERVAL = 60        # seconds between two heart rate readings
+HEART_RATE_HOURS = (8, 12)      # readings are generated between these hours of every day
+SLEEP_SHARE = 24 / 33
+SLEEP_NIGHT_SHARE = 0.6         # share of the nights a sleeping user records
+WEIGHT_SHARE = 8 / 33
+
+# Users generated and written per chunk, which bounds the memory of the generator
+USERS_PER_CHUNK = 50
+
+# Text times of the Fitbit tables, without leading zeros, e.g. "4/12/2016 1:00:00 AM" and "4/12/2016"
+def fitbit_dates(times):
+    times = pd.DatetimeIndex(times)
+
+    return times.month.astype(str) + "/" + times.day.astype(str) + "/" + times.year.astype(str)
+
+def fitbit_timestamps(times):
+    times = pd.DatetimeIndex(times)
+    hours = (times.hour % 12).where(times.hour % 12 != 0, 12)
+
+    return (fitbit_dates(times) + " " + hours.astype(str) + ":" + times.strftime("%M:%S")
+            + np.where(times.hour < 12, " AM", " PM"))
+
+def generate_daily_activity(rng, ids, days):
+    n = len(ids) * len(days)
+    very = rng.integers(0, 60, n)
+    fairly = rng.integers(0, 40, n)
+    lightly = rng.integers(100, 300, n)
+    sedentary = 1440 - very - fairly - lightly - rng.integers(0, 200, n)
+    steps = rng.integers(2000, 15000, n)
+    distance = steps * 0.00065
+
+    return pd.DataFrame({
+        "Id": np.repeat(ids, len(days)),
+        "ActivityDate": np.tile(fitbit_dates(days), len(ids)),
+        "TotalSteps": steps,
+        "TotalDistance": distance,
+        "TrackerDistance": distance,
+        "LoggedActivitiesDistance": 0.0,
+        "VeryActiveDistance": distance * very / 480,
+        "ModeratelyActiveDistance": distance * fairly / 480,
+        "LightActiveDistance": distance * lightly / 480,
+        "SedentaryActiveDistance": 0.0,
+        "VeryActiveMinutes": very,
+        "FairlyActiveMinutes": fairly,
+        "LightlyActiveMinutes": lightly,
+        "SedentaryMinutes": sedentary,
+        "Calories": rng.integers(1500, 3500, n),
+    })
+
+def generate_hourly(rng, ids, hours):
+    # Activity follows the hour of the day, with hardly any steps at night
+    awake = np.tile((hours.hour >= 7) & (hours.hour < 23), len(ids))
+    n = len(ids) * len(hours)
+    base = {"Id": np.repeat(ids, len(hours)), "ActivityHour": np.tile(fitbit_timestamps(hours), len(ids))}
+    intensity = np.where(awake, rng.integers(0, 60, n), 0)
+
+    return {
+        "hourly_steps": pd.DataFrame({**base, "StepTotal": np.where(awake, rng.integers(0, 1000, n), 0)}),
+        "hourly_calories": pd.DataFrame({**base, "Calories": rng.integers(50, 150, n)}),
+        "hourly_intensity": pd.DataFrame({**base, "TotalIntensity": intensity, "AverageIntensity": intensity / 60}),
+    }
+
+def generate_heart_rate(rng, ids, days):
+    times = pd.DatetimeIndex([time for day in days for time in
+                              pd.date_range(day + pd.Timedelta(hours=HEART_RATE_HOURS[0]), day + pd.Timedelta(hours=HEART_RATE_HOURS[1]),
+                                            freq=f"{HEART_RATE_INTERVAL}s", inclusive="left")])
+    n = len(ids) * len(times)
+    wave = np.tile(30 * np.sin(np.arange(len(times)) / 40), len(ids))
+
+    return pd.DataFrame({
+        "Id": np.repeat(ids, len(times)),
+        "Time": np.tile(fitbit_timestamps(times), len(ids)),
+        "Value": (80 + wave + rng.integers(-5, 6, n)).astype(int),
+    })
+
+def generate_minute_sleep(rng, ids, days, first_log_id):
+    # One episode per recorded night, starting between 22:00 and midnight, one row per minute
+    users, nights = np.nonzero(rng.random((len(ids), len(days))) < SLEEP_NIGHT_SHARE)
+    starts = days[nights] + pd.Timedelta(hours=22, seconds=30) + pd.to_timedelta(rng.integers(0, 120, len(nights)), unit="min")
+    lengths = rng.integers(300, 500, len(nights))
+
+    episodes = np.repeat(np.arange(len(nights)), lengths)
+    minutes = np.arange(len(episodes)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    df = pd.DataFrame({
+        "Id": ids[users][episodes],
+        "date": fitbit_timestamps(starts[episodes] + pd.to_timedelta(minutes, unit="min")),
+        "value": rng.choice([1, 2, 3], len(episodes), p=[0.9, 0.08, 0.02]),
+        "logId": first_log_id + episodes,
+    })
+
+    return df, first_log_id + len(nights)
+
+def generate_weight_log(rng, ids, days, first_log_id):
+    counts = rng.integers(1, 6, len(ids))
+    users = np.repeat(ids, counts)
+    logged = pd.DatetimeIndex(rng.choice(days, len(users))) + pd.Timedelta(hours=23, minutes=59, seconds=59)
+    kilograms = rng.uniform(55, 110, len(users)).round(1)
+
+    return pd.DataFrame({
+        "Id": users,
+        "Date": fitbit_timestamps(logged),
+        "WeightKg": np.where(rng.random(len(users)) < 0.1, np.nan, kilograms),
+        "WeightPounds": kilograms * 2.20462262,
+        "Fat": None,
+        "BMI": rng.uniform(20, 35, len(users)).round(2),
+        # stored as text in the Fitbit sample
+        "IsManualReport": np.where(rng.integers(0, 2, len(users)) == 1, "True", "False"),
+        "LogId": first_log_id + np.arange(len(users)),
+    })
+
+def generate(directory, users, days=DAYS, seed=0):
+    # Write a synthetic fitbit_database.db and daily_activity.csv with the schemas of the Fitbit sample for the given number of users,
+    # next to the weather files, in directory/data
+    data_dir = os.path.join(directory, "data")
+    os.makedirs(data_dir, exist_ok=True)
+
+    for file in ["weather_Chicago.csv", "weather_Chicago_hourly.csv"]:
+        shutil.copy(os.path.join("data", file), os.path.join(data_dir, file))
+
+    rng = np.random.default_rng(seed)
+    ids = np.sort(1_000_000_000 + rng.choice(9_000_000_000, users, replace=False))
+    day_range = pd.date_range(START_DATE, periods=days, freq="D")
+    hours = pd.date_range(START_DATE, periods=days * 24, freq="h")
+
+    db_path = os.path.join(data_dir, "fitbit_database.db")
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    con = sqlite3.connect(db_path)
+    sleep_log_id = 1000
+    weight_log_id = 1000
+
+    for first in range(0, users, USERS_PER_CHUNK):
+        chunk = ids[first:first + USERS_PER_CHUNK]
+        positions = np.arange(first, first + len(chunk))
+
+        tables = {"daily_activity": generate_daily_activity(rng, chunk, day_range), **generate_hourly(rng, chunk, hours)}
+
+        # the first users of the dataset are the ones with heart rate, sleep and weight records
+        tables["heart_rate"] = generate_heart_rate(rng, chunk[positions < users * HEART_RATE_SHARE], day_range)
+        tables["minute_sleep"], sleep_log_id = generate_minute_sleep(rng, chunk[positions < users * SLEEP_SHARE], day_range, sleep_log_id)
+        tables["weight_log"] = generate_weight_log(rng, chunk[positions < users * WEIGHT_SHARE], day_range, weight_log_id)
+        weight_log_id += len(tables["weight_log"])
+
+        for table, df in tables.items():
+            df.to_sql(table, con, if_exists="append", index=False)
+
+        # the daily activity is also read from daily_activity.csv, like in the repository
+        tables["daily_activity"].to_csv(os.path.join(data_dir, "daily_activity.csv"), mode="w" if first == 0 else "a", header=first == 0, index=False)
+
+        con.commit()
+
+    con.close()
+
+    return ids
+
+def dataset_dir(users, benchmark_dir=BENCHMARK_DIR):
+    return os.path.join(benchmark_dir, f"users_{users}")
+
+def prepare(users, benchmark_dir=BENCHMARK_DIR):
+    # Generate the dataset of the given size and build its cleaned database, unless this was done before.
+    # Returns the directory and the timings of the cleaning stages (empty when the dataset already existed).
+    directory = os.path.abspath(dataset_dir(users, benchmark_dir))
+
+    if os.path.exists(os.path.join(directory, "data", "cleaned_fitbit.db")):
+        return directory, {}
+
+    generate(directory, users)
+
+    cwd = os.getcwd()
+    os.chdir(directory)
+
+    try:
+        timings = cleaning_fitbit_database.data_cleaning()
+    finally:
+        os.chdir(cwd)
+
+    return directory, timings
+
+# Arguments of the benchmarked functions, built from the selected dates (as the dashboard passes them), user and days
+ARGUMENTS = {
+    "dates": lambda dates, user, start, end, day: (dates,),
+    "none": lambda dates, user, start, end, day: (),
+    "all users": lambda dates, user, start, end, day: (None,),
+    "user range": lambda dates, user, start, end, day: (user, start, end),
+    "user day": lambda dates, user, start, end, day: (user, day),
+    "weather": lambda dates, user, start, end, day: (["8-12", "12-16"], ["Weekdays", "Weekend"], dates),
+    "boxplot": lambda dates, user, start, end, day: ("TotalSteps", "Total Steps", dates),
+    "average": lambda dates, user, start, end, day: ("TotalSteps", dates),
+    "sleep steps": lambda dates, user, start, end, day: ("Steps", dates),
+}
+
+# Benchmarked functions as "module.function": kind of arguments. Functions without dates are only run once per size.
+FUNCTIONS = {
+    "part5.daily_activity_summary": "dates",
+    "part5.retrieve_average": "average",
+    "part5.activity_sum_data": "dates",
+    "part5.average_steps_per_hour": "dates",
+    "part5.hourly_average_heart_rate_dates": "dates",
+    "part5.hourly_average_calories": "dates",
+    "part5.heart_rate_and_intensitivity": "dates",
+    "part5.calories_and_active_minutes": "dates",
+    "part5.heart_rate_and_sleep_value": "dates",
+    "part5.average_distance_per_week": "dates",
+    "part5.average_steps_per_week": "dates",
+    "part5.average_calories_per_week": "dates",
+    "part5.average_active_minutes_per_week": "dates",
+    "part5.hourly_weather_activity": "dates",
+    "part5.daily_activity": "dates",
+    "part5.categorized_weight_data": "none",
+    "part5.sleep_data": "dates",
+    "part5.create_dataframe_scatterplot_sleep": "sleep steps",
+    "part5.workout_frequency_per_period": "dates",
+    "part5.average_steps_calories_per_period": "dates",
+    "part3.compute_sleep_on_day": "all users",
+    "correlations.correlation_matrix": "dates",
+    "plots_general_insights.plot_activity_pie_chart": "dates",
+    "plots_general_insights.bar_chart_hourly_average_steps": "dates",
+    "plots_general_insights.plot_heart_rate": "dates",
+    "plots_general_insights.bar_chart_hourly_average_calories": "dates",
+    "plots_general_insights.scatterplot_heart_rate_intensityvity": "dates",
+    "plots_general_insights.scatterplot_calories_and_active_minutes": "dates",
+    "plots_general_insights.plot_correlation_sleep_sedentary_minutes": "dates",
+    "plots_general_insights.plot_correlation_sleep_active_minutes": "dates",
+    "plots_general_insights.plot_correlation_weather_steps": "weather",
+    "plots_general_insights.plot_correlation_weather_intensity": "weather",
+    "plots_general_insights.bar_chart_daily_intensity": "dates",
+    "plots_general_insights.plot_active_minutes_active_distance": "dates",
+    "plots_general_insights.plot_weight_pie_chart": "none",
+    "plots_general_insights.bar_chart_daily_sleep": "dates",
+    "plots_general_insights.bar_chart_weekly_sleep": "dates",
+    "plots_general_insights.plot_correlation_sleep_steps": "dates",
+    "plots_general_insights.plot_correlation_sleep_calories": "dates",
+    "plots_general_insights.plot_user_pie_chart": "none",
+    "plots_general_insights.bar_chart_average_distance_per_week": "dates",
+    "plots_general_insights.bar_chart_average_steps_per_week": "dates",
+    "plots_general_insights.bar_chart_average_calories_per_day_for_week": "dates",
+    "plots_general_insights.plot_active_minutes_bar_chart_per_day": "dates",
+    "plots_general_insights.bar_chart_total_workout_frequency_for_period": "dates",
+    "plots_general_insights.plot_steps_calories_combined_general": "dates",
+    "plots_general_insights.plot_boxplot": "boxplot",
+    "user_graphing_function.get_user_data": "user range",
+    "user_graphing_function.plot_steps_calories_combined": "user range",
+    "user_graphing_function.get_user_data_with_sleep": "user range",
+    "user_graphing_function.plot_daily_steps": "user range",
+    "user_graphing_function.plot_daily_calories": "user range",
+    "user_graphing_function.plot_activity_breakdown": "user range",
+    "user_graphing_function.plot_sleep_duration": "user range",
+    "user_graphing_function.get_heart_rate_data": "user range",
+    "user_graphing_function.plot_heart_rate_trends": "user range",
+    "user_graphing_function.plot_heart_rate_zones": "user range",
+    "user_graphing_function.get_heart_rate_for_day": "user day",
+    "user_graphing_function.plot_daily_heart_rate": "user day",
+    "user_graphing_function.get_hourly_calories_data": "user range",
+    "user_graphing_function.plot_hourly_calories": "user range",
+    "user_graphing_function.plot_daily_calories_pie": "user range",
+    "user_graphing_function.plot_daily_calories_chart": "user day",
+    "user_graphing_function.get_hourly_steps_data": "user range",
+    "user_graphing_function.plot_hourly_steps": "user range",
+    "user_graphing_function.plot_daily_steps_pie": "user range",
+    "user_graphing_function.plot_daily_steps_chart": "user day",
+    "user_graphing_function.get_hourly_intensity_data": "user range",
+    "user_graphing_function.plot_hourly_intensity": "user range",
+    "user_graphing_function.plot_daily_intensity_pie": "user range",
+    "user_graphing_function.plot_daily_intensity_chart": "user day",
+    "user_graphing_function.get_sleep_stage_data": "user range",
+    "user_graphing_function.plot_active_hours_heatmap": "user range",
+}
+
+def peak_rss_mb():
+    # Peak resident set size of this process so far, ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return round(peak / (1024 ** 2 if sys.platform == "darwin" else 1024), 1)
+
+def run_case(directory, name, width):
+    # Process pool worker, every case runs in a fresh process so its peak RSS is its own.
+    # The first call is timed cold, the second one shows what the cache of the dashboard saves.
+    matplotlib.use("Agg")
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.CRITICAL)
+    os.chdir(directory)
+
+    module_name, function_name = name.split(".")
+    function = getattr(importlib.import_module(module_name), function_name)
+
+    user = int(database.query("SELECT MIN(Id) AS Id FROM heart_rate")["Id"].iloc[0])
+    days = pd.date_range(START_DATE, periods=width or 1, freq="D")
+    args = ARGUMENTS[FUNCTIONS[name]](days.strftime("%m/%d/%Y"), user, days[0].date(), days[-1].date(), days[0].date())
+
+    result = {"function": name, "width": width, "baseline_rss_mb": peak_rss_mb()}
+
+    try:
+        start = time.perf_counter()
+        function(*args)
+        result["cold_seconds"] = round(time.perf_counter() - start, 4)
+        result["peak_rss_mb"] = peak_rss_mb()
+
+        start = time.perf_counter()
+        function(*args)
+        result["warm_seconds"] = round(time.perf_counter() - start, 4)
+    except Exception as error:
+        result["error"] = f"{type(error).__name__}: {error}"
+
+    return result
+
+def cases(widths, only=None):
+    # (function, width) pairs, functions that do not take a date range are run once with width None
+    for name, kind in FUNCTIONS.items():
+        if only and not any(pattern in name for pattern in only):
+            continue
+
+        if kind in ("dates", "user range", "weather", "boxplot", "average", "sleep steps"):
+            yield from ((name, width) for width in widths)
+        else:
+            yield name, None
+
+def run_benchmark(users=DEFAULT_USERS, widths=DEFAULT_WIDTHS, only=None, output=RESULTS_FILE, benchmark_dir=BENCHMARK_DIR):
+    report = {
+        "created": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "cleaning": [],
+        "results": [],
+    }
+
+    context = multiprocessing.get_context("spawn")
+
+    for size in users:
+        print(f"Preparing {size} users")
+        directory, timings = prepare(size, benchmark_dir)
+        report["cleaning"].extend({"users": size, "stage": stage, "seconds": round(seconds, 4)} for stage, seconds in timings.items())
+
+        for name, width in cases(widths, only):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = {"users": size, **pool.submit(run_case, directory, name, width).result()}
+
+            report["results"].append(result)
+            print(f"{size:>6} users {str(width or '-'):>3} days  {name:<65}"
+                  f"{result.get('cold_seconds', float('nan')):8.3f} s {result.get('peak_rss_mb') or 0:8.1f} MB  {result.get('error', '')}")
+
+        # results are written after every size, so a long run that is interrupted still leaves a report
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+
+        with open(output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the dashboard data functions and figure builders on synthetic datasets.")
+    parser.add_argument("--users", type=int, nargs="+", default=DEFAULT_USERS, help="numbers of users of the generated datasets, up to 10000")
+    parser.add_argument("--widths", type=int, nargs="+", default=DEFAULT_WIDTHS, help="widths of the selected date range in days")
+    parser.add_argument("--only", nargs="+", help="only benchmark functions whose name contains one of these strings")
+    parser.add_argument("--output", default=RESULTS_FILE, help="JSON file the results are written to")
+    arguments = parser.parse_args()
+
+    run_benchmark(arguments.users, arguments.widths, arguments.only, arguments.output)
@@ -0,0 +1,123 @@
+# IMPORTS
+import copy
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import database
+
+# Default bounds of every cache: number of results kept per function and their lifetime in seconds
+MAX_ENTRIES = 128
+TTL = 3600
+
+# Databases the cached functions read, a rewrite of any of them invalidates every cached result
+DB_FILES = [database.CLEANED_DB, database.ORIGINAL_DB]
+
+_caches = []
+
+class TTLCache:
+    """Bounded least-recently-used cache whose entries expire after a time to live."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return False, None
+
+            stored_at, value = self._entries[key]
+
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return False, None
+
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def database_version():
+    # Modification time and size of the databases and their write-ahead logs
+    version = []
+
+    for db_path in DB_FILES:
+        for path in [db_path, db_path + "-wal"]:
+            try:
+                stat = os.stat(path)
+                version.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                version.append(None)
+
+    return tuple(version)
+
+def freeze(value):
+    # Dates arrive as lists, numpy arrays or pandas indexes; turn them into hashable tuples
+    if isinstance(value, (list, tuple, np.ndarray, pd.Index, pd.Series)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, set):
+        return tuple(sorted(freeze(item) for item in value))
+
+    return value
+
+def copy_result(value):
+    # Callers add columns to the frames they get back, so they always receive their own copy
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(copy_result(item) for item in value)
+    if hasattr(value, "to_plotly_json"):
+        # a deep copy turns the numpy arrays of the traces into {"dtype", "bdata"} dicts, the constructor copies them as arrays
+        return type(value)(value)
+    if isinstance(value, (list, dict)):
+        return copy.deepcopy(value)
+
+    return value
+
+def cached(func=None, *, max_entries=MAX_ENTRIES, ttl=TTL):
+    # Memoize a data or figure function on its arguments and the current version of the databases
+    def decorator(func):
+        store = TTLCache(max_entries, ttl)
+        _caches.append(store)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (database_version(), freeze(args), freeze(kwargs))
+            hit, value = store.get(key)
+
+            if not hit:
+                value = func(*args, **kwargs)
+                store.set(key, value)
+
+            return copy_result(value)
+
+        wrapper.cache = store
+        return wrapper
+
+    if func is not None:
+        return decorator(func)
+
+    return decorator
+
+def clear_all():
+    # Drop every cached result, e.g. after the databases were rebuilt in place
+    for store in _caches:
+        store.clear()
@@ -1,18 +1,104 @@
 # IMPORTS
+import os
+import sys
+import time
+import shutil
 import sqlite3
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import repeat
 import pandas as pd
+import database
+import arrow_cache
+import sleep_sessions
+import feature_store
+import timestamps
 
-def data_cleaning():
-    # Paths to the databases
-    original_db_path = "data/fitbit_database.db"
-    cleaned_db_path = "data/cleaned_fitbit.db"
+def add_epoch_column(df, table):
+    # Store the text time column also as integer epoch seconds, sortable and indexable
+    column, time_format = database.TIME_COLUMNS[table]
+    times = timestamps.parse(df[column], time_format, errors="coerce")
+    df["ts"] = ((times - pd.Timestamp(0)) // pd.Timedelta(seconds=1)).astype("Int64")
+
+    return df
+
+def create_indexes(con, table):
+    # (Id, ts) serves per-user range lookups, (ts) the date range queries over all users
+    con.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_id_ts ON {table} (Id, ts)")
+    con.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_ts ON {table} (ts)")
+
+# Rollup tables built from the cleaned tables, ts is the epoch of the hour or day the row summarizes
+ROLLUPS = {
+    "heart_rate_hourly": """
+        SELECT Id, ts - ts % 3600 AS ts, (ts % 86400) / 3600 AS Hour,
+               AVG(Value) AS AvgValue, MIN(Value) AS MinValue, MAX(Value) AS MaxValue, COUNT(*) AS ValueCount
+        FROM {heart_rate}
+        WHERE ts IS NOT NULL
+        GROUP BY Id, ts - ts % 3600
+    """,
+    "sleep_hourly": """
+        SELECT Id, ts - ts % 3600 AS ts, (ts % 86400) / 3600 AS Hour, COUNT(*) AS TotalMinutesAsleep
+        FROM {minute_sleep}
+        WHERE ts IS NOT NULL
+        GROUP BY Id, ts - ts % 3600
+    """,
+    "sleep_daily": """
+        SELECT Id, ts - ts % 86400 AS ts, COUNT(*) AS TotalMinutesAsleep
+        FROM {minute_sleep}
+        WHERE ts IS NOT NULL
+        GROUP BY Id, ts - ts % 86400
+    """,
+    "activity_daily": """
+        SELECT Id, day AS ts, SUM(StepTotal) AS StepTotal, SUM(Calories) AS Calories, SUM(TotalIntensity) AS TotalIntensity
+        FROM (
+            SELECT Id, ts - ts % 86400 AS day, StepTotal, NULL AS Calories, NULL AS TotalIntensity FROM {hourly_steps}
+            UNION ALL
+            SELECT Id, ts - ts % 86400, NULL, Calories, NULL FROM {hourly_calories}
+            UNION ALL
+            SELECT Id, ts - ts % 86400, NULL, NULL, TotalIntensity FROM {hourly_intensity}
+        )
+        WHERE day IS NOT NULL
+        GROUP BY Id, day
+    """,
+}
+
+# Source tables of the rollups, read whole or only in the (Id, day) partitions that received new rows
+ROLLUP_SOURCES = ["heart_rate", "minute_sleep", "hourly_steps", "hourly_calories", "hourly_intensity"]
+
+# Tables of the original database that are cleaned into the new one
+TABLES = ["daily_activity", "heart_rate", "hourly_calories", "hourly_intensity", "hourly_steps", "minute_sleep", "weight_log"]
+
+def create_rollups(con):
+    # Pre-aggregate the per Id/day/hour group-bys the dashboard would otherwise compute from raw rows
+    sources = {table: table for table in ROLLUP_SOURCES}
+
+    for table, select in ROLLUPS.items():
+        con.execute(f"DROP TABLE IF EXISTS {table}")
+        con.execute(f"CREATE TABLE {table} AS {select.format(**sources)}")
+        create_indexes(con, table)
+
+def partition_source(table):
+    # Rows of a cleaned table in the affected_partitions (Id, Day), looked up through the (Id, ts) index
+    return (f"(SELECT {table}.* FROM affected_partitions CROSS JOIN {table} "
+            f"ON {table}.Id = affected_partitions.Id AND {table}.ts >= affected_partitions.Day AND {table}.ts < affected_partitions.Day + 86400)")
 
-    # Connect to the original database
-    con = sqlite3.connect(original_db_path)
+def update_rollups(con, partitions):
+    # Recompute the rollup rows of the given (Id, day epoch) partitions only, all other rows are left as they are
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS affected_partitions (Id INTEGER, Day INTEGER, PRIMARY KEY (Id, Day))")
+    con.execute("DELETE FROM affected_partitions")
+    con.executemany("INSERT OR IGNORE INTO affected_partitions VALUES (?, ?)", partitions)
 
-    # Load and clean dailyActivity table
-    df_daily = pd.read_sql_query("SELECT * FROM daily_activity", con)
+    sources = {table: partition_source(table) for table in ROLLUP_SOURCES}
 
+    for table, select in ROLLUPS.items():
+        con.execute(f"""DELETE FROM {table} WHERE EXISTS (
+                            SELECT 1 FROM affected_partitions
+                            WHERE affected_partitions.Id = {table}.Id AND {table}.ts >= Day AND {table}.ts < Day + 86400)""")
+        con.execute(f"INSERT INTO {table} {select.format(**sources)}")
+
+def clean_daily_activity(df_daily):
     # Remove duplicates
     df_daily_cleaned = df_daily.drop_duplicates()
 
@@ -32,29 +118,253 @@ def data_cleaning():
                                         df_daily_cleaned["FairlyActiveMinutes"] + 
                                         df_daily_cleaned["VeryActiveMinutes"]) >= 1000)]
 
-    # List of additional tables to copy
-    tables_to_copy = ["heart_rate", "hourly_calories", "hourly_intensity", 
-                    "hourly_steps", "minute_sleep", "weight_log"]
+    return df_daily_cleaned
+
+def clean_weight_log(df_weight):
+    # The Fat column has only two values and no good way to fill in the others, it was dropped once with
+    # ALTER TABLE weight_log DROP COLUMN Fat. Missing kilograms are converted from the pounds, 1 kg = 2.20462262 pounds.
+    df_weight = df_weight.copy()
+    missing = df_weight["WeightKg"].isnull() & df_weight["WeightPounds"].notnull()
+    df_weight.loc[missing, "WeightKg"] = df_weight.loc[missing, "WeightPounds"] / 2.20462262
+
+    return df_weight
+
+# Cleaning step of every table, the other tables are copied without modification
+CLEANERS = {"daily_activity": clean_daily_activity, "weight_log": clean_weight_log}
+
+# Rows per chunk read from the original database in a full cleaning
+CHUNK_SIZE = 100000
+
+# Tables whose duplicate rows are removed, also when the copies are in different chunks
+DEDUPLICATED = ["daily_activity"]
+
+def read_chunks(table, db_path=database.ORIGINAL_DB, chunk_size=CHUNK_SIZE):
+    # Stream a table of the original database in chunks of chunk_size rows, next to their epoch column
+    with database.connection(db_path) as con:
+        for chunk in pd.read_sql_query(f"SELECT * FROM {table}", con, chunksize=chunk_size):
+            yield add_epoch_column(chunk, table)
+
+def deduplicate(chunks):
+    # Drop the rows already seen in this or an earlier chunk, only a 64-bit hash of every distinct row is kept
+    seen = set()
 
-    # Read all tables into pandas DataFrames
-    table_data = {table: pd.read_sql_query(f"SELECT * FROM {table}", con) for table in tables_to_copy}
+    for chunk in chunks:
+        hashes = pd.util.hash_pandas_object(chunk, index=False)
+        first = ~hashes.duplicated() & ~hashes.isin(seen)
+        seen.update(hashes[first])
 
-    # Close the original database connection
+        yield chunk[first.to_numpy()]
+
+def clean_chunks(con, table, chunks):
+    # Raise the high-water marks with every chunk read and pass on the cleaned chunk
+    if table in DEDUPLICATED:
+        chunks = deduplicate(chunks)
+
+    for chunk in chunks:
+        update_marks(con, table, chunk)
+
+        yield CLEANERS.get(table, lambda df: df)(chunk)
+
+def copy_table(con, table, chunks):
+    # Write the chunks to a new table, every chunk in one bulk transaction
+    if_exists = "replace"
+
+    for chunk in chunks:
+        chunk.to_sql(table, con, if_exists=if_exists, index=False)
+        con.commit()
+        if_exists = "append"
+
+@contextmanager
+def stage(timings, name):
+    # Record the wall clock time of a stage of the pipeline
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
+
+def clean_table(table, original_db_path, staging_path):
+    # Process pool worker: clean one table into its own staging database, with its high-water marks
+    start = time.perf_counter()
+
+    con = sqlite3.connect(staging_path)
+    create_state_table(con)
+    copy_table(con, table, clean_chunks(con, table, read_chunks(table, original_db_path)))
+    con.commit()
     con.close()
 
-    # Connect to the new cleaned database
+    return table, time.perf_counter() - start
+
+def merge_staging(con, staging_paths):
+    # Move the staged tables into the cleaned database, with the same column types, and collect their marks
+    for table, path in staging_paths.items():
+        con.execute("ATTACH DATABASE ? AS staging", (path,))
+        create_table = con.execute("SELECT sql FROM staging.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+
+        con.execute(f"DROP TABLE IF EXISTS main.{table}")
+        con.execute(create_table)
+        con.execute(f"INSERT INTO main.{table} SELECT * FROM staging.{table}")
+        con.execute("INSERT INTO main.ingest_state SELECT * FROM staging.ingest_state")
+        con.commit()
+
+        con.execute("DETACH DATABASE staging")
+
+def create_state_table(con):
+    # High-water mark of every table and user: the latest ts read from the original database
+    con.execute("CREATE TABLE IF NOT EXISTS ingest_state (TableName TEXT, Id INTEGER, ts INTEGER, PRIMARY KEY (TableName, Id))")
+
+def update_marks(con, table, df):
+    marks = df.dropna(subset=["ts"]).groupby("Id")["ts"].max()
+    rows = [(table, int(user), int(ts)) for user, ts in marks.items()]
+
+    con.executemany("""INSERT INTO ingest_state VALUES (?, ?, ?)
+                       ON CONFLICT (TableName, Id) DO UPDATE SET ts = MAX(ts, excluded.ts)""", rows)
+
+def new_rows(con, table):
+    # Rows of the attached original table newer than the high-water mark of their user, all rows of unknown users.
+    # SQLite only returns the rows from the day of the mark on, the exact comparison is made on the parsed ts.
+    column, _ = database.TIME_COLUMNS[table]
+    mark_day = "CAST(strftime('%Y%m%d', ingest_state.ts, 'unixepoch') AS INTEGER)"
+
+    df = pd.read_sql_query(f"""SELECT o.*, ingest_state.ts AS Mark FROM original.{table} o
+                               LEFT JOIN ingest_state ON ingest_state.TableName = ? AND ingest_state.Id = o.Id
+                               WHERE ingest_state.ts IS NULL OR {database.day_key("o." + column)} >= {mark_day}""",
+                           con, params=(table,))
+
+    df = add_epoch_column(df, table)
+    df = df[df["ts"].notna() & (df["Mark"].isna() | (df["ts"] > df["Mark"]))]
+
+    return df.drop(columns=["Mark"])
+
+def insert_rows(con, table, df):
+    columns = ", ".join(f'"{column}"' for column in df.columns)
+    placeholders = ", ".join("?" for _ in df.columns)
+    rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+    con.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", rows)
+
+def incremental_cleaning(cleaned_con, original_db_path):
+    # Append the rows that are newer than the high-water marks and update everything derived from them, in one transaction
+    cleaned_con.execute("ATTACH DATABASE ? AS original", (original_db_path,))
+    changed = []
+    partitions = set()
+    log_ids = set()
+
+    with cleaned_con:
+        cleaned_con.execute("BEGIN")
+
+        for table in TABLES:
+            df = new_rows(cleaned_con, table)
+            update_marks(cleaned_con, table, df)
+
+            df = CLEANERS.get(table, lambda df: df)(df)
+
+            if df.empty:
+                continue
+
+            insert_rows(cleaned_con, table, df)
+            changed.append(table)
+            partitions.update(zip(df["Id"].astype(int), (df["ts"] - df["ts"] % 86400).astype(int)))
+
+            if table == "minute_sleep":
+                log_ids.update(df["logId"].astype(int))
+
+        if partitions:
+            update_rollups(cleaned_con, sorted(partitions))
+            sleep_sessions.update_tables(cleaned_con, sorted(log_ids))
+
+            # every day after the first new one can depend on it through the forward filled weight
+            first_day = min(day for _, day in partitions)
+            feature_store.refresh(cleaned_con, pd.to_datetime(first_day, unit="s"))
+
+    cleaned_con.execute("DETACH DATABASE original")
+
+    return changed
+
+def data_cleaning(incremental=False, workers=None):
+    # Paths to the databases
+    original_db_path = database.ORIGINAL_DB
+    cleaned_db_path = database.CLEANED_DB
+
+    # Connect to the new cleaned database, the connection is closed again however the cleaning ends
     cleaned_con = sqlite3.connect(cleaned_db_path)
 
-    # Save cleaned dailyActivity table
-    df_daily_cleaned.to_sql("daily_activity", cleaned_con, if_exists="replace", index=False)
+    try:
+        # The dashboard reads through read-only pooled connections, WAL lets them keep reading while tables are rewritten
+        cleaned_con.execute("PRAGMA journal_mode = WAL")
+
+        has_state = cleaned_con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ingest_state'").fetchone()
+
+        if incremental and has_state:
+            # Only the rows added to the original database since the last run are cleaned and appended
+            changed = incremental_cleaning(cleaned_con, original_db_path)
+            cleaned_con.close()
+
+            # Re-export the tables whose high-water marks moved, the other Arrow files still match the database
+            arrow_cache.export_tables(cleaned_db_path, tables=[table for table in arrow_cache.EXPORT_TABLES
+                                                               if not arrow_cache.is_fresh(table, cleaned_db_path)])
+
+            print(f"New rows of {', '.join(changed) or 'no tables'} have been cleaned and appended to 'cleaned_fitbit.db'.")
+            return
+
+        timings = {}
+        workers = workers or os.cpu_count()
+
+        # Staging databases next to the cleaned one, one per table, removed after the merge
+        staging_dir = tempfile.mkdtemp(prefix="staging_", dir=os.path.dirname(os.path.abspath(cleaned_db_path)))
+        staging_paths = {table: os.path.join(staging_dir, f"{table}.db") for table in TABLES}
+
+        try:
+            # Fresh (spawned) processes, a forked one could inherit open SQLite connections of this process
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                # Every table is read, cleaned and written by its own process, one chunk at a time
+                with stage(timings, "clean (wall clock)"):
+                    jobs = [pool.submit(clean_table, table, original_db_path, path) for table, path in staging_paths.items()]
 
-    # Save all other tables without modification
-    for table, df in table_data.items():
-        df.to_sql(table, cleaned_con, if_exists="replace", index=False)
+                    for job in jobs:
+                        table, seconds = job.result()
+                        timings[f"clean {table}"] = seconds
 
-    # Close the new database connection
-    cleaned_con.close()
+                with stage(timings, "merge"):
+                    # High-water marks of all rows read, the starting point of the next incremental run
+                    cleaned_con.execute("DROP TABLE IF EXISTS ingest_state")
+                    create_state_table(cleaned_con)
+                    merge_staging(cleaned_con, staging_paths)
+
+                with stage(timings, "indexes"):
+                    for table in TABLES:
+                        create_indexes(cleaned_con, table)
+
+                with stage(timings, "rollups"):
+                    create_rollups(cleaned_con)
+
+                with stage(timings, "sleep sessions"):
+                    sleep_sessions.create_tables(cleaned_con)
+
+                with stage(timings, "feature store"):
+                    feature_store.refresh(cleaned_con)
+                    cleaned_con.commit()
+
+                # Close the new database connection before the export (closing it again in finally does nothing)
+                cleaned_con.close()
+
+                # Export the cleaned tables as memory-mappable Arrow files for the dashboard, one table per process
+                with stage(timings, "arrow export"):
+                    list(pool.map(arrow_cache.export_tables, repeat(cleaned_db_path), repeat(arrow_cache.ARROW_DIR),
+                                  [[table] for table in arrow_cache.EXPORT_TABLES]))
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+    finally:
+        cleaned_con.close()
+
+    for name, seconds in timings.items():
+        print(f"{name:<28}{seconds:8.2f} s")
 
     print("All data has been cleaned and transferred to 'cleaned_fitbit.db'.")
 
-data_cleaning()
+    return timings
+
+if __name__ == "__main__":
+    # python scripts/cleaning_fitbit_database.py --incremental only appends the rows that are new since the last run
+    data_cleaning(incremental="--incremental" in sys.argv[1:])
@@ -0,0 +1,30 @@
+# IMPORTS
+import pandas as pd
+import feature_store
+import caching
+
+# Daily metrics of the feature store that are correlated with each other
+METRICS = ["TotalSteps", "TotalDistance", "Calories", "SedentaryMinutes", "ActiveMinutes",
+           "TotalMinutesAsleep", "StepTotal", "HourlyCalories", "TotalIntensity"]
+
+@caching.cached
+def daily_features(dates):
+    # One row per user and day of the selected dates with every daily metric next to each other:
+    # daily_activity columns, the minutes asleep (sleep_daily) and the sums of the hourly tables (activity_daily)
+    dates = pd.to_datetime(dates, format='%m/%d/%Y')
+
+    return feature_store.daily(METRICS, dates)
+
+@caching.cached
+def correlation_matrix(dates, method="pearson"):
+    # Pearson or Spearman correlation of every pair of daily metrics, each pair on the days both are known
+    features = daily_features(dates)
+
+    return features.drop(columns=["Id", "date"]).astype(float).corr(method=method)
+
+def correlation(x, y, dates, method="pearson"):
+    return correlation_matrix(dates, method).loc[x, y]
+
+def pair(x, y, dates):
+    # The days on which both metrics are known, as plotted in a scatter plot of y against x
+    return daily_features(dates)[["Id", "date", x, y]].dropna(subset=[x, y]).reset_index(drop=True)
@@ -0,0 +1,213 @@
+# IMPORTS
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+import re
+import numpy as np
+import pandas as pd
+import instrumentation
+from timestamps import TIMESTAMP_FORMAT, DATE_FORMAT
+
+# Paths to the databases
+CLEANED_DB = "data/cleaned_fitbit.db"
+ORIGINAL_DB = "data/fitbit_database.db"
+
+# Text time column of every table and its format, the cleaned database also stores it as epoch seconds in "ts"
+TIME_COLUMNS = {
+    "daily_activity": ("ActivityDate", DATE_FORMAT),
+    "heart_rate": ("Time", TIMESTAMP_FORMAT),
+    "hourly_calories": ("ActivityHour", TIMESTAMP_FORMAT),
+    "hourly_intensity": ("ActivityHour", TIMESTAMP_FORMAT),
+    "hourly_steps": ("ActivityHour", TIMESTAMP_FORMAT),
+    "minute_sleep": ("date", TIMESTAMP_FORMAT),
+    "weight_log": ("Date", TIMESTAMP_FORMAT),
+}
+
+# Pragmas applied to every pooled (read-only) connection
+READ_PRAGMAS = {
+    "mmap_size": 268435456,  # map up to 256 MB of the database file into memory
+    "cache_size": -65536,    # 64 MB page cache (negative values are in KiB)
+    "temp_store": "MEMORY",  # keep temporary b-trees for sorts and group-bys in memory
+}
+
+# Maximum number of idle connections kept open per database
+POOL_SIZE = 8
+
+# Compiled statements kept per connection, enough for every distinct query text of the dashboard
+STATEMENT_CACHE = 256
+
+# Named queries of the user-scoped lookups of the User-specific page. The Id is bound as an integer and the time range
+# as epoch bounds of ts, so each is a point or range read on the (Id, ts) index of the cleaned database, and as the
+# text never changes the compiled statement is reused from the cache of the pooled connection.
+STATEMENTS = {
+    "hourly_calories": "SELECT Id, ts AS ActivityHour, Calories FROM hourly_calories WHERE Id = ? AND ts >= ? AND ts < ? ORDER BY ts",
+    "hourly_steps": "SELECT Id, ts AS ActivityHour, StepTotal FROM hourly_steps WHERE Id = ? AND ts >= ? AND ts < ? ORDER BY ts",
+    "hourly_intensity": """SELECT Id, ts AS ActivityHour, TotalIntensity, AverageIntensity
+                           FROM hourly_intensity WHERE Id = ? AND ts >= ? AND ts < ? ORDER BY ts""",
+    "latest_weight": "SELECT WeightKg, BMI, ts AS Date FROM weight_log WHERE Id = ? AND ts IS NOT NULL ORDER BY ts DESC LIMIT 1",
+}
+
+# Ids picked from a dataframe are numpy integers, bind them like plain Python ints
+sqlite3.register_adapter(np.int64, int)
+sqlite3.register_adapter(np.int32, int)
+
+class ConnectionPool:
+    """Thread-safe pool of read-only connections to one SQLite database."""
+
+    def __init__(self, db_path, size=POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        uri = Path(self.db_path).absolute().as_uri() + "?mode=ro"
+        con = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=STATEMENT_CACHE)
+
+        for pragma, value in READ_PRAGMAS.items():
+            con.execute(f"PRAGMA {pragma} = {value}")
+
+        return con
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+
+        return self._connect()
+
+    def release(self, con):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(con)
+                return
+
+        con.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        for con in idle:
+            con.close()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_path=CLEANED_DB):
+    key = str(Path(db_path).absolute())
+
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(key)
+
+        return _pools[key]
+
+@contextmanager
+def connection(db_path=CLEANED_DB):
+    # Borrow a warm read-only connection and hand it back to the pool afterwards
+    pool = get_pool(db_path)
+    con = pool.acquire()
+
+    try:
+        yield con
+    finally:
+        pool.release(con)
+
+def query_name(sql, db_path=CLEANED_DB):
+    # Short label of a query for the performance panel, e.g. "cleaned_fitbit.db: daily_activity"
+    tables = re.findall(r"\b(?:FROM|JOIN)\s+(\w+)", sql, flags=re.IGNORECASE)
+
+    return f"{Path(db_path).name}: {', '.join(dict.fromkeys(tables)) or sql.split()[0]}"
+
+def query(sql, params=(), db_path=CLEANED_DB):
+    # Run a read query on a pooled connection and return the result as a dataframe
+    with instrumentation.span("sql", query_name(sql, db_path)) as record, connection(db_path) as con:
+        cur = con.execute(sql, params)
+        rows = cur.fetchall()
+        columns = [desc[0] for desc in cur.description]
+        record["rows"] = len(rows)
+
+    return pd.DataFrame(rows, columns=columns)
+
+def run(name, user, start=None, end=None, db_path=CLEANED_DB):
+    # Run a named statement of STATEMENTS for one user, and the rows with start <= ts < end when it takes a range
+    params = [int(user)]
+
+    if start is not None and end is not None:
+        params.extend([pd.Timestamp(start).value // 10**9, pd.Timestamp(end).value // 10**9])
+
+    return query(STATEMENTS[name], params, db_path=db_path)
+
+def day_key(column):
+    # Sortable yyyymmdd integer of a "%m/%d/%Y ..." text column, computed inside SQLite
+    rest = f"substr({column}, instr({column}, '/') + 1)"
+    year = f"CAST(substr({rest}, instr({rest}, '/') + 1) AS INTEGER)"
+
+    return f"({year} * 10000 + CAST({column} AS INTEGER) * 100 + CAST({rest} AS INTEGER))"
+
+def day_runs(days):
+    # Split sorted days into runs of consecutive days
+    runs = []
+
+    for day in days:
+        if runs and (day - runs[-1][1]).days == 1:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+
+    return runs
+
+def where(date_column=None, dates=None, user=None, user_column="Id"):
+    # Turn the selected dates and an optional user Id into a parameterized WHERE clause
+    predicates = []
+    params = []
+
+    if user is not None:
+        predicates.append(f"{user_column} = ?")
+        params.append(int(user))
+
+    if date_column is not None and dates is not None:
+        days = pd.DatetimeIndex(pd.to_datetime(dates)).normalize().unique().sort_values()
+        ranges = []
+
+        # every run of consecutive days only needs its two end points
+        for first, last in day_runs(days):
+            if date_column == "ts":
+                # epoch seconds of the cleaned database, can be answered from the (Id, ts) and (ts) indexes
+                ranges.append("(ts >= ? AND ts < ?)")
+                params.extend([first.value // 10**9, (last + pd.Timedelta(days=1)).value // 10**9])
+            else:
+                ranges.append(f"{day_key(date_column)} BETWEEN ? AND ?")
+                params.extend([first.year * 10000 + first.month * 100 + first.day,
+                               last.year * 10000 + last.month * 100 + last.day])
+
+        predicates.append("(" + " OR ".join(ranges) + ")" if ranges else "0")
+
+    if not predicates:
+        return "", params
+
+    return " WHERE " + " AND ".join(predicates), params
+
+@contextmanager
+def write_connection(db_path=CLEANED_DB):
+    # Short-lived writable connection, committed on success and rolled back on error
+    con = sqlite3.connect(db_path)
+
+    try:
+        yield con
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+
+def close_all():
+    # Close every idle pooled connection, e.g. before a database file is rebuilt
+    with _pools_lock:
+        pools = list(_pools.values())
+
+    for pool in pools:
+        pool.close()
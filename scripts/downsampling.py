@@ -0,0 +1,90 @@
+# IMPORTS
+import numpy as np
+import pandas as pd
+
+# Maximum number of points handed to plotly for one line, about the pixel width of a wide chart
+POINT_BUDGET = 2000
+
+def to_numeric(values):
+    # Datetimes are compared as nanoseconds since the epoch, everything else as floats
+    values = pd.Series(values)
+
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.astype("int64").to_numpy(dtype=float)
+
+    return values.to_numpy(dtype=float)
+
+def lttb(x, y, threshold):
+    # Largest-triangle-three-buckets: keep the first and last point and, from every bucket in between,
+    # the point forming the largest triangle with the previously kept point and the average of the next bucket.
+    # Returns the positions of the kept points.
+    n = len(x)
+
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Bucket boundaries of the n - 2 inner points
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    kept = np.empty(threshold, dtype=int)
+    kept[0] = 0
+    kept[-1] = n - 1
+
+    previous = 0
+
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+
+        # Average point of the next bucket, the last point for the last bucket
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        areas = np.abs((x[previous] - avg_x) * (y[start:end] - y[previous]) -
+                       (x[previous] - x[start:end]) * (avg_y - y[previous]))
+
+        previous = start + int(np.argmax(areas))
+        kept[i + 1] = previous
+
+    return kept
+
+def min_max(y, threshold):
+    # Min/max envelope: split the points into threshold / 2 buckets and keep the lowest and highest point of each,
+    # in their original order, so peaks and dips survive the reduction. Returns the positions of the kept points.
+    n = len(y)
+    buckets = threshold // 2
+
+    if threshold >= n or buckets < 1:
+        return np.arange(n)
+
+    edges = np.linspace(0, n, buckets + 1).astype(int)
+    starts = edges[:-1]
+
+    # Buckets hold at least two points because threshold < n, so reduceat never sees an empty bucket.
+    # fmin / fmax skip missing values, a bucket of only missing values has no lowest or highest point.
+    bucket_of = np.repeat(np.arange(buckets), np.diff(edges))
+    lowest = np.fmin.reduceat(y, starts)
+    highest = np.fmax.reduceat(y, starts)
+
+    positions = np.arange(n)
+    first_min = pd.Series(np.where(y == lowest[bucket_of], positions, n)).groupby(bucket_of).min().to_numpy()
+    first_max = pd.Series(np.where(y == highest[bucket_of], positions, n)).groupby(bucket_of).min().to_numpy()
+
+    kept = np.unique(np.concatenate([first_min, first_max]))
+
+    return kept[kept < n]
+
+def downsample(df, x, y, max_points=POINT_BUDGET, method="lttb"):
+    # Reduce a dataframe sorted on column x to at most max_points rows before it is plotted
+    if len(df) <= max_points:
+        return df
+
+    values = to_numeric(df[y])
+
+    if method == "lttb":
+        kept = lttb(to_numeric(df[x]), values, max_points)
+    elif method == "minmax":
+        kept = min_max(values, max_points)
+    else:
+        raise ValueError(f"Unknown downsampling method: {method}")
+
+    return df.iloc[kept]
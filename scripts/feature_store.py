@@ -0,0 +1,139 @@
+# IMPORTS
+import pandas as pd
+import database
+import schema
+
+# Weather files, the daily one in Celsius and the hourly one in Fahrenheit
+DAILY_WEATHER = "data/weather_Chicago.csv"
+HOURLY_WEATHER = "data/weather_Chicago_hourly.csv"
+
+# Columns and SQLite types of the feature tables, ts is the epoch of the day or hour a row describes
+DAILY_COLUMNS = {
+    "Id": "INTEGER", "ts": "INTEGER",
+    "TotalSteps": "INTEGER", "TotalDistance": "REAL", "Calories": "INTEGER",
+    "VeryActiveMinutes": "INTEGER", "FairlyActiveMinutes": "INTEGER", "LightlyActiveMinutes": "INTEGER",
+    "SedentaryMinutes": "INTEGER", "ActiveMinutes": "INTEGER",
+    "TotalMinutesAsleep": "INTEGER", "StepTotal": "INTEGER", "HourlyCalories": "INTEGER", "TotalIntensity": "INTEGER",
+    "AvgHeartRate": "REAL", "WeightKg": "REAL", "BMI": "REAL",
+    "temp": "REAL", "feelslike": "REAL", "precip": "REAL", "humidity": "REAL", "windspeed": "REAL", "icon": "TEXT",
+}
+
+HOURLY_COLUMNS = {
+    "Id": "INTEGER", "ts": "INTEGER",
+    "StepTotal": "INTEGER", "Calories": "INTEGER", "TotalIntensity": "INTEGER",
+    "HeartRate": "REAL", "TotalMinutesAsleep": "INTEGER",
+    "temp": "REAL", "feelslike": "REAL", "precip": "REAL", "humidity": "REAL", "windspeed": "REAL",
+}
+
+# Per user sources of the feature tables, all keyed by (Id, ts) of the day or hour
+DAILY_SOURCES = [
+    """SELECT Id, ts, TotalSteps, TotalDistance, Calories, VeryActiveMinutes, FairlyActiveMinutes, LightlyActiveMinutes,
+              SedentaryMinutes, VeryActiveMinutes + FairlyActiveMinutes + LightlyActiveMinutes AS ActiveMinutes
+       FROM daily_activity""",
+    "SELECT Id, ts, TotalMinutesAsleep FROM sleep_daily",
+    "SELECT Id, ts, StepTotal, Calories AS HourlyCalories, TotalIntensity FROM activity_daily",
+    """SELECT Id, ts - ts % 86400 AS ts, SUM(AvgValue * ValueCount) / SUM(ValueCount) AS AvgHeartRate
+       FROM heart_rate_hourly{where} GROUP BY Id, ts - ts % 86400""",
+]
+
+HOURLY_SOURCES = [
+    "SELECT Id, ts, StepTotal FROM hourly_steps",
+    "SELECT Id, ts, Calories FROM hourly_calories",
+    "SELECT Id, ts, TotalIntensity FROM hourly_intensity",
+    "SELECT Id, ts, AvgValue AS HeartRate FROM heart_rate_hourly",
+    "SELECT Id, ts, TotalMinutesAsleep FROM sleep_hourly",
+]
+
+WEATHER_COLUMNS = ["temp", "feelslike", "precip", "humidity", "windspeed"]
+
+def epoch(values):
+    return (pd.to_datetime(values) - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+
+def time_range(start, end):
+    # WHERE clause and parameters of the rows with start <= ts < end, the whole table when both are None
+    if start is None and end is None:
+        return "", []
+
+    start = epoch(start) if start is not None else -2**62
+    end = epoch(end) if end is not None else 2**62
+
+    return " WHERE ts >= ? AND ts < ?", [start, end]
+
+def load_sources(sources, con, where, params):
+    # Outer join of the sources on (Id, ts), a key is kept when any source has a row for it
+    features = None
+
+    for source in sources:
+        sql = source.format(where=where) if "{where}" in source else f"SELECT * FROM ({source}){where}"
+        df = pd.read_sql_query(sql, con, params=params).dropna(subset=["ts"])
+        features = df if features is None else features.merge(df, on=["Id", "ts"], how="outer")
+
+    return features
+
+def daily_weather(weather_file=DAILY_WEATHER):
+    weather = pd.read_csv(weather_file)
+    weather["ts"] = epoch(weather["datetime"])
+
+    return weather[["ts"] + WEATHER_COLUMNS + ["icon"]]
+
+def hourly_weather(weather_file=HOURLY_WEATHER):
+    weather = pd.read_csv(weather_file)
+    weather["ts"] = epoch(weather["datetime"])
+
+    return weather[["ts"] + WEATHER_COLUMNS]
+
+def last_weight(features, con):
+    # Weight on every day, the last one logged on or before it by the same user (forward filled per user)
+    weight = pd.read_sql_query("SELECT Id, ts, WeightKg, BMI FROM weight_log WHERE ts IS NOT NULL", con)
+    weight["ts"] = weight["ts"] - weight["ts"] % 86400
+    weight = weight.sort_values("ts").drop_duplicates(["Id", "ts"], keep="last")
+
+    features = features.sort_values("ts")
+    weight = weight.astype({"Id": features["Id"].dtype, "ts": features["ts"].dtype})
+
+    return pd.merge_asof(features, weight[["Id", "ts", "WeightKg", "BMI"]], on="ts", by="Id", direction="backward")
+
+def create_tables(con):
+    for table, columns in [("features_daily", DAILY_COLUMNS), ("features_hourly", HOURLY_COLUMNS)]:
+        definition = ", ".join(f"{column} {sql_type}" for column, sql_type in columns.items())
+        con.execute(f"CREATE TABLE IF NOT EXISTS {table} ({definition}, PRIMARY KEY (Id, ts))")
+        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_ts ON {table} (ts)")
+
+def write(con, table, features, columns):
+    features = features.reindex(columns=list(columns))
+    placeholders = ", ".join("?" for _ in columns)
+
+    rows = features.astype(object).where(features.notna(), None).itertuples(index=False, name=None)
+    con.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({placeholders})", rows)
+
+def refresh(con, start=None, end=None):
+    # (Re)build the rows of both feature tables with start <= ts < end from the cleaned tables and the weather files,
+    # all rows when no range is given. Rows outside the range are left as they are.
+    create_tables(con)
+    where, params = time_range(start, end)
+
+    daily = load_sources(DAILY_SOURCES, con, where, params)
+    daily = last_weight(daily, con).merge(daily_weather(), on="ts", how="left")
+
+    hourly = load_sources(HOURLY_SOURCES, con, where, params)
+    hourly = hourly.merge(hourly_weather(), on="ts", how="left")
+
+    for table, features, columns in [("features_daily", daily, DAILY_COLUMNS), ("features_hourly", hourly, HOURLY_COLUMNS)]:
+        con.execute(f"DELETE FROM {table}{where}", params)
+        write(con, table, features, columns)
+
+def select(table, columns=None, dates=None, user=None):
+    # Columns of a feature table for the given days and user, with ts turned into a datetime column
+    selected = "*" if columns is None else ", ".join(["Id", "ts"] + [column for column in columns if column not in ("Id", "ts")])
+    clause, params = database.where("ts", dates, user)
+
+    df = database.query(f"SELECT {selected} FROM {table}{clause} ORDER BY Id, ts", params)
+    df["ts"] = pd.to_datetime(df["ts"], unit="s")
+
+    return schema.cast(df, table)
+
+def daily(columns=None, dates=None, user=None):
+    return select("features_daily", columns, dates, user).rename(columns={"ts": "date"})
+
+def hourly(columns=None, dates=None, user=None):
+    return select("features_hourly", columns, dates, user).rename(columns={"ts": "datetime"})
@@ -0,0 +1,125 @@
+# IMPORTS
+import functools
+import threading
+import time
+from contextlib import contextmanager
+import pandas as pd
+
+# Stages of a chart: fetching rows (SQLite or the Arrow cache), parsing time columns, transforming frames and building figures
+STAGES = ["sql", "parse", "transform", "figure"]
+
+# Number of functions and queries listed in the performance panel
+TOP_SPANS = 15
+
+# Spans of the run on the current thread, every Streamlit run (and every prefetch thread) has its own
+_state = threading.local()
+
+def start(enabled=True):
+    # Begin collecting the spans of a new run, nothing is recorded while disabled
+    _state.enabled = enabled
+    _state.spans = []
+    _state.stack = []
+
+def is_enabled():
+    return getattr(_state, "enabled", False)
+
+def spans():
+    return list(getattr(_state, "spans", []))
+
+def is_figure(value):
+    return hasattr(value, "to_plotly_json")
+
+def count_rows(value):
+    # Rows of a frame, points of a figure, or those of the first frame or figure in a returned tuple
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+
+    if is_figure(value):
+        points = 0
+
+        for trace in value.data:
+            values = next((getattr(trace, name, None) for name in ["x", "y", "values", "z"] if getattr(trace, name, None) is not None), None)
+            points += len(values) if values is not None else 0
+
+        return points
+
+    if isinstance(value, tuple):
+        return next((rows for rows in map(count_rows, value) if rows is not None), None)
+
+    return None
+
+@contextmanager
+def span(stage, name):
+    # Time the block as one span of the current run, the block can fill in the number of rows it handled.
+    # Time spent in nested spans is subtracted from the "self" time, so the stages add up to the total.
+    if not is_enabled():
+        yield {}
+        return
+
+    record = {"stage": stage, "name": name, "seconds": 0.0, "self_seconds": 0.0, "rows": None, "depth": len(_state.stack)}
+    _state.stack.append(0.0)
+    started = time.perf_counter()
+
+    try:
+        yield record
+    finally:
+        elapsed = time.perf_counter() - started
+        children = _state.stack.pop()
+
+        if _state.stack:
+            _state.stack[-1] += elapsed
+
+        record["seconds"] = elapsed
+        record["self_seconds"] = elapsed - children
+        _state.spans.append(record)
+
+@contextmanager
+def section(enabled=True):
+    # Collect the spans of a block that can also rerun on its own, like a Streamlit fragment, apart from the rest of the run.
+    # Afterwards they are added to the enclosing run, so the total of a full run still includes them.
+    outer = (is_enabled(), spans(), list(getattr(_state, "stack", [])))
+    start(enabled)
+
+    try:
+        yield
+    finally:
+        _state.enabled, _state.spans, _state.stack = outer[0], outer[1] + _state.spans, outer[2]
+
+def timed(stage=None, name=None):
+    # Record every call of the decorated function as a span with the rows of its result. Only the data and figure
+    # functions the pages call are decorated, not the helpers they apply to every row.
+    # Without a stage, calls that return a figure count as "figure" and all others as "transform".
+    def decorator(func):
+        label = name or f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return func(*args, **kwargs)
+
+            with span(stage or "transform", label) as record:
+                result = func(*args, **kwargs)
+                record["rows"] = count_rows(result)
+
+                if stage is None and (is_figure(result) or isinstance(result, tuple) and any(map(is_figure, result))):
+                    record["stage"] = "figure"
+
+            return result
+
+        return wrapper
+
+    return decorator
+
+def summary(top=TOP_SPANS):
+    # Self time per stage, the total time of the run and its most expensive functions and queries
+    df = pd.DataFrame(spans(), columns=["stage", "name", "seconds", "self_seconds", "rows", "depth"])
+    df["rows"] = pd.to_numeric(df["rows"])
+
+    stages = df.groupby("stage")["self_seconds"].sum().reindex(STAGES, fill_value=0.0)
+    total = df.loc[df["depth"] == 0, "seconds"].sum()
+
+    costs = df.groupby(["stage", "name"], as_index=False).agg(
+        calls=("seconds", "size"), self_seconds=("self_seconds", "sum"), total=("seconds", "sum"), rows=("rows", lambda rows: rows.sum(min_count=1)))
+    costs = costs.sort_values("self_seconds", ascending=False).head(top).reset_index(drop=True)
+
+    return stages, total, costs
@@ -2,8 +2,10 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import sqlite3
 import datetime
+import database
+import time_ranges
+import instrumentation
 import part1
 import part3
 import user_graphing_function as ugf
@@ -23,30 +25,18 @@ st.sidebar.page_link("General_insights.py", label="General Analysis", icon=":mat
 st.sidebar.page_link("pages/1_User-specific_data.py", label="User-specific Analysis", icon=":material/person:")
 st.sidebar.markdown("---")
 
+# Optional timing of the queries, parsing, transformations and figures of this run
+show_performance = st.sidebar.toggle("Performance panel", key="performance")
+instrumentation.start(show_performance)
+
 def get_latest_weight_data(user):
-    conn = sqlite3.connect('data/fitbit_database.db')
-    
-    query = f"""
-    SELECT WeightKg, BMI, Date
-    FROM weight_log
-    WHERE Id = '{user}'
-    """
+    # Last logged weight of the user, a point read on the (Id, ts) index of weight_log
+    result_df = database.run("latest_weight", user)
     
-    cur = conn.cursor()
-    cur.execute(query)
-    result_rows = cur.fetchall()
-    conn.close()
-    
-    if result_rows:
-        result_df = pd.DataFrame(result_rows, columns=['WeightKg', 'BMI', 'Date'])
-        result_df['Date'] = pd.to_datetime(result_df['Date'], errors='coerce')
-        
-        result_df = result_df.sort_values(by='Date', ascending=False)
-        
-        if not result_df.empty:
-            latest_date = result_df['Date'].iloc[0]
-            formatted_date = latest_date.strftime("%m/%d/%y")
-            return result_df['WeightKg'].iloc[0], result_df['BMI'].iloc[0], formatted_date
+    if not result_df.empty:
+        latest_date = pd.to_datetime(result_df['Date'].iloc[0], unit="s")
+        formatted_date = latest_date.strftime("%m/%d/%y")
+        return result_df['WeightKg'].iloc[0], result_df['BMI'].iloc[0], formatted_date
     
     return None, None, None
 
@@ -57,10 +47,11 @@ with st.sidebar:
     if "user" not in st.session_state:
         st.session_state.user = None
         
+    users = sorted(part1.get_data()["Id"].unique())
     user_sidebar = st.selectbox(
         "Select a user",
-        sorted(part1.data["Id"].unique()),
-        index=sorted(part1.data["Id"].unique()).index(st.session_state.user) if st.session_state.user else None,
+        users,
+        index=users.index(st.session_state.user) if st.session_state.user else None,
         placeholder="Select a user",
         key="user_sidebar"
     )
@@ -205,7 +196,8 @@ if st.session_state.user and start_date < end_date:
     st.markdown("<h3 style='text-align: left; margin-top: -40px;'>Fitbit Data Analysis</h3>", unsafe_allow_html=True)
     user = st.session_state.user
     
-    user_data = part1.data[part1.data["Id"] == user].copy()
+    data = part1.get_data()
+    user_data = data[data["Id"] == user].copy()
     user_data.loc[:, "ActivityDate"] = pd.to_datetime(user_data["ActivityDate"], format="%Y-%m-%d")
     
     # Fetch and merge sleep data
@@ -227,7 +219,7 @@ if st.session_state.user and start_date < end_date:
         avg_steps = int(filtered_data["TotalSteps"].mean()) 
         avg_distance = round(filtered_data["TotalDistance"].mean(), 2)
         avg_calories = int(filtered_data["Calories"].mean())
-        avg_active_min = int((filtered_data["VeryActiveMinutes"] + filtered_data["FairlyActiveMinutes"] + filtered_data["LightlyActiveMinutes"]).mean())
+        avg_active_min = int(filtered_data[["VeryActiveMinutes", "FairlyActiveMinutes", "LightlyActiveMinutes"]].sum(axis=1).mean())
         avg_sedentary_min = int(filtered_data["SedentaryMinutes"].mean())
         avg_sleep_duration = round(filtered_data["TotalSleepHours"].mean(), 2)
         
@@ -288,7 +280,12 @@ if st.session_state.user and start_date < end_date:
                     st.plotly_chart(fig_hr_trends, use_container_width=True)
                 
                 with col2:
-                    fig_hr_zones = ugf.plot_heart_rate_zones(user, start_date, end_date)
+                    # The Fitbit data has no ages, an entered age bounds the zones by the age predicted maximum heart rate
+                    age = st.number_input("Age for the heart rate zones", min_value=10, max_value=100, value=None,
+                                          placeholder="Fixed zones (70 and 120 bpm)", key="age")
+                    zones = ugf.HEART_RATE_ZONES if age is None else ugf.age_heart_rate_zones(age)
+
+                    fig_hr_zones = ugf.plot_heart_rate_zones(user, start_date, end_date, zones)
                     st.plotly_chart(fig_hr_zones, use_container_width=True)
                 
                 st.markdown("<hr>", unsafe_allow_html=True)
@@ -300,7 +297,7 @@ if st.session_state.user and start_date < end_date:
                 """, unsafe_allow_html=True)
                 
                 with st.container():
-                    available_dates = sorted(hr_data['Date'].unique())
+                    available_dates = sorted(pd.DatetimeIndex(hr_data['Date'].unique()).date)
                     
                     if available_dates:
                         select_col, metrics_col1, metrics_col2, metrics_col3 = st.columns([2, 1, 1, 1])
@@ -393,7 +390,7 @@ if st.session_state.user and start_date < end_date:
                 st.markdown("""<h4 style="color: #333; margin-bottom: 10px;">Daily Sleep Details</h4>""", 
                         unsafe_allow_html=True)
 
-                sleep_dates = filtered_data[~filtered_data["TotalSleepHours"].isna()]["ActivityDate"].dt.date.unique()
+                sleep_dates = filtered_data[~filtered_data["TotalSleepHours"].isna()]["ActivityDate"].dt.normalize().unique()
                 
                 if len(sleep_dates) > 0:
                     col1, col2 = st.columns([2, 1])
@@ -409,14 +406,14 @@ if st.session_state.user and start_date < end_date:
                             key="sleep_date_calendar"
                         )
                     
-                    daily_data = filtered_data[filtered_data["ActivityDate"].dt.date == selected_date]
+                    daily_data = filtered_data[filtered_data["ActivityDate"].dt.normalize() == pd.Timestamp(selected_date)]
                     with col2:
                         st.metric("Total Sleep", 
                                 f"{daily_data['TotalSleepHours'].values[0]:.1f} hrs",
                                 help="Total sleep duration for selected day")
 
                     if not sleep_stage_data.empty:
-                        daily_stages = sleep_stage_data[sleep_stage_data["date"].dt.date == selected_date]
+                        daily_stages = time_ranges.day(sleep_stage_data, "date", selected_date)
                         
                         if not daily_stages.empty:
                             fig_timeline = ugf.plot_sleep_timeline(daily_stages, selected_date)
@@ -476,7 +473,7 @@ if st.session_state.user and start_date < end_date:
                 """, unsafe_allow_html=True)
                 
                 with st.container():
-                    available_dates = sorted(calories_data['Date'].unique())
+                    available_dates = sorted(pd.DatetimeIndex(calories_data['Date'].unique()).date)
                     
                     if available_dates:
                         select_col, metrics_col1, metrics_col2, metrics_col3 = st.columns([2, 1, 1, 1])
@@ -561,7 +558,7 @@ if st.session_state.user and start_date < end_date:
                 """, unsafe_allow_html=True)
                 
                 with st.container():
-                    available_dates = sorted(steps_data['Date'].unique())
+                    available_dates = sorted(pd.DatetimeIndex(steps_data['Date'].unique()).date)
                     
                     if available_dates:
                         select_col, metrics_col1, metrics_col2, metrics_col3 = st.columns([2, 1, 1, 1])
@@ -646,7 +643,7 @@ if st.session_state.user and start_date < end_date:
                 """, unsafe_allow_html=True)
                 
                 with st.container():
-                    available_dates = sorted(intensity_data['Date'].unique())
+                    available_dates = sorted(pd.DatetimeIndex(intensity_data['Date'].unique()).date)
                     
                     if available_dates:
                         select_col, metrics_col1, metrics_col2, metrics_col3 = st.columns([2, 1, 1, 1])
@@ -706,3 +703,6 @@ if st.session_state.user and start_date < end_date:
                     unsafe_allow_html=True
                 )
                 
+
+if show_performance:
+    plots.performance_panel()
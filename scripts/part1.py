@@ -1,18 +1,26 @@
 # IMPORTS
 import pandas as pd
 import matplotlib.pyplot as plt
-import statsmodels.api as sm
 import seaborn as sns
+from functools import cache
+import regression
+import schema
 
-data = pd.read_csv("data/daily_activity.csv", header=0)
+@cache
+def get_data():
+    # read the CSV file once, on first use instead of on import
+    data = pd.read_csv("data/daily_activity.csv", header=0)
 
-# converting the data to the type datetime
-data["ActivityDate"] = pd.to_datetime(data["ActivityDate"], format='%m/%d/%Y')
+    # converting the data to the type datetime
+    data["ActivityDate"] = pd.to_datetime(data["ActivityDate"], format='%m/%d/%Y')
+
+    return schema.cast(data, "daily_activity")
 
 # Part I 
 
 # Step 1: count unique users and total distance for each user and graph it
 def calc_unique_graph_total_distance():
+    data = get_data()
     total_users = data["Id"].nunique()
     print("Number of total users:", total_users)
 
@@ -36,6 +44,7 @@ def calc_unique_graph_total_distance():
 
 # Step 2: displays a line graph that shows the calories burnt on each day
 def visualise_calories_burned(user_id, dates):
+    data = get_data()
     # convert the type of dates to datetime
     dates = pd.to_datetime(dates, format='%m/%d/%Y')
 
@@ -82,31 +91,20 @@ def plot_workout_frequency(workout_df):
         plt.text(i, freq, f'{(freq/total_workouts):.2%}', ha="center", va="bottom", fontsize=10)
 
     plt.show()
-if __name__ == "__main__":
-    workout_df = process_workout_data(data)  
-    print(workout_df) 
-    plot_workout_frequency(workout_df)  
 
 # Step 4: Linear Regression Model and Visualization
 def linear_regression_visualization(user_id):
+    data = get_data()
     user_data = data[data["Id"] == user_id]
-    X = user_data[["TotalSteps", "Id"]]  # decision variables
-    y = user_data["Calories"]   # depedent variable
-    
-    # convert 'Id' to dummy
-    X = X.copy()
-    X["Id"] = X["Id"].astype("category")
-    X = pd.get_dummies(X, columns=["Id"], drop_first=True)
-    X = sm.add_constant(X)
     
-    # linear regression model
-    model = sm.OLS(y, X).fit()
+    # linear regression model of Calories (dependent variable) on TotalSteps, the data holds a single Id
+    model = regression.fit(user_data, "Calories", "TotalSteps")
     
-    print(model.summary())
+    print(model)
     
     plt.figure(figsize=(10, 6))
     plt.scatter(user_data["TotalSteps"], user_data["Calories"], color="skyblue", label="Data points")
-    plt.plot(user_data["TotalSteps"], model.predict(X), color="red", label="Regression line")
+    plt.plot(user_data["TotalSteps"], regression.predict(model, user_data), color="red", label="Regression line")
     plt.xlabel("Total Steps")
     plt.ylabel("Calories Burned")
     plt.title(f"Linear Relationship between Total Steps and Calories Burned for User {user_id}")
@@ -118,6 +116,7 @@ def linear_regression_visualization(user_id):
 
 # Step 5: Creativity visualization
 def calories_totalsteps_scatter():
+    data = get_data()
     plt.figure(figsize=(10, 6))
     plt.scatter(data.TotalSteps, data.Calories, c=data.Calories)
 
@@ -138,6 +137,7 @@ def calories_totalsteps_scatter():
 #calories_totalsteps_scatter()
 
 def calories_totalhours_scatter():
+    data = get_data()
     data['TotalMinutes']=data.VeryActiveMinutes + data.FairlyActiveMinutes + data.LightlyActiveMinutes + data.SedentaryMinutes
     data['TotalHours']=round(data.TotalMinutes / 60)
     
@@ -161,6 +161,7 @@ def calories_totalhours_scatter():
 #calories_totalhours_scatter()
 
 def make_correlation_heatmap():
+    data = get_data()
     corr = data.corr(numeric_only=True)
     plt.figure(figsize=(11, 6))
     sns.heatmap(corr, annot=True, annot_kws={'size': 6})
@@ -174,6 +175,7 @@ def make_correlation_heatmap():
 
 def describe_columns(user_id):
 
+    data = get_data()
     df = data.loc[data["Id"] == user_id] if user_id else data
 
     for column in df:
@@ -181,11 +183,9 @@ def describe_columns(user_id):
             print(df[column].describe())
             print()
 
-describe_columns(None)
-describe_columns(4020332650)
-
 def plot_activity_pie_chart():
 
+    data = get_data()
     minutes = [
         data["VeryActiveMinutes"].sum(), 
         data["FairlyActiveMinutes"].sum(),
@@ -203,6 +203,7 @@ def plot_activity_pie_chart():
 
 def plot_activity_pie_chart_only_active_minutes():
 
+    data = get_data()
     minutes = [
         data["VeryActiveMinutes"].sum(), 
         data["FairlyActiveMinutes"].sum(),
@@ -216,3 +217,10 @@ def plot_activity_pie_chart_only_active_minutes():
     plt.show()
 
 #plot_activity_pie_chart_only_active_minutes()
+
+if __name__ == "__main__":
+    workout_df = process_workout_data(get_data())  
+    print(workout_df) 
+    plot_workout_frequency(workout_df)  
+    describe_columns(None)
+    describe_columns(4020332650)
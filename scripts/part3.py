@@ -1,26 +1,25 @@
 # IMPORTS
-import sqlite3
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
-import statsmodels.api as sm
 from scipy import stats
-
-# connect to database
-con = sqlite3.connect("data/cleaned_fitbit.db")
-cur = con.cursor()
-
-# read the CSV file
-data = pd.read_csv("data/daily_activity.csv", header=0)
-
-# converting the data to the type datetime
-data["ActivityDate"] = pd.to_datetime(data["ActivityDate"], format='%m/%d/%Y')
+import database
+import part1
+import caching
+import instrumentation
+import arrow_cache
+import timestamps
+import sleep_sessions
+import regression
+import feature_store
 
 # Part1 creating new dataframe of unique users and the class they belong to
+@instrumentation.timed()
+@caching.cached
 def create_new_dataframe():
 
-    user_counts = data['Id'].value_counts()
+    user_counts = part1.get_data()['Id'].value_counts()
     new_data = pd.DataFrame({'Id': user_counts.index})
 
     # Assign user types based on counts
@@ -39,8 +38,6 @@ def create_new_dataframe():
 
     return new_data
 
-create_new_dataframe()
-
 # Part2: Verifying data
 def get_verified_data(data_type):
     if data_type == "steps":
@@ -58,21 +55,16 @@ def get_verified_data(data_type):
     else:
         raise ValueError("Invalid data_type. Please choose either 'steps' or 'calories'.")
 
-    cur.execute(query)
-    rows = cur.fetchall()
-    daily_activity = pd.DataFrame(rows, columns=[desc[0] for desc in cur.description]) 
-
-    cur.execute(query_2)
-    rows_2 = cur.fetchall()
-    hourly_data = pd.DataFrame(rows_2, columns=[desc[0] for desc in cur.description]) 
+    daily_activity = database.query(query)
+    hourly_data = database.query(query_2)
 
     # Convert date format
-    hourly_data["ActivityHour"] = pd.to_datetime(hourly_data["ActivityHour"], format="%m/%d/%Y %I:%M:%S %p")
-    hourly_data["ActivityDate"] = hourly_data["ActivityHour"].dt.date
+    hourly_data["ActivityHour"] = timestamps.parse_timestamps(hourly_data["ActivityHour"])
+    hourly_data["ActivityDate"] = hourly_data["ActivityHour"].dt.normalize()
 
     # Aggregate hourly data
     sum_daily_hourly_data = hourly_data.groupby(["Id", "ActivityDate"])[value_column].sum().reset_index()
-    daily_activity["ActivityDate"] = pd.to_datetime(daily_activity["ActivityDate"]).dt.date
+    daily_activity["ActivityDate"] = timestamps.parse_dates(daily_activity["ActivityDate"])
 
     merged_df = daily_activity.merge(sum_daily_hourly_data, on=["Id", "ActivityDate"], how="left")
 
@@ -168,109 +160,60 @@ def run_analysis(data_type):
 # run_analysis("calories")
 
 # Step 3: compute the sleep duration for each moment of sleep of an individual
+@instrumentation.timed()
+@caching.cached
 def compute_sleep_duration(user_id):
-    # Open a new database connection for each call
-    conn = sqlite3.connect("data/cleaned_fitbit.db")  
-    cur = conn.cursor()
+    # Sleep episodes come from the sleep_sessions table built at clean time, one row per logId
+    sleep_durations = sleep_sessions.sessions(user_id)
 
-    # Fetch sleep data
-    query = f"SELECT Id, date, logId FROM minute_sleep WHERE Id={user_id}"
-    sleep_duration = cur.execute(query)
-    rows = sleep_duration.fetchall()
-    df = pd.DataFrame(rows, columns=[x[0] for x in cur.description])
+    # Compute sleep duration, attributed to the day the episode ends on
+    sleep_durations['MinutesSlept'] = (sleep_durations['EndTs'] - sleep_durations['ts']).dt.total_seconds() / 60
+    sleep_durations['Date'] = sleep_durations['Night']
 
-    # Close connection to avoid threading issues
-    conn.close()
-
-    # Ensure date column is datetime
-    df["date"] = pd.to_datetime(df["date"])
-
-    # Compute sleep duration
-    sleep_durations = df.groupby('logId').agg(start_time=('date', 'min'), end_time=('date', 'max')).reset_index()
-    sleep_durations['MinutesSlept'] = (sleep_durations['end_time'] - sleep_durations['start_time']).dt.total_seconds() / 60
-    sleep_durations['Date'] = sleep_durations['end_time'].dt.date
-
-    # Drop unnecessary columns
-    sleep_durations = sleep_durations.drop(["logId", "start_time", "end_time"], axis=1)
-
-    return sleep_durations
+    return sleep_durations[['MinutesSlept', 'Date']]
 
 # print(compute_sleep_duration(1503960366))
 
-def compute_sleep_on_day(user_id):
-    con = sqlite3.connect("data/cleaned_fitbit.db")
-    cur = con.cursor()
+@instrumentation.timed()
+@caching.cached
+def compute_sleep_on_day(user_id, dates=None):
+    # minutes asleep per user and day come from the sleep_daily rollup, only for the given dates when there are any
+    clause, params = database.where("ts", dates, user_id if user_id else None)
+    df_sleep = database.query("SELECT Id, ts AS date, TotalMinutesAsleep FROM sleep_daily" + clause, params)
 
-    if user_id: 
-        cur.execute(f"SELECT Id, date, logId, value FROM minute_sleep WHERE Id={user_id}")
-    else:
-        cur.execute("SELECT Id, date, logId, value FROM minute_sleep")
+    df_sleep["date"] = pd.to_datetime(df_sleep["date"], unit="s")
+    df_sleep["Day"] = df_sleep["date"].dt.weekday
 
-    rows = cur.fetchall()
-    df_sleep = pd.DataFrame(rows, columns=[x[0] for x in cur.description])
+    return df_sleep[["Id", "date", "Day", "TotalMinutesAsleep"]]
 
-    con.close()
+def sleep_and_activity(column, user_id=None):
+    # minutes asleep next to a daily activity column, on the days both are known
+    df = feature_store.daily(["TotalMinutesAsleep", column], user=user_id if user_id else None)
+    df = df.dropna(subset=["TotalMinutesAsleep", column]).astype({"TotalMinutesAsleep": "int64", column: "int64"})
 
-    df_sleep["date"] = pd.to_datetime(df_sleep["date"]).dt.normalize()
-    df_sleep["Day"] = df_sleep["date"].dt.weekday
-    df_sleep = df_sleep.groupby(["Id", "date", "Day"], as_index=False)["value"].count()
-    df_sleep.rename(columns={"value": "TotalMinutesAsleep"}, inplace=True)
+    df["Day"] = df["date"].dt.weekday
 
-    df_sleep["date"] = pd.to_datetime(df_sleep["date"]).dt.date
-
-    return df_sleep
+    return df[["Id", "date", "Day", "TotalMinutesAsleep", column]].reset_index(drop=True)
 
 # Step 4: analyse the relationship between the duration of sleep and the active minutes for an individual
+@instrumentation.timed()
+@caching.cached
 def compare_activity_and_sleep(user_id, dates):
     dates = pd.to_datetime(dates, format='%m/%d/%Y')
 
-    con = sqlite3.connect("data/cleaned_fitbit.db")
-    cur = con.cursor()
+    # active minutes and minutes asleep of the same user and day come from the feature store
+    data_sleep_and_activity = sleep_and_activity("ActiveMinutes", user_id)
 
-    # gets data from the database and adds it to a dataframe
-    if user_id:
-        active_minutes = cur.execute(f"SELECT Id, ActivityDate, VeryActiveMinutes, FairlyActiveMinutes, LightlyActiveMinutes FROM daily_activity WHERE Id={user_id}")
-    else:
-        active_minutes = cur.execute(f"SELECT Id, ActivityDate, VeryActiveMinutes, FairlyActiveMinutes, LightlyActiveMinutes FROM daily_activity")
-    rows = active_minutes.fetchall()
-    daily_activity = pd.DataFrame(rows, columns = [x[0] for x in cur.description])
+    filtered_data = data_sleep_and_activity[data_sleep_and_activity["date"].isin(dates)]
 
-    con.close()
+    # linear regression model of ActiveMinutes (dependent variable) on TotalMinutesAsleep (independent variable)
+    model = regression.fit(data_sleep_and_activity, "ActiveMinutes", "TotalMinutesAsleep")
 
-    # renames the ActivityDate column to Date
-    daily_activity.rename(columns={"ActivityDate": "date"}, inplace=True)
-
-    # converts the date column to the type datetime
-    daily_activity["date"] = pd.to_datetime(daily_activity["date"]).dt.date
-
-    # calculates the time the user is active by summing the active minutes for that day
-    daily_activity['ActiveMinutes'] = (daily_activity['VeryActiveMinutes'] + daily_activity['FairlyActiveMinutes'] + daily_activity['LightlyActiveMinutes'])
-    if user_id:
-        daily_activity = daily_activity.groupby('date')['ActiveMinutes'].sum().reset_index()
-
-    daily_sleep = compute_sleep_on_day(user_id)
-
-    # merges the total active minutes and the duration of sleep based on the date, leaving out any dates where no active minutes or sleep duration is available
-    if user_id:
-        data_sleep_and_activity = pd.merge(daily_activity, daily_sleep, on="date", how="inner")
-    else:
-        data_sleep_and_activity = pd.merge(daily_activity, daily_sleep, on=["Id", "date"], how="inner")
-
-    filtered_data = data_sleep_and_activity[data_sleep_and_activity["date"].isin(dates.date)]
-
-    # linear regression model
-    X = data_sleep_and_activity["TotalMinutesAsleep"] # independent variable
-    y = data_sleep_and_activity["ActiveMinutes"] # dependent variable
-
-    X = sm.add_constant(X)
-
-    model = sm.OLS(y, X).fit()
-
-    print(model.summary())
+    print(model)
 
     plt.figure(figsize=(10, 6))
     plt.scatter(data_sleep_and_activity["TotalMinutesAsleep"], data_sleep_and_activity["ActiveMinutes"], color="skyblue", label="Data points")
-    plt.plot(data_sleep_and_activity["TotalMinutesAsleep"], model.predict(X), color="red", label="Regression line")
+    plt.plot(data_sleep_and_activity["TotalMinutesAsleep"], regression.predict(model, data_sleep_and_activity), color="red", label="Regression line")
     plt.xlabel("Minutes Slept")
     plt.ylabel("Active Minutes")
     plt.title(f"Linear Relationship between Active Minutes and Minutes Slept for User {user_id}")
@@ -279,39 +222,23 @@ def compare_activity_and_sleep(user_id, dates):
 
     return filtered_data
 
-compare_activity_and_sleep(None, ['03/12/2016', '03/13/2016', '03/14/2016', '03/15/2016', '03/16/2016', '03/17/2016', '03/18/2016', '03/19/2016', '03/20/2016', '03/21/2016', '03/22/2016', '03/23/2016', '03/24/2016', '03/25/2016', '03/26/2016', '03/27/2016', '03/28/2016', '03/29/2016', '03/30/2016', '03/31/2016', '04/01/2016', '04/02/2016', '04/03/2016', '04/04/2016', '04/05/2016', '04/06/2016', '04/07/2016', '04/08/2016', '04/09/2016', '04/10/2016', '04/11/2016', '04/12/2016'])
-
 # Step 5: analyse the relationship between sedentary activity and sleep duration
+@instrumentation.timed()
+@caching.cached
 def compare_sedentary_activity_and_sleep(dates):
     dates = pd.to_datetime(dates, format='%m/%d/%Y')
 
-    df_sleep = compute_sleep_on_day(None)
-
-    con = sqlite3.connect("data/cleaned_fitbit.db")
-    cur = con.cursor()
-
-    cur.execute("SELECT Id, ActivityDate, SedentaryMinutes FROM daily_activity")
-    rows = cur.fetchall()
-    df_activity = pd.DataFrame(rows, columns=[x[0] for x in cur.description])
+    df_merged = sleep_and_activity("SedentaryMinutes")
 
-    con.close()
+    filtered_data = df_merged[df_merged["date"].isin(dates)]
 
-    df_activity["ActivityDate"] = pd.to_datetime(df_activity["ActivityDate"]).dt.date
-    df_activity.rename(columns={"ActivityDate": "date"}, inplace=True)
+    # TotalMinutesAsleep is the response variable, SedentaryMinutes the explanatory variable
+    model = regression.fit(df_merged, "TotalMinutesAsleep", "SedentaryMinutes")
 
-    df_merged = pd.merge(df_activity, df_sleep, on=["Id", "date"], how="inner")
+    print(model)
 
-    filtered_data = df_merged[df_merged["date"].isin(dates.date)]
-
-    X = df_merged["SedentaryMinutes"] # explanatory variable
-    y = df_merged["TotalMinutesAsleep"] # response variable
-
-    X = sm.add_constant(X)  
-    model = sm.OLS(y, X).fit()
-
-    print(model.summary())
-
-    residuals = model.resid
+    fitted = regression.predict(model, df_merged)
+    residuals = df_merged["TotalMinutesAsleep"] - fitted
 
     plt.figure(figsize=(6,5))
     correlation_matrix = df_merged[['SedentaryMinutes', 'TotalMinutesAsleep']].corr()
@@ -321,7 +248,7 @@ def compare_sedentary_activity_and_sleep(dates):
 
     plt.figure(figsize=(8,6))
     sns.scatterplot(x=df_merged["SedentaryMinutes"], y=df_merged["TotalMinutesAsleep"], alpha=0.5)
-    plt.plot(df_merged["SedentaryMinutes"], model.predict(X), color="red", linewidth=2)
+    plt.plot(df_merged["SedentaryMinutes"], fitted, color="red", linewidth=2)
     plt.xlabel("Sedentary Minutes")
     plt.ylabel("Total Sleep Minutes")
     plt.title("Linear Regression: Sedentary Minutes vs. Sleep Duration")
@@ -357,21 +284,13 @@ def categorize_time(hour):
         return "20-24"
 
 def compute_block_averages():
-    cur.execute("SELECT Id, ActivityHour, StepTotal FROM hourly_steps")
-    rows = cur.fetchall()
-    df_steps = pd.DataFrame(rows, columns=[x[0] for x in cur.description])
-
-    cur.execute("SELECT Id, ActivityHour, Calories FROM hourly_calories")
-    rows = cur.fetchall()
-    df_calories = pd.DataFrame(rows, columns=[x[0] for x in cur.description])
+    df_steps = database.query("SELECT Id, ActivityHour, StepTotal FROM hourly_steps")
+    df_calories = database.query("SELECT Id, ActivityHour, Calories FROM hourly_calories")
+    df_sleep = database.query("SELECT Id, date, value AS MinutesAsleep FROM minute_sleep")
 
-    cur.execute("SELECT Id, date, value AS MinutesAsleep FROM minute_sleep")
-    rows = cur.fetchall()
-    df_sleep = pd.DataFrame(rows, columns=[x[0] for x in cur.description])
-
-    df_steps["ActivityHour"] = pd.to_datetime(df_steps["ActivityHour"], format="%m/%d/%Y %I:%M:%S %p")
-    df_calories["ActivityHour"] = pd.to_datetime(df_calories["ActivityHour"], format="%m/%d/%Y %I:%M:%S %p")
-    df_sleep["date"] = pd.to_datetime(df_sleep["date"], format="%m/%d/%Y %I:%M:%S %p")  
+    df_steps["ActivityHour"] = timestamps.parse_timestamps(df_steps["ActivityHour"])
+    df_calories["ActivityHour"] = timestamps.parse_timestamps(df_calories["ActivityHour"])
+    df_sleep["date"] = timestamps.parse_timestamps(df_sleep["date"])  
 
     df_steps["TimeBlock"] = df_steps["ActivityHour"].dt.hour.apply(categorize_time)
     df_calories["TimeBlock"] = df_calories["ActivityHour"].dt.hour.apply(categorize_time)
@@ -402,12 +321,10 @@ def compute_block_averages():
 # Indicate when given user_id is missing in either heart_rate or hourly_intensity
 def plot_heart_rate_intensity(user_id):
     # Find all unique heart_rate_ids with query
-    cur.execute("SELECT DISTINCT Id FROM heart_rate")
-    heart_rate_ids = set(int(row[0]) for row in cur.fetchall())
+    heart_rate_ids = set(database.query("SELECT DISTINCT Id FROM heart_rate")["Id"].astype(int))
     
     # Find all unique intensity_ids with query
-    cur.execute("SELECT DISTINCT Id FROM hourly_intensity")
-    intensity_ids = set(int(row[0]) for row in cur.fetchall())
+    intensity_ids = set(database.query("SELECT DISTINCT Id FROM hourly_intensity")["Id"].astype(int))
     
     # Case 1: user_id missing in both tables
     if user_id not in heart_rate_ids and user_id not in intensity_ids:
@@ -423,16 +340,11 @@ def plot_heart_rate_intensity(user_id):
         return
     
     # Fetch heart rate data
-    cur.execute(f"SELECT Time, Value FROM heart_rate WHERE Id = ?", (user_id,))
-    heart_rate_rows = cur.fetchall()
-    heart_rate_df = pd.DataFrame(heart_rate_rows, columns=["Time", "Value"])
-    heart_rate_df["Time"] = pd.to_datetime(heart_rate_df["Time"], format="%m/%d/%Y %I:%M:%S %p")
+    heart_rate_df = arrow_cache.load("heart_rate", ["Time", "Value"], user=user_id)
     
     # Fetch intensity data
-    cur.execute(f"SELECT ActivityHour, TotalIntensity FROM hourly_intensity WHERE Id = ?", (user_id,))
-    intensity_rows = cur.fetchall()
-    intensity_df = pd.DataFrame(intensity_rows, columns=["ActivityHour", "TotalIntensity"])
-    intensity_df["ActivityHour"] = pd.to_datetime(intensity_df["ActivityHour"], format="%m/%d/%Y %I:%M:%S %p")
+    intensity_df = database.query("SELECT ActivityHour, TotalIntensity FROM hourly_intensity WHERE Id = ?", (user_id,))
+    intensity_df["ActivityHour"] = timestamps.parse_timestamps(intensity_df["ActivityHour"])
 
     # Find the overlapping time range
     min_time = max(heart_rate_df["Time"].min(), intensity_df["ActivityHour"].min())
@@ -469,10 +381,10 @@ def plot_heart_rate_intensity(user_id):
 
 # Part 8: Fetch weather information with API and visualize relation between weather factors and activity of individuals
 def visualize_weather_activity():
-    # Fetch unique dates from daily_activity
-    cur.execute("SELECT DISTINCT ActivityDate FROM daily_activity")
-    unique_dates = [row[0] for row in cur.fetchall()]
-    unique_dates = pd.to_datetime(unique_dates, format='%m/%d/%Y')
+    # Average activity over all users per day, next to the weather of that day, from the feature store
+    activity_columns = ["TotalSteps", "VeryActiveMinutes", "FairlyActiveMinutes", "LightlyActiveMinutes", "SedentaryMinutes", "Calories"]
+    df_features = feature_store.daily(activity_columns + ["temp", "precip", "icon"]).dropna(subset=["TotalSteps"])
+    unique_dates = df_features["date"].drop_duplicates()
     
     # start_date = unique_dates.min().strftime('%Y-%m-%d')
     # end_date = unique_dates.max().strftime('%Y-%m-%d')
@@ -492,25 +404,10 @@ def visualize_weather_activity():
     # df_weather["datetime"] = pd.to_datetime(df_weather["datetime"])
     # df_filtered_weather = df_weather[df_weather["datetime"].isin(unique_dates)]
     
-    weather_file = "data/weather_Chicago.csv"
-    df_weather = pd.read_csv(weather_file)
-    df_weather["datetime"] = pd.to_datetime(df_weather["datetime"])
-    df_filtered_weather = df_weather[df_weather["datetime"].isin(unique_dates)]
-    
-    cur.execute("""
-        SELECT ActivityDate, 
-            AVG(TotalSteps) AS TotalSteps,
-            AVG(VeryActiveMinutes) AS VeryActiveMinutes, 
-            AVG(FairlyActiveMinutes) AS FairlyActiveMinutes, 
-            AVG(LightlyActiveMinutes) AS LightlyActiveMinutes, 
-            AVG(SedentaryMinutes) AS SedentaryMinutes,
-            AVG(Calories) AS Calories
-        FROM daily_activity
-        GROUP BY ActivityDate;
-    """)
-    df_activity = pd.DataFrame(cur.fetchall(), columns=["ActivityDate", "TotalSteps", "VeryActiveMinutes", "FairlyActiveMinutes", "LightlyActiveMinutes", "SedentaryMinutes", "Calories"])
-    df_activity["ActivityDate"] = pd.to_datetime(df_activity["ActivityDate"])
-    df_merged = df_activity.merge(df_filtered_weather, left_on="ActivityDate", right_on="datetime")
+    df_merged = df_features.groupby("date", as_index=False).agg(
+        **{column: (column, "mean") for column in activity_columns},
+        temp=("temp", "first"), precip=("precip", "first"), icon=("icon", "first"))
+    df_merged = df_merged.dropna(subset=["icon"])
     
     # Display effect of weather condition on activity
     fig, axes = plt.subplots(2, 2, figsize=(15, 9))
@@ -558,6 +455,9 @@ def visualize_weather_activity():
         ("precip", "Calories", "brown", "Precipitation (mm)", "Calories Burnt"),
     ]
     
+    # Fit the OLS regression models of all six pairs at once
+    models = regression.fit_pairs(df_merged, [(x_col, y_col) for x_col, y_col, *_ in scatter_plots])
+
     fig, axes = plt.subplots(2, 3, figsize=(18, 9))
 
     for idx, (x_col, y_col, color, x_label, y_label) in enumerate(scatter_plots):
@@ -565,18 +465,15 @@ def visualize_weather_activity():
         
         ax.scatter(df_merged[x_col], df_merged[y_col], color=color, alpha=0.6, label = "Data points")
 
-        # Fit OLS regression model
-        X = sm.add_constant(df_merged[x_col])
-        y = df_merged[y_col]
-        model = sm.OLS(y, X).fit()
+        model = models.iloc[idx]
         
         # Print regression summary
         print(f"<Regression Summary for {y_col} vs {x_col}>\n")
-        print(model.summary())
+        print(model.to_string())
         print("\n------------------------------------------------------------------------------\n")
         
         x_range = np.linspace(df_merged[x_col].min(), df_merged[x_col].max(), 100)
-        y_pred = model.predict(sm.add_constant(x_range))
+        y_pred = model["intercept"] + model["slope"] * x_range
 
         ax.plot(x_range, y_pred, color="darkgrey", label="Regression line")
         
@@ -589,4 +486,8 @@ def visualize_weather_activity():
     plt.tight_layout()
     plt.show()
     
-# visualize_weather_activity()
\ No newline at end of file
+# visualize_weather_activity()
+
+if __name__ == "__main__":
+    create_new_dataframe()
+    compare_activity_and_sleep(None, ['03/12/2016', '03/13/2016', '03/14/2016', '03/15/2016', '03/16/2016', '03/17/2016', '03/18/2016', '03/19/2016', '03/20/2016', '03/21/2016', '03/22/2016', '03/23/2016', '03/24/2016', '03/25/2016', '03/26/2016', '03/27/2016', '03/28/2016', '03/29/2016', '03/30/2016', '03/31/2016', '04/01/2016', '04/02/2016', '04/03/2016', '04/04/2016', '04/05/2016', '04/06/2016', '04/07/2016', '04/08/2016', '04/09/2016', '04/10/2016', '04/11/2016', '04/12/2016'])
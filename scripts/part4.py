@@ -1,16 +1,11 @@
 # IMPORTS
-import sqlite3
-import pandas as pd
 import random
 from scipy.stats import bernoulli
 import matplotlib.pyplot as plt
 import seaborn as sns
+import feature_store
 
-# connect to database
-con = sqlite3.connect("data/cleaned_fitbit.db")
-cur = con.cursor()
-
-# Step 1: look for missing values in the weight_log and resolve them
+# Step 1: look for missing values in the weight_log and resolve them, done by clean_weight_log of cleaning_fitbit_database
 # gender_users = {}
 # age_users = {}
 
@@ -40,64 +35,19 @@ cur = con.cursor()
     
 #     return gender_users[user]
 
-
-def resolve_missing_values_weight_log():
-    # the following query was run once, to remove the Fat column from the weight_log table (as there were only 2 values and no "good" way to fill them in)
-    # cur.execute("ALTER TABLE weight_log DROP COLUMN Fat")
-    # con.commit()
-
-    weights = cur.execute("SELECT * FROM weight_log")
-    rows = weights.fetchall()
-    df = pd.DataFrame(rows, columns = [x[0] for x in cur.description])
-
-    corrected_df = df.copy()
-
-    if corrected_df["WeightKg"].isnull().sum() > 0:
-        # 1 kg = 2.20462262 pounds
-        corrected_df["WeightKg"] = corrected_df.apply(lambda row: (row["WeightPounds"] / 2.20462262) if pd.isnull(row["WeightKg"]) else row["WeightKg"], axis=1)
-
-        # corrects the values in the database itself
-        for index, row in df.iterrows():
-            if pd.isnull(row["WeightKg"]):
-                print(row["WeightKg"])
-                update_query = "UPDATE weight_log SET WeightKg = ? WHERE Id = ? AND Date = ?"
-
-                cur.execute(update_query, (corrected_df.at[index, "WeightKg"], row["Id"], row["Date"]))
-        
-        con.commit()
-
-    # if df["Fat"].isnull().sum() > 0:
-    #     df["Fat"] = df.apply(lambda row: ((row["BMI"] * 1.2) + (0.23 * sample_random_age(row["Id"])) - (5.4 if sample_random_gender(row["Id"]) == "F" else 16.2)) if pd.isnull(row["Fat"]) else row["Fat"], axis=1)
-
-    return corrected_df
-
-print(resolve_missing_values_weight_log())
+# def fill_fat(df):
+#     if df["Fat"].isnull().sum() > 0:
+#         df["Fat"] = df.apply(lambda row: ((row["BMI"] * 1.2) + (0.23 * sample_random_age(row["Id"])) - (5.4 if sample_random_gender(row["Id"]) == "F" else 16.2)) if pd.isnull(row["Fat"]) else row["Fat"], axis=1)
 
 # Step 2: check correlation between weight and calories
 def check_correlation_weight_calories():
-    query = "SELECT Id, ActivityDate, Calories FROM daily_activity"
-
-    cur.execute(query)
-    rows = cur.fetchall()
-    daily_activity = pd.DataFrame(rows, columns=[desc[0] for desc in cur.description])
-    weight_log = resolve_missing_values_weight_log().loc[:,["Id", "Date", "WeightKg"]]
-    
-    weight_log["Date"] = pd.to_datetime(weight_log["Date"], format="%m/%d/%Y %I:%M:%S %p")
-    weight_log["Date"] = weight_log["Date"].dt.date
-    daily_activity["ActivityDate"] = pd.to_datetime(daily_activity["ActivityDate"]).dt.date
-    merged_df = pd.merge(daily_activity, weight_log, left_on=["Id", "ActivityDate"], right_on=["Id", "Date"], how="left")
-    merged_df = merged_df.drop(columns=["Date"])
-
-    # Forward fill the weight after it is first available
-    merged_df["WeightKg"] = merged_df.groupby("Id")["WeightKg"].ffill()
-
-    merged_df = merged_df.dropna(subset=["WeightKg"])
+    # The feature store holds the calories of every day next to the last weight logged on or before it
+    merged_df = feature_store.daily(["Calories", "WeightKg"])
+    merged_df = merged_df.dropna(subset=["Calories", "WeightKg"])
     merged_df["Id"] = merged_df["Id"].astype(int)
 
     #plot scatterplot and calculate correlation
     # plot_scatterplot_calculate_correlation(merged_df)
-    # print(f"Number of unique users: {daily_activity['Id'].nunique()}")
-    # print(f"Number of unique users: {weight_log['Id'].nunique()}")
     # print(f"Number of unique users: {merged_df['Id'].nunique()}")
 
 
@@ -1,60 +1,57 @@
 # IMPORTS
-import sqlite3
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-connect = "data/cleaned_fitbit.db"
+import database
+import caching
+import instrumentation
+import arrow_cache
+import timestamps
+import feature_store
+
+# Daily activity columns summarized for the metric row and the boxplots of the General Analysis page
+SUMMARY_COLUMNS = ["TotalSteps", "Calories", "TotalDistance", "TotalActiveMinutes", "SedentaryMinutes"]
+
+@instrumentation.timed()
+@caching.cached
+def daily_activity_summary(dates):
+    # Load daily_activity once for the dates and describe every summarized column in one pass:
+    # returns the filtered frame, its count/mean/std/min/quartiles/max per column and the number of users
+    dates = pd.to_datetime(dates, format='%m/%d/%Y')
+    clause, params = database.where("ts", dates)
+    daily_activity = database.query("SELECT * FROM daily_activity" + clause, params)
 
-def retrieve_average(category, dates):
+    daily_activity["TotalActiveMinutes"] = (daily_activity["VeryActiveMinutes"] +
+                                            daily_activity["FairlyActiveMinutes"] +
+                                            daily_activity["LightlyActiveMinutes"])
 
-    dates = pd.to_datetime(dates, format='%m/%d/%Y')
-    con = sqlite3.connect(connect)
-    cur = con.cursor()
-    query = "SELECT Id, ActivityDate, TotalSteps, Calories, TotalDistance, VeryActiveMinutes, FairlyActiveMinutes, LightlyActiveMinutes, SedentaryMinutes FROM daily_activity" 
+    summary = daily_activity[SUMMARY_COLUMNS].astype(float).describe()
 
-    cur.execute(query) 
-    rows = cur.fetchall()
-    daily_activity = pd.DataFrame(rows, columns=[desc[0] for desc in cur.description]) 
+    return daily_activity, summary, daily_activity["Id"].nunique()
 
-    daily_activity["ActivityDate"] = pd.to_datetime(daily_activity["ActivityDate"])
-    daily_activity = daily_activity.loc[(daily_activity["ActivityDate"].isin(dates))]
+def retrieve_average(category, dates):
+    daily_activity, summary, users = daily_activity_summary(dates)
 
-    con.close()
     # If no data is found, return 0
     if daily_activity.empty:
         return 0  
         
     if category == "total_users":
-        return daily_activity["Id"].nunique()
-    elif category == "TotalSteps":
-        return f"{daily_activity.loc[:, "TotalSteps"].mean():.0f}"
-    elif category == "Calories":
-        return f"{daily_activity.loc[:, "Calories"].mean():.0f}"
+        return users
     elif category == "TotalDistance":
-        return f"{daily_activity.loc[:, "TotalDistance"].mean():.2f}"
+        return f"{summary.loc['mean', 'TotalDistance']:.2f}"
     elif category == "ActiveMinutes":
-        daily_activity["TotalActiveMinutes"] = (daily_activity["VeryActiveMinutes"] + 
-                                                daily_activity["FairlyActiveMinutes"] + 
-                                                daily_activity["LightlyActiveMinutes"])
-        return f"{daily_activity.loc[:, "TotalActiveMinutes"].mean():.0f}"
-    elif category == "SedentaryMinutes":
-        return f"{daily_activity.loc[:, "SedentaryMinutes"].mean():.0f}"
+        return f"{summary.loc['mean', 'TotalActiveMinutes']:.0f}"
+    elif category in SUMMARY_COLUMNS:
+        return f"{summary.loc['mean', category]:.0f}"
     
 
+@instrumentation.timed()
+@caching.cached
 def activity_sum_data(dates):
     dates = pd.to_datetime(dates, format='%m/%d/%Y')
 
-    con = sqlite3.connect(connect)
-    cur = con.cursor()
-    query = "SELECT ActivityDate, VeryActiveMinutes, FairlyActiveMinutes, LightlyActiveMinutes, SedentaryMinutes FROM daily_activity"
-    cur.execute(query) 
-    rows = cur.fetchall()
-    data = pd.DataFrame(rows, columns=[desc[0] for desc in cur.description]) 
-
-    data["ActivityDate"] = pd.to_datetime(data["ActivityDate"])
-    filtered_data = data.loc[data["ActivityDate"].isin(dates)]
-    
+    clause, params = database.where("ts", dates)
+    query = "SELECT ActivityDate, VeryActiveMinutes, FairlyActiveMinutes, LightlyActiveMinutes, SedentaryMinutes FROM daily_activity" + clause
+    filtered_data = database.query(query, params)
 
     minutes = {
         "Very Active": filtered_data["VeryActiveMinutes"].mean(),
@@ -66,112 +63,90 @@ def activity_sum_data(dates):
     df = pd.DataFrame(list(minutes.items()), columns=['Activity', 'Minutes'])
     return df
 
+@instrumentation.timed()
+@caching.cached
 def average_steps_per_hour(dates):
     dates = pd.to_datetime(dates, format='%m/%d/%Y')
-    con = sqlite3.connect(connect)
-    cur = con.cursor()
-    query ="SELECT ActivityHour, StepTotal FROM hourly_steps"
-    cur.execute(query) 
-    rows = cur.fetchall()
-    data = pd.DataFrame(rows, columns=[desc[0] for desc in cur.description]) 
-    data["ActivityHour"] = pd.to_datetime(data["ActivityHour"], format="%m/%d/%Y %I:%M:%S %p")
-    filtered_data = data[data["ActivityHour"].dt.date.isin(dates.date)]
+    clause, params = database.where("ts", dates)
+    query ="SELECT ActivityHour, StepTotal FROM hourly_steps" + clause
+    filtered_data = database.query(query, params)
+    filtered_data["ActivityHour"] = timestamps.parse_timestamps(filtered_data["ActivityHour"])
 
     # Extract the hour part from ActivityHour, group and calculate average
     filtered_data["Hour"] = filtered_data["ActivityHour"].dt.hour
     hourly_avg = filtered_data.groupby("Hour")["StepTotal"].mean().reset_index()
-    con.close()
     
     return hourly_avg
 
-def average_heart_rate_per_hour():
-    con = sqlite3.connect(connect)
-    cur = con.cursor()
-
-    query = "SELECT Time, Value FROM heart_rate"
-    cur.execute(query) 
-    rows = cur.fetchall()
-
-    data = pd.DataFrame(rows, columns=[desc[0] for desc in cur.description])
-    data["Time"] = pd.to_datetime(data["Time"], format="%m/%d/%Y %I:%M:%S %p")
-    data["Day"] = data["Time"].dt.date
-    data["Hour"] = data["Time"].dt.hour 
-
-    # Group by the hour and calculate the average heart rate
-    data_avg = data.groupby(["Day", "Hour"], as_index=False)["Value"].mean().reset_index()
-    
-    con.close()
+@instrumentation.timed()
+@caching.cached
+def average_heart_rate_per_hour(dates=None):
+    # Combine the per user hourly rollup into the average heart rate per day and hour
+    clause, params = database.where("ts", dates)
+    query = f"""
+    SELECT ts - ts % 86400 AS Day, Hour, SUM(AvgValue * ValueCount) / SUM(ValueCount) AS Value
+    FROM heart_rate_hourly{clause}
+    GROUP BY Day, Hour
+    """
+    data_avg = database.query(query, params)
+    data_avg["Day"] = pd.to_datetime(data_avg["Day"], unit="s")
     
     return data_avg
 
-heart_rates = average_heart_rate_per_hour()
-
+@instrumentation.timed()
+@caching.cached
 def hourly_average_heart_rate_dates(dates):
     dates = pd.to_datetime(dates, format='%m/%d/%Y')
 
-    filtered_data = heart_rates[heart_rates["Day"].isin(dates.date)]
+    # only the selected days are read from the heart_rate_hourly rollup
+    filtered_data = average_heart_rate_per_hour(dates)
 
     data_avg = filtered_data.groupby(["Hour"], as_index=False)["Value"].mean().reset_index()    
 
     return data_avg
 
+@instrumentation.timed()
+@caching.cached
 def hourly_average_calories(dates):
-    con = sqlite3.connect(connect)
-    cur = con.cursor()
-    query = "SELECT ActivityHour, Calories FROM hourly_calories"
-    cur.execute(query) 
-    rows = cur.fetchall()
-    data = pd.DataFrame(rows, columns=[desc[0] for desc in cur.description]) 
     dates = pd.to_datetime(dates, format='%m/%d/%Y')
-    data["ActivityHour"] = pd.to_datetime(data["ActivityHour"], format="%m/%d/%Y %I:%M:%S %p")
-    filtered_data = data[data["ActivityHour"].dt.date.isin(dates.date)]
+    clause, params = database.where("ts", dates)
+    query = "SELECT ActivityHour, Calories FROM hourly_calories" + clause
+    filtered_data = database.query(query, params)
+    filtered_data["ActivityHour"] = timestamps.parse_timestamps(filtered_data["ActivityHour"])
 
     # Extract the hour part from ActivityHour, group and calculate average
     filtered_data["Hour"] = filtered_data["ActivityHour"].dt.hour
     hourly_avg = filtered_data.groupby("Hour")["Calories"].mean().reset_index()
-    con.close()
 
     return hourly_avg
 
+@instrumentation.timed()
+@caching.cached
 def heart_rate_and_intensitivity(dates):
-    # Connect to the database
-    conn = sqlite3.connect(connect)
-    cur = conn.cursor()
     dates = pd.to_datetime(dates, format='%m/%d/%Y')
     # Fetch heart rate data and compute hourly average
-    cur.execute("SELECT Time, Value FROM heart_rate")
-    heart_rate_rows = cur.fetchall()
-    heart_rate_df = pd.DataFrame(heart_rate_rows, columns=["Time", "HeartRate"])
-    heart_rate_df["Time"] = pd.to_datetime(heart_rate_df["Time"], format="%m/%d/%Y %I:%M:%S %p")
-    filtered_heart_rate_data = heart_rate_df[heart_rate_df["Time"].dt.date.isin(dates.date)]
-    filtered_heart_rate_data["Hour"] = filtered_heart_rate_data["Time"].dt.hour
-    avg_heart_rate = filtered_heart_rate_data.groupby("Hour")["HeartRate"].mean().reset_index()
+    clause, params = database.where("ts", dates)
+    avg_heart_rate = database.query(f"SELECT Hour, SUM(AvgValue * ValueCount) / SUM(ValueCount) AS HeartRate FROM heart_rate_hourly{clause} GROUP BY Hour", params)
     
     # Fetch intensity data and compute hourly average
-    cur.execute("SELECT ActivityHour, TotalIntensity FROM hourly_intensity")
-    intensity_rows = cur.fetchall()
-    intensity_df = pd.DataFrame(intensity_rows, columns=["ActivityHour", "TotalIntensity"])
-    intensity_df["ActivityHour"] = pd.to_datetime(intensity_df["ActivityHour"], format="%m/%d/%Y %I:%M:%S %p")
-    filtered_intensitivity_data = intensity_df[intensity_df["ActivityHour"].dt.date.isin(dates.date)]
+    clause, params = database.where("ts", dates)
+    filtered_intensitivity_data = database.query("SELECT ActivityHour, TotalIntensity FROM hourly_intensity" + clause, params)
+    filtered_intensitivity_data["ActivityHour"] = timestamps.parse_timestamps(filtered_intensitivity_data["ActivityHour"])
     filtered_intensitivity_data["Hour"] = filtered_intensitivity_data["ActivityHour"].dt.hour
     avg_intensity = filtered_intensitivity_data.groupby("Hour")["TotalIntensity"].mean().reset_index()
     
     merged_df = pd.merge(avg_heart_rate, avg_intensity, on="Hour")
     
-    conn.close()
     return merged_df
 
 
+@instrumentation.timed()
+@caching.cached
 def calories_and_active_minutes(dates):
-    conn = sqlite3.connect(connect)
-    cur = conn.cursor()
     dates = pd.to_datetime(dates, format='%m/%d/%Y')
-    query = "SELECT ActivityDate, VeryActiveMinutes, FairlyActiveMinutes, LightlyActiveMinutes, Calories FROM daily_activity"
-    cur.execute(query) 
-    data = cur.fetchall()
-    data = pd.DataFrame(data, columns=[desc[0] for desc in cur.description]) 
-    data["ActivityDate"] = pd.to_datetime(data["ActivityDate"])
-    filtered_data = data.loc[data["ActivityDate"].isin(dates)]
+    clause, params = database.where("ts", dates)
+    query = "SELECT ActivityDate, VeryActiveMinutes, FairlyActiveMinutes, LightlyActiveMinutes, Calories FROM daily_activity" + clause
+    filtered_data = database.query(query, params)
     filtered_data["TotalActiveMinutes"] = (
         filtered_data["VeryActiveMinutes"] + 
         filtered_data["FairlyActiveMinutes"] + 
@@ -179,205 +154,125 @@ def calories_and_active_minutes(dates):
     )
     scatter_data = filtered_data[["TotalActiveMinutes", "Calories"]]
 
-    conn.close()
-    
     return scatter_data
 
 ## NOT SURE IF USEFUL
+@instrumentation.timed()
+@caching.cached
 def heart_rate_and_sleep_value(dates):
-    conn = sqlite3.connect(connect)
-    cur = conn.cursor()
     dates = pd.to_datetime(dates, format='%m/%d/%Y')
 
-    cur.execute("SELECT Time, Value, Id FROM heart_rate")
-    heart_rate_rows = cur.fetchall()
-    heart_rate_df = pd.DataFrame(heart_rate_rows, columns=["Time", "HeartRate", "Id"])
-    heart_rate_df["Time"] = pd.to_datetime(heart_rate_df["Time"], format="%m/%d/%Y %I:%M:%S %p")
+    filtered_heart_rate_data = arrow_cache.load("heart_rate", ["Time", "Value", "Id"], dates)
+    filtered_heart_rate_data.rename(columns={"Value": "HeartRate"}, inplace=True)
 
-    filtered_heart_rate_data = heart_rate_df[heart_rate_df["Time"].dt.date.isin(dates.date)]
     filtered_heart_rate_data["Minute"] = filtered_heart_rate_data["Time"].dt.floor("min")
     avg_heart_rate = filtered_heart_rate_data.groupby(["Minute", "Id"])["HeartRate"].mean().reset_index()
 
-    cur.execute("SELECT date, value, Id FROM minute_sleep")
-    sleep_rows = cur.fetchall()
-    sleep_df = pd.DataFrame(sleep_rows, columns=["Minute", "SleepValue", "Id"])
-    sleep_df["Minute"] = pd.to_datetime(sleep_df["Minute"], format="%m/%d/%Y %I:%M:%S %p")
-
-    sleep_df = sleep_df[sleep_df["Minute"].dt.date.isin(dates.date)]
+    sleep_df = arrow_cache.load("minute_sleep", ["date", "value", "Id"], dates)
+    sleep_df.rename(columns={"date": "Minute", "value": "SleepValue"}, inplace=True)
     merged_df = pd.merge(avg_heart_rate, sleep_df, on=["Id", "Minute"])
 
-    conn.close()
     return merged_df
 
+@instrumentation.timed()
+@caching.cached
 def average_distance_per_week(dates):
-    conn = sqlite3.connect(connect)
-    cur = conn.cursor()
     dates = pd.to_datetime(dates, format='%m/%d/%Y')
-    query = "SELECT ActivityDate, TotalDistance FROM daily_activity"
-    cur.execute(query) 
-    data = cur.fetchall()
-    data = pd.DataFrame(data, columns=[desc[0] for desc in cur.description]) 
-    data["ActivityDate"] = pd.to_datetime(data["ActivityDate"]).dt.normalize()
-    filtered_data = data.loc[data["ActivityDate"].isin(dates)]
+    clause, params = database.where("ts", dates)
+    query = "SELECT ActivityDate, TotalDistance FROM daily_activity" + clause
+    filtered_data = database.query(query, params)
+    filtered_data["ActivityDate"] = timestamps.parse_dates(filtered_data["ActivityDate"]).dt.normalize()
     filtered_data["DayOfWeek"] = filtered_data["ActivityDate"].dt.weekday
     filtered_data_avr = filtered_data.groupby("DayOfWeek")["TotalDistance"].mean().reset_index()
-    conn.close()
     return filtered_data_avr
 
+@instrumentation.timed()
+@caching.cached
 def average_steps_per_week(dates):
-    conn = sqlite3.connect(connect)
-    cur = conn.cursor()
     dates = pd.to_datetime(dates, format='%m/%d/%Y')
-    query = "SELECT ActivityDate, TotalSteps FROM daily_activity"
-    cur.execute(query) 
-    data = cur.fetchall()
-    data = pd.DataFrame(data, columns=[desc[0] for desc in cur.description]) 
-    data["ActivityDate"] = pd.to_datetime(data["ActivityDate"]).dt.normalize()
-    filtered_data = data.loc[data["ActivityDate"].isin(dates)]
+    clause, params = database.where("ts", dates)
+    query = "SELECT ActivityDate, TotalSteps FROM daily_activity" + clause
+    filtered_data = database.query(query, params)
+    filtered_data["ActivityDate"] = timestamps.parse_dates(filtered_data["ActivityDate"]).dt.normalize()
     filtered_data["DayOfWeek"] = filtered_data["ActivityDate"].dt.weekday
     filtered_data_avr = filtered_data.groupby("DayOfWeek")["TotalSteps"].mean().reset_index()
 
-    conn.close()
     return filtered_data_avr
 
+@instrumentation.timed()
+@caching.cached
 def average_calories_per_week(dates):
-    conn = sqlite3.connect(connect)
-    cur = conn.cursor()
     dates = pd.to_datetime(dates, format='%m/%d/%Y')
-    query = "SELECT ActivityDate, Calories FROM daily_activity"
-    cur.execute(query) 
-    data = cur.fetchall()
-    data = pd.DataFrame(data, columns=[desc[0] for desc in cur.description]) 
-    data["ActivityDate"] = pd.to_datetime(data["ActivityDate"]).dt.normalize()
-    filtered_data = data.loc[data["ActivityDate"].isin(dates)]
+    clause, params = database.where("ts", dates)
+    query = "SELECT ActivityDate, Calories FROM daily_activity" + clause
+    filtered_data = database.query(query, params)
+    filtered_data["ActivityDate"] = timestamps.parse_dates(filtered_data["ActivityDate"]).dt.normalize()
     filtered_data["DayOfWeek"] = filtered_data["ActivityDate"].dt.weekday
     filtered_data_avr = filtered_data.groupby("DayOfWeek")["Calories"].mean().reset_index()
-    conn.close()
     return filtered_data_avr
 
+@instrumentation.timed()
+@caching.cached
 def average_active_minutes_per_week(dates):
-    conn = sqlite3.connect(connect)
-    cur = conn.cursor()
     dates = pd.to_datetime(dates, format='%m/%d/%Y')
-    query = "SELECT ActivityDate, Calories, VeryActiveMinutes, FairlyActiveMinutes, LightlyActiveMinutes FROM daily_activity"
-    cur.execute(query) 
-    data = cur.fetchall()
-    data = pd.DataFrame(data, columns=[desc[0] for desc in cur.description]) 
-    data["ActivityDate"] = pd.to_datetime(data["ActivityDate"]).dt.normalize()
-
-    filtered_data = data.loc[data["ActivityDate"].isin(dates)]
+    clause, params = database.where("ts", dates)
+    query = "SELECT ActivityDate, Calories, VeryActiveMinutes, FairlyActiveMinutes, LightlyActiveMinutes FROM daily_activity" + clause
+    filtered_data = database.query(query, params)
+    filtered_data["ActivityDate"] = timestamps.parse_dates(filtered_data["ActivityDate"]).dt.normalize()
     filtered_data["DayOfWeek"] = filtered_data["ActivityDate"].dt.weekday
     filtered_data_avr = filtered_data.groupby("DayOfWeek")[["VeryActiveMinutes", "FairlyActiveMinutes", "LightlyActiveMinutes"]].mean().reset_index()
-    conn.close()
     return filtered_data_avr
 
 # print(average_steps_per_hour(["4/4/2016", "4/5/2016", "4/6/2016"]))
 
-# weather data
-def hourly_weather_data():
-    weather = pd.read_csv("data/weather_Chicago_hourly.csv", header=0)
-
-    weather["datetime"] = pd.to_datetime(weather["datetime"])
-    weather["Hour"] = weather["datetime"].dt.hour
-    weather["Day"] = weather["datetime"].dt.weekday
-
-    return weather
-
-# hourly steps
-def compute_steps_hourly():
-    con = sqlite3.connect("data/cleaned_fitbit.db")
-    cur = con.cursor()
+# Hour ranges and day groups that can be selected in the weather plots
+HOUR_RANGES = {
+    "0-4": range(0, 4),
+    "4-8": range(4, 8),
+    "8-12": range(8, 12),
+    "12-16": range(12, 16),
+    "16-20": range(16, 20),
+    "20-24": range(20, 24)
+}
+
+DAY_RANGES = {
+    "Weekdays": range(0, 5),
+    "Weekend": range(5, 7)
+}
+
+@instrumentation.timed()
+@caching.cached
+def hourly_weather_activity(dates):
+    # Steps and intensity averaged over all users per hour of the selected dates, next to the temperature of that hour
+    dates = pd.to_datetime(dates)
 
-    steps = cur.execute(f"SELECT * FROM hourly_steps")
-    rows = steps.fetchall()
-    df = pd.DataFrame(rows, columns = [x[0] for x in cur.description])
-    con.close()
+    df = feature_store.hourly(["StepTotal", "TotalIntensity", "temp"], dates)
+    df = df.groupby("datetime", as_index=False).agg(StepTotal=("StepTotal", "mean"), TotalIntensity=("TotalIntensity", "mean"), temp=("temp", "first"))
 
-    df["ActivityHour"] = pd.to_datetime(df["ActivityHour"], format="%m/%d/%Y %I:%M:%S %p")
-    df.rename(columns={"ActivityHour": "datetime"}, inplace=True)
     df["Hour"] = df["datetime"].dt.hour
     df["Day"] = df["datetime"].dt.weekday
 
-    df = df.groupby(["datetime", "Hour", "Day"], as_index=False)["StepTotal"].mean()  
-
     return df
 
-# hourly intensity
-def compute_intensity_hourly():
-    con = sqlite3.connect("data/cleaned_fitbit.db")
-    cur = con.cursor()
+def weather_and_activity(variable, hours, days, dates):
+    # Hours of the selected hour ranges and days for which both the temperature and the variable are known
+    hours_converted = [hour for range_str in hours if range_str in HOUR_RANGES for hour in HOUR_RANGES[range_str]]
+    days_converted = [day for day_str in days if day_str in DAY_RANGES for day in DAY_RANGES[day_str]]
 
-    steps = cur.execute(f"SELECT * FROM hourly_intensity")
-    rows = steps.fetchall()
-    df = pd.DataFrame(rows, columns = [x[0] for x in cur.description])
-    con.close()
+    df = hourly_weather_activity(dates)
+    df = df[df["Hour"].isin(hours_converted) & df["Day"].isin(days_converted)]
 
-    df["ActivityHour"] = pd.to_datetime(df["ActivityHour"], format="%m/%d/%Y %I:%M:%S %p")
-    df.rename(columns={"ActivityHour": "datetime"}, inplace=True)
-    df["Hour"] = df["datetime"].dt.hour
-    df["Day"] = df["datetime"].dt.weekday
-
-    df = df.groupby(["datetime", "Hour", "Day"], as_index=False)["TotalIntensity"].mean()  
-
-    return df
-
-def create_scatterplot_weather(df1, df2, hours, days, dates):
-    dates = pd.to_datetime(dates)
-
-    hour_ranges = {
-        "0-4": range(0, 4),
-        "4-8": range(4, 8),
-        "8-12": range(8, 12),
-        "12-16": range(12, 16),
-        "16-20": range(16, 20),
-        "20-24": range(20, 24)
-    }
-
-    hours_converted = [hour for range_str in hours if range_str in hour_ranges for hour in hour_ranges[range_str]]
-
-    days_ranges = {
-        "Weekdays": range(0, 5),
-        "Weekend": range(5, 7)
-    }
-    
-    days_converted = [day for day_str in days if day_str in days_ranges for day in days_ranges[day_str]]
-
-    df_merged = pd.merge(df1, df2, on=["datetime", "Hour", "Day"], how="inner")
-    df_merged["datetime"] = pd.to_datetime(df_merged["datetime"]).dt.normalize()
-    
-    df_merged = df_merged[df_merged["Hour"].isin(hours_converted)]
-    df_merged = df_merged[df_merged["Day"].isin(days_converted)]
-    df_merged = df_merged[df_merged["datetime"].isin(dates)]
-
-    if "StepTotal" not in df_merged.columns:
-        var = "TotalIntensity"
-    else:
-        var = "StepTotal"
-
-    plt.figure(figsize=(8,6))
-    sns.scatterplot(x=df_merged["temp"], y=df_merged[var], alpha=0.5)
-    plt.title(f"Scatterplot temp vs {var}")
-    plt.show()
-
-    return df_merged
-
-hourly_weather = hourly_weather_data()
-hourly_steps = compute_steps_hourly()
-hourly_intensity = compute_intensity_hourly()
+    return df[["datetime", "Hour", "Day", "temp", variable]].dropna().reset_index(drop=True)
 
+@instrumentation.timed()
+@caching.cached
 def daily_activity(dates):
     dates = pd.to_datetime(dates, format='%m/%d/%Y')
 
-    con = sqlite3.connect("data/cleaned_fitbit.db")
-    cur = con.cursor()
+    clause, params = database.where("ts", dates)
+    df = database.query("SELECT * FROM daily_activity" + clause, params)
 
-    steps = cur.execute(f"SELECT * FROM daily_activity")
-    rows = steps.fetchall()
-    df = pd.DataFrame(rows, columns = [x[0] for x in cur.description])
-    con.close()
-
-    df["ActivityDate"] = pd.to_datetime(df["ActivityDate"])
-    df = df[df["ActivityDate"].isin(dates)]
+    df["ActivityDate"] = timestamps.parse_dates(df["ActivityDate"])
 
     very_active_distance = df.groupby(["ActivityDate"], as_index=False)["VeryActiveDistance"].mean()
     very_active_minutes = df.groupby(["ActivityDate"], as_index=False)["VeryActiveMinutes"].mean()
@@ -399,15 +294,12 @@ def categorize_weight(weight):
     else:
         return "50 - 70kg"
     
+@instrumentation.timed()
+@caching.cached
 def categorized_weight_data():
-    con = sqlite3.connect("data/cleaned_fitbit.db")
-    cur = con.cursor()
-
-    cur.execute("SELECT Id, Date, WeightKg FROM weight_log") 
-    rows = cur.fetchall()
-    data = pd.DataFrame(rows, columns = [x[0] for x in cur.description])
+    data = database.query("SELECT Id, Date, WeightKg FROM weight_log")
 
-    data["Date"] = pd.to_datetime(data["Date"]).dt.normalize()
+    data["Date"] = timestamps.parse_timestamps(data["Date"]).dt.normalize()
 
     data = data.groupby(["Id"], as_index=False)["WeightKg"].mean()
     data["CategoryWeight"] = data["WeightKg"].apply(categorize_weight)
@@ -423,104 +315,63 @@ def categorized_weight_data():
 
     return df
 
+@instrumentation.timed()
+@caching.cached
 def sleep_data(dates):
-    con = sqlite3.connect("data/cleaned_fitbit.db")
-    cur = con.cursor()
-
-    cur.execute("SELECT * FROM minute_sleep")
-    rows = cur.fetchall()
-    df_sleep = pd.DataFrame(rows, columns=[x[0] for x in cur.description])
-
-    con.close()
-
-    df_sleep["date"] = pd.to_datetime(df_sleep["date"])
-    df_sleep["Hour"] = df_sleep["date"].dt.hour
-
-    df_sleep["date"] = pd.to_datetime(df_sleep["date"]).dt.normalize()
-    df_sleep = df_sleep[df_sleep["date"].isin(dates)]
-
-    df_sleep["Hour"] = df_sleep["Hour"].astype('category')
-    df_sleep = df_sleep.groupby(["Id", "date", "Hour"], as_index=False)["value"].count().fillna(0).astype(int).reset_index()
-    df_sleep["date"] = pd.to_datetime(df_sleep["date"]).dt.normalize()
-    df_sleep["DayTotal"] = df_sleep.groupby(["Id", "date"])["value"].transform("sum")
-    df_sleep = df_sleep[df_sleep["DayTotal"] > 0]
-    df_sleep = df_sleep.reset_index(drop=True)
-    df_sleep.rename(columns={"value": "TotalMinutesAsleep"}, inplace=True)
+    clause, params = database.where("ts", dates)
+    df_sleep = database.query(f"SELECT Hour, SUM(TotalMinutesAsleep) AS TotalMinutesAsleep FROM sleep_hourly{clause} GROUP BY Hour", params)
 
-    df_sleep = df_sleep.groupby(["Hour"], as_index=False)["TotalMinutesAsleep"].mean()
+    # average minutes asleep per hour over every user and day with sleep data, hours without sleep count as 0
+    days_with_sleep = database.query(f"SELECT COUNT(*) AS Days FROM sleep_daily{clause}", params)["Days"].iloc[0]
+    df_sleep["TotalMinutesAsleep"] = df_sleep["TotalMinutesAsleep"] / days_with_sleep
 
     return df_sleep
 
+@instrumentation.timed()
+@caching.cached
 def create_dataframe_scatterplot_sleep(variable, dates):
     dates = pd.to_datetime(dates, format='%m/%d/%Y')
 
-    con = sqlite3.connect("data/cleaned_fitbit.db")
-    cur = con.cursor()
-
-    sleep_duration = cur.execute(f"SELECT * FROM minute_sleep")
-    rows = sleep_duration.fetchall()
-    sleep_df = pd.DataFrame(rows, columns = [x[0] for x in cur.description])
-
-    # converts the date column to the type datetime
-    sleep_df["date"] = pd.to_datetime(sleep_df["date"]).dt.normalize()
-    sleep_df = sleep_df.groupby(["Id", "date"], as_index=False)["value"].count()
-    sleep_df.rename(columns={"value": "TotalMinutesAsleep"}, inplace=True)
+    clause, params = database.where("ts", dates)
+    sleep_df = database.query("SELECT Id, ts AS date, TotalMinutesAsleep FROM sleep_daily" + clause, params)
 
+    # daily sums of the hourly tables come from the activity_daily rollup
     if variable == "Steps":
-        steps = cur.execute(f"SELECT * FROM hourly_steps")
-        rows = steps.fetchall()
-        other_df = pd.DataFrame(rows, columns = [x[0] for x in cur.description])
-
-        other_df["date"] = pd.to_datetime(other_df["ActivityHour"], format="%m/%d/%Y %I:%M:%S %p").dt.normalize()
-        other_df = other_df.groupby(["Id", "date"], as_index=False)["StepTotal"].sum()
+        other_df = database.query("SELECT Id, ts AS date, StepTotal FROM activity_daily" + clause, params).dropna(subset=["StepTotal"])
     elif variable == "Calories": 
-        calories = cur.execute(f"SELECT * FROM hourly_calories")
-        rows = calories.fetchall()
-        other_df = pd.DataFrame(rows, columns = [x[0] for x in cur.description])
-
-        other_df["date"] = pd.to_datetime(other_df["ActivityHour"], format="%m/%d/%Y %I:%M:%S %p").dt.normalize()
-        other_df = other_df.groupby(["Id", "date"], as_index=False)["Calories"].sum()
+        other_df = database.query("SELECT Id, ts AS date, Calories FROM activity_daily" + clause, params).dropna(subset=["Calories"])
         
-    con.close()
-
-    sleep_df["date"] = pd.to_datetime(sleep_df["date"])
-    other_df["date"] = pd.to_datetime(other_df["date"])
+    sleep_df["date"] = pd.to_datetime(sleep_df["date"], unit="s")
+    other_df["date"] = pd.to_datetime(other_df["date"], unit="s")
 
-    df_merged = pd.merge(sleep_df, other_df, on=["Id", "date"], how="inner")
-    filtered_data = df_merged.loc[df_merged["date"].isin(dates)]
+    filtered_data = pd.merge(sleep_df, other_df, on=["Id", "date"], how="inner")
 
     return filtered_data
 
+@instrumentation.timed()
+@caching.cached
 def workout_frequency_per_period(dates):
-    conn = sqlite3.connect(connect)
-    cur = conn.cursor()
     dates = pd.to_datetime(dates, format='%m/%d/%Y')
-    query = "SELECT ActivityDate, VeryActiveMinutes, FairlyActiveMinutes FROM daily_activity"
-    cur.execute(query) 
-    data = cur.fetchall()
-    data = pd.DataFrame(data, columns=[desc[0] for desc in cur.description]) 
-    data["ActivityDate"] = pd.to_datetime(data["ActivityDate"]).dt.normalize()
-    filtered_data = data.loc[data["ActivityDate"].isin(dates)]
+    clause, params = database.where("ts", dates)
+    query = "SELECT ActivityDate, VeryActiveMinutes, FairlyActiveMinutes FROM daily_activity" + clause
+    filtered_data = database.query(query, params)
+    filtered_data["ActivityDate"] = timestamps.parse_dates(filtered_data["ActivityDate"]).dt.normalize()
     filtered_data["DayOfWeek"] = filtered_data["ActivityDate"].dt.weekday
     workout_data = filtered_data[(filtered_data["VeryActiveMinutes"] > 0) | (filtered_data["FairlyActiveMinutes"] > 0)]
     workout_counts = workout_data["DayOfWeek"].value_counts().sort_index()
     filtered_data_avr = pd.DataFrame({"DayOfWeek": workout_counts.index, "WorkoutFrequency": workout_counts.values})
-    conn.close()
     return filtered_data_avr
 
-print(workout_frequency_per_period(["4/4/2016", "4/5/2016", "4/6/2016"]))
-
+@instrumentation.timed()
+@caching.cached
 def average_steps_calories_per_period(dates):
-    conn = sqlite3.connect(connect)
-    cur = conn.cursor()
     dates = pd.to_datetime(dates, format='%m/%d/%Y')
-    query = "SELECT ActivityDate, TotalSteps, Calories FROM daily_activity"
-    cur.execute(query) 
-    data = cur.fetchall()
-    data = pd.DataFrame(data, columns=[desc[0] for desc in cur.description]) 
-    data["ActivityDate"] = pd.to_datetime(data["ActivityDate"]).dt.normalize()
-    filtered_data = data.loc[data["ActivityDate"].isin(dates)]
+    clause, params = database.where("ts", dates)
+    query = "SELECT ActivityDate, TotalSteps, Calories FROM daily_activity" + clause
+    filtered_data = database.query(query, params)
+    filtered_data["ActivityDate"] = timestamps.parse_dates(filtered_data["ActivityDate"]).dt.normalize()
     filtered_data_avr = filtered_data.groupby("ActivityDate")[["TotalSteps", "Calories"]].mean().reset_index()
-    conn.close()
     return filtered_data_avr
 
+if __name__ == "__main__":
+    print(workout_frequency_per_period(["4/4/2016", "4/5/2016", "4/6/2016"]))
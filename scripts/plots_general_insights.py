@@ -7,7 +7,14 @@ import part5
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
 import streamlit as st
-import sqlite3
+import regression
+import correlations
+import instrumentation
+
+def add_trendline(fig, data, x, y):
+    # Least squares line of y on x drawn as a second trace, solved with NumPy instead of plotly's statsmodels trendline
+    line_x, line_y = regression.trendline(data, x, y)
+    fig.add_trace(go.Scatter(x=line_x, y=line_y, mode="lines", showlegend=False))
 
 # Define a function for styled containers
 def create_metric_block(col, title, value, unit="", bg_color="#CFEBEC"):
@@ -85,6 +92,7 @@ def is_empty_dataframe(df):
     if df.empty:
         create_correlation_block("", "Sorry, no data is available for the selected date range in this graph.", "")
 
+@instrumentation.timed()
 def plot_activity_pie_chart(dates): 
     custom_colors = {
         "Very Active": "#005B8D",  
@@ -119,6 +127,7 @@ def plot_activity_pie_chart(dates):
     
     return fig
 
+@instrumentation.timed()
 def bar_chart_hourly_average_steps(dates):
     hourly_data = part5.average_steps_per_hour(dates)
 
@@ -159,6 +168,7 @@ def bar_chart_hourly_average_steps(dates):
 
     return fig
 
+@instrumentation.timed()
 def plot_heart_rate(dates):
     heart_rate_data = part5.hourly_average_heart_rate_dates(dates)
     heart_rate_data['Hour'] = heart_rate_data['Hour'].astype(str) + ":00"
@@ -195,6 +205,7 @@ def plot_heart_rate(dates):
 
     return fig
 
+@instrumentation.timed()
 def bar_chart_hourly_average_calories(dates):
     hourly_data = part5.hourly_average_calories(dates)
 
@@ -237,6 +248,7 @@ def bar_chart_hourly_average_calories(dates):
 
     return fig
 
+@instrumentation.timed()
 def scatterplot_heart_rate_intensityvity(dates):
     data = part5.heart_rate_and_intensitivity(dates)
 
@@ -250,10 +262,10 @@ def scatterplot_heart_rate_intensityvity(dates):
         data, 
         x="TotalIntensity", 
         y="HeartRate", 
-        trendline="ols",
         labels={"TotalIntensity": "Exercise Intensity", "HeartRate": "Heart Rate (bpm)"},
         title="Correlation between Heart Rate<br>and Exercise Intensity"
     )
+    add_trendline(fig, data, "TotalIntensity", "HeartRate")
 
     fig.update_traces(
         hovertemplate="<b>Exercise Intensity:</b> %{x:.2f}<br><b>Heart Rate:</b> %{y:.0f} bpm<extra></extra>",
@@ -263,22 +275,23 @@ def scatterplot_heart_rate_intensityvity(dates):
     
     return fig, corr
 
+@instrumentation.timed()
 def scatterplot_calories_and_active_minutes(dates):
-    data = part5.calories_and_active_minutes(dates)
+    data = correlations.pair("ActiveMinutes", "Calories", dates)
 
     is_empty_dataframe(data)
 
-    corr = data["Calories"].corr(data["TotalActiveMinutes"]) 
+    corr = correlations.correlation("Calories", "ActiveMinutes", dates)
     corr = "Sorry, there is not enough data for this statistic" if np.isnan(corr) else f"{corr:.4f}"
 
     fig = px.scatter(
         data, 
-        x="TotalActiveMinutes", 
+        x="ActiveMinutes", 
         y="Calories", 
-        trendline="ols",
-        labels={"TotalActiveMinutes": "Active Minutes", "Calories": "Calories (kcal)"},
+        labels={"ActiveMinutes": "Active Minutes", "Calories": "Calories (kcal)"},
         title="Correlation between Calories <br>and Active Minutes"
     )
+    add_trendline(fig, data, "ActiveMinutes", "Calories")
 
     fig.update_traces(
         hovertemplate="<b>Active Minutes:</b> %{x:.2f}<br><b>Calories:</b> %{y:.0f} kcal<extra></extra>",
@@ -288,12 +301,13 @@ def scatterplot_calories_and_active_minutes(dates):
     
     return fig, corr  
 
+@instrumentation.timed()
 def plot_correlation_sleep_sedentary_minutes(dates):
-    data = part3.compare_sedentary_activity_and_sleep(dates)
+    data = correlations.pair("SedentaryMinutes", "TotalMinutesAsleep", dates)
 
     is_empty_dataframe(data)
 
-    corr = data["SedentaryMinutes"].corr(data["TotalMinutesAsleep"])
+    corr = correlations.correlation("SedentaryMinutes", "TotalMinutesAsleep", dates)
     corr = "Sorry, there is not enough data for this statistic" if np.isnan(corr) else f"{corr:.4f}"
 
     fig = px.scatter(
@@ -301,9 +315,9 @@ def plot_correlation_sleep_sedentary_minutes(dates):
         x="SedentaryMinutes", 
         y="TotalMinutesAsleep",
         title="Correlation between Sedentary Minutes <br>and Minutes Asleep ",
-        labels={"SedentaryMinutes": "Sedentary Minutes", "TotalMinutesAsleep": "Total Sleep Minutes"},
-        trendline="ols"
+        labels={"SedentaryMinutes": "Sedentary Minutes", "TotalMinutesAsleep": "Total Sleep Minutes"}
     )
+    add_trendline(fig, data, "SedentaryMinutes", "TotalMinutesAsleep")
 
     fig.update_layout(
         xaxis=dict(
@@ -327,12 +341,13 @@ def plot_correlation_sleep_sedentary_minutes(dates):
 
     return fig, corr
 
+@instrumentation.timed()
 def plot_correlation_sleep_active_minutes(dates):
-    data = part3.compare_activity_and_sleep(None, dates)
+    data = correlations.pair("ActiveMinutes", "TotalMinutesAsleep", dates)
 
     is_empty_dataframe(data)
 
-    corr = data["ActiveMinutes"].corr(data["TotalMinutesAsleep"]) 
+    corr = correlations.correlation("ActiveMinutes", "TotalMinutesAsleep", dates)
     corr = "Sorry, there is not enough data for this statistic" if np.isnan(corr) else f"{corr:.4f}"
 
     fig = px.scatter(
@@ -340,9 +355,9 @@ def plot_correlation_sleep_active_minutes(dates):
         x="ActiveMinutes", 
         y="TotalMinutesAsleep",
         title="Correlation between Active Minutes <br>and Minutes Asleep",
-        labels={"ActiveMinutes": "Active Minutes", "TotalMinutesAsleep": "Total Sleep Minutes"},
-        trendline="ols"
+        labels={"ActiveMinutes": "Active Minutes", "TotalMinutesAsleep": "Total Sleep Minutes"}
     )
+    add_trendline(fig, data, "ActiveMinutes", "TotalMinutesAsleep")
 
     fig.update_layout(
         xaxis=dict(
@@ -366,8 +381,9 @@ def plot_correlation_sleep_active_minutes(dates):
 
     return fig, corr
 
+@instrumentation.timed()
 def plot_correlation_weather_steps(hours, days, dates):
-    data = part5.create_scatterplot_weather(part5.hourly_weather, part5.hourly_steps, hours, days, dates)
+    data = part5.weather_and_activity("StepTotal", hours, days, dates)
 
     is_empty_dataframe(data)
 
@@ -379,9 +395,9 @@ def plot_correlation_weather_steps(hours, days, dates):
         x="StepTotal", 
         y="temp",
         title="Correlation between Temperature and Hourly Steps",
-        labels={"StepTotal": "Hourly Steps", "temp": "Temperature (in F)"},
-        trendline="ols"
+        labels={"StepTotal": "Hourly Steps", "temp": "Temperature (in F)"}
     )
+    add_trendline(fig, data, "StepTotal", "temp")
 
     fig.update_layout(
         xaxis=dict(
@@ -404,8 +420,9 @@ def plot_correlation_weather_steps(hours, days, dates):
 
     return fig, corr
 
+@instrumentation.timed()
 def plot_correlation_weather_intensity(hours, days, dates):
-    data = part5.create_scatterplot_weather(part5.hourly_weather, part5.hourly_intensity, hours, days, dates)
+    data = part5.weather_and_activity("TotalIntensity", hours, days, dates)
 
     is_empty_dataframe(data)
 
@@ -417,9 +434,9 @@ def plot_correlation_weather_intensity(hours, days, dates):
         x="TotalIntensity", 
         y="temp",
         title="Correlation between Temperature and <br> Hourly Total Intensity",
-        labels={"TotalIntensity": "Hourly Total Intensity", "temp": "Temperature (in F)"},
-        trendline="ols"
+        labels={"TotalIntensity": "Hourly Total Intensity", "temp": "Temperature (in F)"}
     )
+    add_trendline(fig, data, "TotalIntensity", "temp")
 
     fig.update_layout(
         xaxis=dict(
@@ -442,8 +459,9 @@ def plot_correlation_weather_intensity(hours, days, dates):
 
     return fig, corr
 
+@instrumentation.timed()
 def bar_chart_daily_intensity(dates):
-    hourly_data = part5.create_scatterplot_weather(part5.hourly_weather, part5.hourly_intensity, ["0-4", "4-8", "8-12", "12-16", "16-20", "20-24"], ["Weekdays", "Weekend"], dates)
+    hourly_data = part5.weather_and_activity("TotalIntensity", list(part5.HOUR_RANGES), list(part5.DAY_RANGES), dates)
     hourly_data = hourly_data.groupby(["Hour"], as_index=False)["TotalIntensity"].mean() 
 
     is_empty_dataframe(hourly_data)
@@ -485,6 +503,7 @@ def bar_chart_daily_intensity(dates):
 
     return fig
 
+@instrumentation.timed()
 def plot_active_minutes_active_distance(dates):
     fig = make_subplots(specs=[[{"secondary_y": True}]])
     df = part5.daily_activity(dates)
@@ -547,6 +566,7 @@ def plot_active_minutes_active_distance(dates):
 
     return fig
 
+@instrumentation.timed()
 def plot_weight_pie_chart(): 
     custom_colors = {
         "50 - 70kg": "#CFEBEC",  
@@ -581,6 +601,7 @@ def plot_weight_pie_chart():
     
     return fig
 
+@instrumentation.timed()
 def bar_chart_daily_sleep(dates):
     hourly_data = part5.sleep_data(dates)
 
@@ -623,11 +644,9 @@ def bar_chart_daily_sleep(dates):
 
     return fig
 
+@instrumentation.timed()
 def bar_chart_weekly_sleep(dates):
-    dates = pd.to_datetime(dates, format='%m/%d/%Y')
-    weekly_data = part3.compute_sleep_on_day(None)
-    weekly_data["date"] = pd.to_datetime(weekly_data["date"]).dt.normalize()
-    weekly_data = weekly_data[weekly_data["date"].isin(dates)]
+    weekly_data = part3.compute_sleep_on_day(None, dates)
     weekly_data = weekly_data.groupby(["Day"], as_index=False)["TotalMinutesAsleep"].mean() 
 
     is_empty_dataframe(weekly_data)
@@ -670,12 +689,13 @@ def bar_chart_weekly_sleep(dates):
 
     return fig
 
+@instrumentation.timed()
 def plot_correlation_sleep_steps(dates):
-    data = part5.create_dataframe_scatterplot_sleep("Steps", dates)
+    data = correlations.pair("StepTotal", "TotalMinutesAsleep", dates)
 
     is_empty_dataframe(data)
 
-    corr = data["StepTotal"].corr(data["TotalMinutesAsleep"]) 
+    corr = correlations.correlation("StepTotal", "TotalMinutesAsleep", dates)
     corr = "Sorry, there is not enough data for this statistic" if np.isnan(corr) else f"{corr:.4f}"
 
     fig = px.scatter(
@@ -683,9 +703,9 @@ def plot_correlation_sleep_steps(dates):
         x="StepTotal", 
         y="TotalMinutesAsleep",
         title="Correlation between Total Steps <br>and Minutes Asleep",
-        labels={"StepTotal": "Total Steps", "TotalMinutesAsleep": "Total Sleep Minutes"},
-        trendline="ols"
+        labels={"StepTotal": "Total Steps", "TotalMinutesAsleep": "Total Sleep Minutes"}
     )
+    add_trendline(fig, data, "StepTotal", "TotalMinutesAsleep")
 
     fig.update_layout(
         xaxis=dict(
@@ -708,22 +728,23 @@ def plot_correlation_sleep_steps(dates):
 
     return fig, corr
 
+@instrumentation.timed()
 def plot_correlation_sleep_calories(dates):
-    data = part5.create_dataframe_scatterplot_sleep("Calories", dates)
+    data = correlations.pair("HourlyCalories", "TotalMinutesAsleep", dates)
 
     is_empty_dataframe(data)
 
-    corr = data["Calories"].corr(data["TotalMinutesAsleep"]) 
+    corr = correlations.correlation("HourlyCalories", "TotalMinutesAsleep", dates)
     corr = "Sorry, there is not enough data for this statistic" if np.isnan(corr) else f"{corr:.4f}"
 
     fig = px.scatter(
         data, 
-        x="Calories", 
+        x="HourlyCalories", 
         y="TotalMinutesAsleep",
         title="Correlation between Calories <br>and Minutes Asleep",
-        labels={"Calories": "Calories", "TotalMinutesAsleep": "Total Sleep Minutes"},
-        trendline="ols"
+        labels={"HourlyCalories": "Calories", "TotalMinutesAsleep": "Total Sleep Minutes"}
     )
+    add_trendline(fig, data, "HourlyCalories", "TotalMinutesAsleep")
 
     fig.update_layout(
         xaxis=dict(
@@ -746,6 +767,7 @@ def plot_correlation_sleep_calories(dates):
 
     return fig, corr
 
+@instrumentation.timed()
 def plot_user_pie_chart(): 
     custom_colors = {
         "Light User (≤ 10 daily records)": "#CFEBEC",  
@@ -787,6 +809,7 @@ def plot_user_pie_chart():
     
     return fig
 
+@instrumentation.timed()
 def bar_chart_average_distance_per_week(dates):
     total_distance_avr = part5.average_distance_per_week(dates)
     max_distance = total_distance_avr["TotalDistance"].max()
@@ -820,6 +843,7 @@ def bar_chart_average_distance_per_week(dates):
 
     return fig
 
+@instrumentation.timed()
 def bar_chart_average_steps_per_week(dates):
     data_avr = part5.average_steps_per_week(dates)
     max_distance = data_avr["TotalSteps"].max()
@@ -853,6 +877,7 @@ def bar_chart_average_steps_per_week(dates):
 
     return fig
 
+@instrumentation.timed()
 def bar_chart_average_calories_per_day_for_week(dates):
     data_avr = part5.average_calories_per_week(dates)
     max_distance = data_avr["Calories"].max()
@@ -886,6 +911,7 @@ def bar_chart_average_calories_per_day_for_week(dates):
 
     return fig
 
+@instrumentation.timed()
 def plot_active_minutes_bar_chart_per_day(dates):
     df = part5.average_active_minutes_per_week(dates)
 
@@ -937,6 +963,7 @@ def plot_active_minutes_bar_chart_per_day(dates):
 
     return fig
 
+@instrumentation.timed()
 def bar_chart_total_workout_frequency_for_period(dates):
     data_avr = part5.workout_frequency_per_period(dates)
     max_distance = data_avr["WorkoutFrequency"].max()
@@ -970,6 +997,7 @@ def bar_chart_total_workout_frequency_for_period(dates):
 
     return fig
 
+@instrumentation.timed()
 def plot_steps_calories_combined_general(dates):
     # Get user data
     filtered_data = part5.average_steps_calories_per_period(dates)
@@ -1081,25 +1109,13 @@ def plot_steps_calories_combined_general(dates):
     
     return fig
 
+@instrumentation.timed()
 def plot_boxplot(column, label, dates):
-    dates = pd.to_datetime(dates, format='%m/%d/%Y')
-
-    con = sqlite3.connect("data/cleaned_fitbit.db")
-    cur = con.cursor()
-
-    daily_activity = cur.execute("SELECT * FROM daily_activity") 
-    rows = daily_activity.fetchall()
-    data = pd.DataFrame(rows, columns=[desc[0] for desc in cur.description])
+    filtered_data, summary, _ = part5.daily_activity_summary(dates)
 
-    data["ActivityDate"] = pd.to_datetime(data["ActivityDate"])
-    filtered_data = data.loc[data["ActivityDate"].isin(dates)]
-
-    if column == "TotalActiveMinutes":
-        filtered_data["TotalActiveMinutes"] = (filtered_data["VeryActiveMinutes"] + filtered_data["FairlyActiveMinutes"] + filtered_data["LightlyActiveMinutes"])
-
-    median = filtered_data.loc[:, column].median()
-    lower_quartile = filtered_data.loc[:, column].quantile(0.25)
-    upper_quartile = filtered_data.loc[:, column].quantile(0.75)
+    median = summary.loc["50%", column]
+    lower_quartile = summary.loc["25%", column]
+    upper_quartile = summary.loc["75%", column]
 
     fig = px.box(filtered_data, x=filtered_data[column])
 
@@ -1123,19 +1139,34 @@ def plot_boxplot(column, label, dates):
         title=f"{label}"
     )
 
-    return fig, filtered_data
+    return fig, summary
 
-def get_stats(filtered_data, column, decimals, unit):
+def get_stats(summary, column, decimals, unit):
+    # Statistics come from the summary of part5.daily_activity_summary, no pass over the rows is needed
     col1, col2, col3 = st.columns(3)
 
     with col1:
-        st.markdown(f"**Mean:**<br>{filtered_data.loc[:, column].mean():.{decimals}f} {unit}", unsafe_allow_html=True)
-        st.markdown(f"**Median:**<br>{filtered_data.loc[:, column].median():.{decimals}f} {unit}", unsafe_allow_html=True)
+        st.markdown(f"**Mean:**<br>{summary.loc['mean', column]:.{decimals}f} {unit}", unsafe_allow_html=True)
+        st.markdown(f"**Median:**<br>{summary.loc['50%', column]:.{decimals}f} {unit}", unsafe_allow_html=True)
     
     with col2:
-        st.markdown(f"**High:**<br>{filtered_data.loc[:, column].max():.{decimals}f} {unit}", unsafe_allow_html=True)
-        st.markdown(f"**Upper quartile:**<br>{filtered_data.loc[:, column].quantile(0.75):.{decimals}f} {unit}", unsafe_allow_html=True)
+        st.markdown(f"**High:**<br>{summary.loc['max', column]:.{decimals}f} {unit}", unsafe_allow_html=True)
+        st.markdown(f"**Upper quartile:**<br>{summary.loc['75%', column]:.{decimals}f} {unit}", unsafe_allow_html=True)
 
     with col3:
-        st.markdown(f"**Low:**<br>{filtered_data.loc[:, column].min():.{decimals}f} {unit}", unsafe_allow_html=True)
-        st.markdown(f"**Lower quartile:**<br>{filtered_data.loc[:, column].quantile(0.25):.{decimals}f} {unit}", unsafe_allow_html=True)
+        st.markdown(f"**Low:**<br>{summary.loc['min', column]:.{decimals}f} {unit}", unsafe_allow_html=True)
+        st.markdown(f"**Lower quartile:**<br>{summary.loc['25%', column]:.{decimals}f} {unit}", unsafe_allow_html=True)
+
+def performance_panel(sidebar=True):
+    # Summary of the current run (or section): self time per stage and the most expensive functions and queries,
+    # in the sidebar or, for a fragment that reruns on its own, collapsed at the end of the fragment
+    stages, total, costs = instrumentation.summary()
+
+    with (st.sidebar if sidebar else st.container()).expander("Performance", expanded=sidebar):
+        st.markdown(f"**Total:** {total:.3f} s")
+        st.dataframe(stages.rename("Seconds").round(3), use_container_width=True)
+        st.dataframe(
+            costs.rename(columns={"stage": "Stage", "name": "Function", "calls": "Calls", "self_seconds": "Self (s)", "total": "Total (s)", "rows": "Rows"}).round(3),
+            hide_index=True,
+            use_container_width=True,
+        )
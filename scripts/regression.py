@@ -0,0 +1,112 @@
+# IMPORTS
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+def design_matrix(df, x):
+    # Constant column followed by the explanatory variables
+    return np.column_stack([np.ones(len(df))] + [df[column].to_numpy(dtype=float) for column in x])
+
+def fit(df, y, x, by=None):
+    # Ordinary least squares of y on the columns x (plus a constant), for every group of the columns in by at once.
+    # The normal equations of all groups are summed in one pass and solved as one stack of small matrices.
+    # Returns one row per group and term with the coefficient, its standard error, t statistic and p-value,
+    # next to the R² and number of observations of the model.
+    x = [x] if isinstance(x, str) else list(x)
+    by = [] if by is None else [by] if isinstance(by, str) else list(by)
+
+    data = df[by + x + [y]].dropna()
+    terms = ["const"] + x
+
+    if by:
+        codes, groups = pd.MultiIndex.from_frame(data[by]).factorize()
+    else:
+        codes, groups = np.zeros(len(data), dtype=int), None
+
+    n_groups = codes.max() + 1 if len(codes) else 0
+
+    X = design_matrix(data, x)
+    values = data[y].to_numpy(dtype=float)
+
+    # X'X and X'y of every group
+    xtx = np.zeros((n_groups, len(terms), len(terms)))
+    xty = np.zeros((n_groups, len(terms)))
+    np.add.at(xtx, codes, X[:, :, None] * X[:, None, :])
+    np.add.at(xty, codes, X * values[:, None])
+
+    # The pseudo-inverse also gives an answer for groups with too few or constant observations
+    xtx_inv = np.linalg.pinv(xtx)
+    coef = np.einsum("gij,gj->gi", xtx_inv, xty)
+
+    residuals = values - np.einsum("ni,ni->n", X, coef[codes])
+    counts = np.bincount(codes, minlength=n_groups)
+    means = np.bincount(codes, values, minlength=n_groups) / np.maximum(counts, 1)
+
+    sse = np.bincount(codes, residuals ** 2, minlength=n_groups)
+    sst = np.bincount(codes, (values - means[codes]) ** 2, minlength=n_groups)
+    df_resid = counts - len(terms)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r2 = np.where(sst > 0, 1 - sse / sst, np.nan)
+        sigma2 = np.where(df_resid > 0, sse / df_resid, np.nan)
+        std_err = np.sqrt(sigma2[:, None] * np.diagonal(xtx_inv, axis1=1, axis2=2))
+        t = coef / std_err
+
+    p_value = 2 * stats.t.sf(np.abs(t), df_resid[:, None])
+
+    result = pd.DataFrame({
+        "term": np.tile(terms, n_groups),
+        "coef": coef.ravel(),
+        "std_err": std_err.ravel(),
+        "t": t.ravel(),
+        "p_value": p_value.ravel(),
+        "r2": np.repeat(r2, len(terms)),
+        "n": np.repeat(counts, len(terms)),
+    })
+
+    if by:
+        keys = pd.DataFrame(list(groups), columns=by).loc[np.repeat(np.arange(n_groups), len(terms))].reset_index(drop=True)
+        result = pd.concat([keys, result], axis=1)
+
+    return result
+
+def fit_pairs(df, pairs, by=None):
+    # Simple regressions for many (x, y) column pairs, e.g. all metric pairs for all users.
+    # Returns one row per group and pair with the intercept, slope, R², p-value of the slope and number of observations.
+    results = []
+
+    for x, y in pairs:
+        result = fit(df, y, x, by)
+        keys = [] if by is None else [by] if isinstance(by, str) else list(by)
+
+        intercept = result[result["term"] == "const"].reset_index(drop=True)
+        slope = result[result["term"] == x].reset_index(drop=True)
+
+        pair = intercept[keys].copy()
+        pair["x"] = x
+        pair["y"] = y
+        pair["intercept"] = intercept["coef"]
+        pair["slope"] = slope["coef"]
+        pair["r2"] = slope["r2"]
+        pair["p_value"] = slope["p_value"]
+        pair["n"] = slope["n"]
+        results.append(pair)
+
+    return pd.concat(results, ignore_index=True)
+
+def predict(result, df):
+    # Fitted values of a model without groups for the rows of df
+    coef = result.set_index("term")["coef"]
+
+    return coef["const"] + sum(coef[term] * df[term] for term in coef.index if term != "const")
+
+def trendline(df, x, y):
+    # Points of the fitted line of y on x, ordered on x, ready to be drawn on top of a scatter plot
+    data = df[[x, y]].dropna().sort_values(x)
+
+    if data.empty:
+        return data[x], data[y]
+
+    result = fit(data, y, x)
+
+    return data[x], predict(result, data)
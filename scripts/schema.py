@@ -0,0 +1,82 @@
+# IMPORTS
+import numpy as np
+
+# Compact dtype of every column of the loaded tables. Counts of minutes, calories per day or hour and heart rate
+# values fit in int16 and steps per day in int32. Distances and other real numbers stay float64: they are shown
+# unrounded in tables and hover labels, where float32 would print values like 6.849699974060059.
+# Ids stay int64: they do not fit in 32 bits, and as categories they would change the groupbys and merges on them.
+# Arithmetic on these dtypes wraps around silently (int16 30000 + 30000 = -5536), so they assume every value and every
+# sum of columns stays in range: at most 1440 minutes a day and steps per hour below 32768. Sums over rows (sum, mean,
+# groupby) are made in int64 by pandas; sums across columns should use df[columns].sum(axis=1), which does the same.
+COUNT = "int16"
+STEPS = "int32"
+DISTANCE = "float64"
+
+DTYPES = {
+    "daily_activity": {
+        "Id": "int64", "ActivityDate": "datetime64[ns]",
+        "TotalSteps": STEPS, "TotalDistance": DISTANCE, "TrackerDistance": DISTANCE, "LoggedActivitiesDistance": DISTANCE,
+        "VeryActiveDistance": DISTANCE, "ModeratelyActiveDistance": DISTANCE, "LightActiveDistance": DISTANCE,
+        "SedentaryActiveDistance": DISTANCE,
+        "VeryActiveMinutes": COUNT, "FairlyActiveMinutes": COUNT, "LightlyActiveMinutes": COUNT,
+        "SedentaryMinutes": COUNT, "Calories": COUNT,
+    },
+    "heart_rate": {"Id": "int64", "Time": "datetime64[ns]", "Value": "int16"},
+    "hourly_calories": {"Id": "int64", "ActivityHour": "datetime64[ns]", "Calories": "int16"},
+    "hourly_intensity": {"Id": "int64", "ActivityHour": "datetime64[ns]", "TotalIntensity": "int16", "AverageIntensity": "float64"},
+    "hourly_steps": {"Id": "int64", "ActivityHour": "datetime64[ns]", "StepTotal": "int16"},
+    "minute_sleep": {"Id": "int64", "date": "datetime64[ns]", "value": "int8", "logId": "int64"},
+    "weight_log": {"Id": "int64", "Date": "datetime64[ns]", "WeightKg": "float64", "WeightPounds": "float64", "IsManualReport": "bool", "LogId": "int64"},
+    "features_daily": {
+        "Id": "int64", "TotalSteps": STEPS, "TotalDistance": DISTANCE, "Calories": COUNT,
+        "VeryActiveMinutes": COUNT, "FairlyActiveMinutes": COUNT, "LightlyActiveMinutes": COUNT,
+        "SedentaryMinutes": COUNT, "ActiveMinutes": COUNT, "TotalMinutesAsleep": COUNT,
+        "StepTotal": STEPS, "HourlyCalories": COUNT, "TotalIntensity": COUNT,
+    },
+    "features_hourly": {"Id": "int64", "StepTotal": "int16", "Calories": "int16", "TotalIntensity": "int16", "TotalMinutesAsleep": "int16"},
+}
+
+# IsManualReport is stored as "True"/"False" text in the Fitbit export, casting the text with astype would make every value True
+BOOLEANS = {"true": True, "false": False, "1": True, "0": False}
+
+def to_bool(values):
+    # Boolean column of text or 0/1 values, None when a value is neither
+    flags = values.astype(str).str.strip().str.lower().str.removesuffix(".0").map(BOOLEANS)
+
+    return flags.astype(bool) if flags.notna().all() else None
+
+def is_lossless(values, dtype):
+    # Integer dtypes only hold whole numbers within their range; missing values (e.g. in the feature tables,
+    # where not every source has a row for every day), fractions or values out of range stay in their own dtype
+    if dtype.kind not in "iu" or values.empty:
+        return True
+
+    if values.dtype.kind not in "iuf" or values.isna().any():
+        return False
+
+    info = np.iinfo(dtype)
+    whole = values.dtype.kind != "f" or (values % 1 == 0).all()
+
+    return bool(whole and info.min <= values.min() and values.max() <= info.max)
+
+def cast(df, table):
+    # Cast the columns of a loaded table to their compact dtype, in place. Casts that would lose values are not made.
+    dtypes = DTYPES.get(table, {})
+
+    for column in df.columns.intersection(list(dtypes)):
+        dtype = np.dtype(dtypes[column])
+
+        if df[column].dtype == dtype or not is_lossless(df[column], dtype):
+            continue
+
+        if dtype.kind == "b":
+            flags = to_bool(df[column])
+
+            if flags is not None:
+                df[column] = flags
+
+            continue
+
+        df[column] = df[column].astype(dtype)
+
+    return df
@@ -0,0 +1,77 @@
+# IMPORTS
+import pandas as pd
+import database
+
+# Names of the minute_sleep values
+STAGES = {1: "Asleep", 2: "Restless", 3: "Awake"}
+
+# Sleep episodes, one row per logId: ts and EndTs are the epoch of the first and last recorded minute,
+# Night is the epoch of the day the episode ends on (the day it is attributed to)
+SESSIONS = """
+    SELECT Id, logId, MIN(ts) AS ts, MAX(ts) AS EndTs, MAX(ts) - MAX(ts) % 86400 AS Night,
+           SUM(value = 1) AS MinutesAsleep, SUM(value = 2) AS MinutesRestless, SUM(value = 3) AS MinutesAwake
+    FROM {minute_sleep}
+    WHERE ts IS NOT NULL
+    GROUP BY Id, logId
+"""
+
+# Runs of consecutive minutes in the same stage within an episode, split at midnight.
+# Minutes of one run are 60 seconds apart, so ts minus 60 times their rank is the same for the whole run.
+STAGES_RUNS = """
+    SELECT Id, logId, value, MIN(ts) AS ts, MAX(ts) + 60 AS EndTs, COUNT(*) AS Minutes
+    FROM (
+        SELECT Id, logId, value, ts,
+               ts - 60 * ROW_NUMBER() OVER (PARTITION BY Id, logId, value, ts - ts % 86400 ORDER BY ts) AS run
+        FROM {minute_sleep}
+        WHERE ts IS NOT NULL
+    )
+    GROUP BY Id, logId, value, ts - ts % 86400, run
+"""
+
+TABLES = {"sleep_sessions": SESSIONS, "sleep_stages": STAGES_RUNS}
+
+def create_tables(con):
+    # Build the episode tables from the cleaned minute_sleep table.
+    # (Id, ts) serves the per-day lookups, together with (Id, EndTs) it answers which episodes overlap a time range.
+    for table, select in TABLES.items():
+        con.execute(f"DROP TABLE IF EXISTS {table}")
+        con.execute(f"CREATE TABLE {table} AS {select.format(minute_sleep='minute_sleep')}")
+        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_id_ts ON {table} (Id, ts)")
+        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_id_endts ON {table} (Id, EndTs)")
+
+def update_tables(con, log_ids):
+    # Rebuild the episodes and stage runs of the given logIds only, e.g. after new minutes were appended to them
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS affected_logs (logId INTEGER PRIMARY KEY)")
+    con.execute("DELETE FROM affected_logs")
+    con.executemany("INSERT OR IGNORE INTO affected_logs VALUES (?)", [(int(log_id),) for log_id in log_ids])
+
+    source = "(SELECT * FROM minute_sleep WHERE logId IN (SELECT logId FROM affected_logs))"
+
+    for table, select in TABLES.items():
+        con.execute(f"DELETE FROM {table} WHERE logId IN (SELECT logId FROM affected_logs)")
+        con.execute(f"INSERT INTO {table} {select.format(minute_sleep=source)}")
+
+def sessions(user, start=None, end=None):
+    # Sleep episodes of a user, all of them or those overlapping the time range [start, end)
+    start = pd.Timestamp(start if start is not None else pd.Timestamp.min).value // 10**9
+    end = pd.Timestamp(end if end is not None else pd.Timestamp.max).value // 10**9
+
+    df = database.query("SELECT * FROM sleep_sessions WHERE Id = ? AND ts < ? AND EndTs >= ? ORDER BY logId",
+                        (int(user), end, start))
+
+    for column in ["ts", "EndTs", "Night"]:
+        df[column] = pd.to_datetime(df[column], unit="s")
+
+    return df
+
+def stages(user, dates):
+    # Stage runs of a user on the given days, a run belongs to the day its first minute is on
+    clause, params = database.where("ts", dates, user)
+    df = database.query("SELECT * FROM sleep_stages" + clause + " ORDER BY ts", params)
+
+    for column in ["ts", "EndTs"]:
+        df[column] = pd.to_datetime(df[column], unit="s")
+
+    df["Stage"] = df["value"].map(STAGES)
+
+    return df
@@ -0,0 +1,55 @@
+# IMPORTS
+import numpy as np
+import pandas as pd
+import database
+
+def day_windows(dates):
+    # [start, end) of every run of consecutive selected days; the sidebar always selects one run, so one window
+    days = pd.DatetimeIndex(pd.to_datetime(dates)).normalize().unique().sort_values()
+
+    return [(first, last + pd.Timedelta(days=1)) for first, last in database.day_runs(days)]
+
+def bounds(values, start, end):
+    # Positions of the first value >= start and the first value >= end of a sorted array, by binary search
+    return np.searchsorted(values, start, side="left"), np.searchsorted(values, end, side="left")
+
+def user_blocks(ids):
+    # {Id: (first, last)} positions of the rows of every user in an array sorted by Id
+    if not len(ids):
+        return {}
+
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(ids)) + 1])
+    ends = np.append(starts[1:], len(ids))
+
+    return {ids[first]: (first, last) for first, last in zip(starts, ends)}
+
+def positions(blocks, times, windows=None):
+    # (first, last) positions of the rows within the time windows of the given user blocks of rows sorted by (Id, time).
+    # times(first, last) returns the sorted times of a block, so each window takes two binary searches per user.
+    if windows is None:
+        return [(first, last) for first, last in blocks if last > first]
+
+    slices = []
+
+    for first, last in blocks:
+        values = times(first, last)
+
+        for start, end in windows:
+            lower, upper = bounds(values, start, end)
+
+            if upper > lower:
+                slices.append((first + lower, first + upper))
+
+    return slices
+
+def window(df, column, start, end):
+    # Rows of a frame sorted on a datetime column with start <= column < end, as a slice instead of a boolean mask
+    first, last = bounds(df[column].to_numpy(), pd.Timestamp(start).to_datetime64(), pd.Timestamp(end).to_datetime64())
+
+    return df.iloc[first:last]
+
+def day(df, column, selected_date):
+    # Rows of one day of a frame sorted on a datetime column
+    start = pd.Timestamp(selected_date).normalize()
+
+    return window(df, column, start, start + pd.Timedelta(days=1))
@@ -0,0 +1,27 @@
+# IMPORTS
+import pandas as pd
+import instrumentation
+
+# Formats of the text timestamps and dates in the Fitbit tables, e.g. "4/12/2016 1:00:00 AM" and "4/12/2016"
+TIMESTAMP_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+DATE_FORMAT = "%m/%d/%Y"
+
+def parse(values, time_format=TIMESTAMP_FORMAT, errors="raise"):
+    # Parse every distinct string once and broadcast the result back to all rows.
+    # The same timestamps repeat for every user, so this parses far fewer strings than there are rows.
+    values = pd.Series(values)
+
+    with instrumentation.span("parse", f"parse {values.name or time_format}") as record:
+        codes, uniques = pd.factorize(values)
+
+        parsed = pd.DatetimeIndex(pd.to_datetime(uniques, format=time_format, errors=errors))
+        result = parsed.take(codes, allow_fill=True, fill_value=pd.NaT)
+        record["rows"] = len(values)
+
+    return pd.Series(result, index=values.index, name=values.name)
+
+def parse_timestamps(values, errors="raise"):
+    return parse(values, TIMESTAMP_FORMAT, errors)
+
+def parse_dates(values, errors="raise"):
+    return parse(values, DATE_FORMAT, errors)
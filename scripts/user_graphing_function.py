@@ -4,13 +4,21 @@ import pandas as pd
 import numpy as np
 import part1
 import part3
-import sqlite3
+import database
+import caching
+import instrumentation
+import downsampling
+import arrow_cache
+import sleep_sessions
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+@instrumentation.timed()
+@caching.cached
 def get_user_data(user, start_date, end_date):
     # Get user data
-    user_data = part1.data[part1.data["Id"] == user].copy()
+    data = part1.get_data()
+    user_data = data[data["Id"] == user].copy()
     user_data.loc[:, "ActivityDate"] = pd.to_datetime(user_data["ActivityDate"], format="%Y-%m-%d")
     
     # Filter data based on selected date range
@@ -19,9 +27,11 @@ def get_user_data(user, start_date, end_date):
     
     return filtered_data
 
+@instrumentation.timed()
+@caching.cached
 def get_all_users_data(start_date, end_date):
     # Get all data
-    all_data = part1.data.copy()
+    all_data = part1.get_data().copy()
     
     # Convert date column to datetime
     all_data.loc[:, "ActivityDate"] = pd.to_datetime(all_data["ActivityDate"], format="%Y-%m-%d")
@@ -32,6 +42,8 @@ def get_all_users_data(start_date, end_date):
     
     return filtered_data
 
+@instrumentation.timed()
+@caching.cached
 def plot_steps_calories_combined(user, start_date, end_date):
     # Get user data
     filtered_data = get_user_data(user, start_date, end_date)
@@ -144,9 +156,12 @@ def plot_steps_calories_combined(user, start_date, end_date):
     
     return fig
 
+@instrumentation.timed()
+@caching.cached
 def get_user_data_with_sleep(user, start_date, end_date):
     # Get user data
-    user_data = part1.data[part1.data["Id"] == user].copy()
+    data = part1.get_data()
+    user_data = data[data["Id"] == user].copy()
     user_data.loc[:, "ActivityDate"] = pd.to_datetime(user_data["ActivityDate"], format="%Y-%m-%d")
     
     # Fetch sleep duration and merge with user_data
@@ -164,6 +179,8 @@ def get_user_data_with_sleep(user, start_date, end_date):
     
     return filtered_data
 
+@instrumentation.timed()
+@caching.cached
 def plot_daily_steps(user, start_date, end_date):
     filtered_data = get_user_data(user, start_date, end_date)
     
@@ -204,6 +221,8 @@ def plot_daily_steps(user, start_date, end_date):
     
     return fig_steps
 
+@instrumentation.timed()
+@caching.cached
 def plot_daily_calories(user, start_date, end_date):
     filtered_data = get_user_data(user, start_date, end_date)
     
@@ -244,6 +263,8 @@ def plot_daily_calories(user, start_date, end_date):
     
     return fig_calories
 
+@instrumentation.timed()
+@caching.cached
 def plot_activity_breakdown(user, start_date, end_date):
     filtered_data = get_user_data(user, start_date, end_date)
     
@@ -297,6 +318,8 @@ def plot_activity_breakdown(user, start_date, end_date):
     
     return fig
 
+@instrumentation.timed()
+@caching.cached
 def plot_sleep_duration(user, start_date, end_date):
     filtered_data = get_user_data_with_sleep(user, start_date, end_date)
     
@@ -337,39 +360,25 @@ def plot_sleep_duration(user, start_date, end_date):
     
     return fig_sleep
 
+@instrumentation.timed()
+@caching.cached
 def get_heart_rate_data(user, start_date, end_date):
-    conn = sqlite3.connect('data/fitbit_database.db') 
-    cur = conn.cursor()
-    
     start_date = pd.Timestamp(start_date)
     end_date = pd.Timestamp(end_date)
     date_range = pd.date_range(start=start_date, end=end_date, freq='D')
     
-    if user:
-        query = f"SELECT Id, Time, Value FROM heart_rate WHERE Id = '{user}'"
-    else:
-        query = "SELECT Id, Time, Value FROM heart_rate"
-    
-    cur.execute(query)
-    rows = cur.fetchall()
-    
-    data = pd.DataFrame(rows, columns=[desc[0] for desc in cur.description])
-    
-    # Convert Time to datetime
-    data["Time"] = pd.to_datetime(data["Time"], format="%m/%d/%Y %I:%M:%S %p", errors='coerce')
-    
-    # Filter by date range
-    filtered_data = data[data["Time"].dt.date.isin(date_range.date)]
+    # Only the selected user and date range are read from the memory-mapped heart_rate file, Time is already parsed
+    filtered_data = arrow_cache.load("heart_rate", ["Id", "Time", "Value"], date_range, user if user else None)
     
     # Add helpful columns
     if not filtered_data.empty:
-        filtered_data["Date"] = filtered_data["Time"].dt.date
+        filtered_data["Date"] = filtered_data["Time"].dt.normalize()
         filtered_data["Hour"] = filtered_data["Time"].dt.hour
     
-    conn.close()
-    
     return filtered_data
 
+@instrumentation.timed()
+@caching.cached
 def plot_heart_rate_trends(user, start_date, end_date):
     hr_data = get_heart_rate_data(user, start_date, end_date)
     
@@ -416,48 +425,48 @@ def plot_heart_rate_trends(user, start_date, end_date):
     
     return fig
 
-def plot_heart_rate_zones(user, start_date, end_date):
+# Simplified heart rate zones as (name, lower bound in bpm), each zone reaches up to the bound of the next one
+HEART_RATE_ZONES = [
+    ("Rest (0-70 bpm)", 0),         # Resting/low activity
+    ("Active (70-120 bpm)", 70),    # Normal activity/moderate exercise
+    ("Intense (120+ bpm)", 120),    # Vigorous exercise
+]
+
+def age_heart_rate_zones(age, fractions=(0.5, 0.7)):
+    # Same three zones with bounds at fractions of the age predicted maximum heart rate (220 - age)
+    max_heart_rate = 220 - age
+    lower, upper = (round(max_heart_rate * fraction) for fraction in fractions)
+
+    return [
+        (f"Rest (0-{lower} bpm)", 0),
+        (f"Active ({lower}-{upper} bpm)", lower),
+        (f"Intense ({upper}+ bpm)", upper),
+    ]
+
+def classify_heart_rate_zones(values, zones=HEART_RATE_ZONES):
+    # Zone name of every heart rate value, values above the last bound belong to the last zone
+    names = np.array([name for name, _ in zones], dtype=object)
+    bounds = [lower for _, lower in zones]
+
+    return names[np.digitize(values, bounds[1:])]
+
+@instrumentation.timed()
+@caching.cached
+def plot_heart_rate_zones(user, start_date, end_date, zones=HEART_RATE_ZONES):
     hr_data = get_heart_rate_data(user, start_date, end_date)
     
     if hr_data.empty:
         return None
     
-    # Define simplified heart rate zones (3 categories)
-    zones = {
-        'Rest (0-70 bpm)': (0, 70),      # Resting/low activity
-        'Active (70-120 bpm)': (70, 120),  # Normal activity/moderate exercise
-        'Intense (120+ bpm)': (120, 300) # Vigorous exercise
-    }
-    
-    def classify_zone(value):
-        for zone_name, (lower, upper) in zones.items():
-            if lower <= value < upper:
-                return zone_name
-        return 'Intense (120+ bpm)'
-    
-    hr_data['Zone'] = hr_data['Value'].apply(classify_zone)
-    
-    # Count measurements in each zone
-    zone_counts = hr_data['Zone'].value_counts().reset_index()
-    zone_counts.columns = ['Zone', 'Count']
+    # Average heart rate per minute, minutes are the epoch seconds of Time divided into whole minutes
+    minutes = hr_data['Time'].to_numpy().astype('datetime64[s]').astype('int64') // 60
+    minute_avg = hr_data['Value'].groupby(minutes).mean()
+
+    zone_minutes = pd.Series(classify_heart_rate_zones(minute_avg.to_numpy(), zones)).value_counts().reset_index()
+    zone_minutes.columns = ['Zone', 'Minutes']
     
-    # Group data by minute and calculate average heart rate for each minute
-    if not hr_data.empty:
-        hr_data['MinuteGroup'] = hr_data['Time'].dt.floor('min')
-        minute_avg = hr_data.groupby('MinuteGroup')['Value'].mean().reset_index()
-        
-        minute_avg['Zone'] = minute_avg['Value'].apply(classify_zone)
-        
-        zone_minutes = minute_avg['Zone'].value_counts().reset_index()
-        zone_minutes.columns = ['Zone', 'Minutes']
-    else:
-        zone_minutes = pd.DataFrame(columns=['Zone', 'Minutes'])
-    
-    custom_colors = {
-        'Rest (0-70 bpm)': '#CFEBEC',
-        'Active (70-120 bpm)': '#00B3BD',
-        'Intense (120+ bpm)': '#005B8D'
-    }
+    zone_colors = ['#CFEBEC', '#00B3BD', '#005B8D']
+    custom_colors = {name: color for (name, _), color in zip(zones, zone_colors)}
     
     fig = px.pie(
         zone_minutes, 
@@ -481,27 +490,15 @@ def plot_heart_rate_zones(user, start_date, end_date):
     
     return fig
 
+@instrumentation.timed()
+@caching.cached
 def get_heart_rate_for_day(user, selected_date):
-    conn = sqlite3.connect('data/fitbit_database.db')
     selected_date = pd.Timestamp(selected_date)
     
-    # Query all heart rate data for this user without date filtering or ordering
-    query = f"""
-    SELECT Id, Time, Value
-    FROM heart_rate
-    WHERE Id = '{user}'
-    """
-    
-    heart_rate_data = pd.read_sql_query(query, conn)
-    conn.close()
+    # Load only this user's heart rate data of the selected day, stored in (Id, ts) order
+    heart_rate_data = arrow_cache.load("heart_rate", ["Id", "Time", "Value"], [selected_date], user)
     
     if not heart_rate_data.empty:
-        heart_rate_data['Time'] = pd.to_datetime(heart_rate_data['Time'], format='%m/%d/%Y %I:%M:%S %p', errors='coerce')
-        
-        heart_rate_data = heart_rate_data[heart_rate_data['Time'].dt.date == selected_date.date()]
-        
-        heart_rate_data = heart_rate_data.sort_values(by='Time')
-        
         heart_rate_data['Hour'] = heart_rate_data['Time'].dt.hour
         heart_rate_data['Minute'] = heart_rate_data['Time'].dt.minute
         heart_rate_data['TimeOfDay'] = heart_rate_data['Time'].dt.strftime('%H:%M')
@@ -509,6 +506,8 @@ def get_heart_rate_for_day(user, selected_date):
     return heart_rate_data
 
 
+@instrumentation.timed()
+@caching.cached
 def plot_daily_heart_rate(user, selected_date):
     hr_data = get_heart_rate_for_day(user, selected_date)
     
@@ -518,9 +517,9 @@ def plot_daily_heart_rate(user, selected_date):
     # Format the date for display
     display_date = pd.Timestamp(selected_date).strftime('%B %d, %Y')
     
-    # Create the line chart
+    # Create the line chart, reduced to the point budget so the browser only receives what it can draw
     fig = px.line(
-        hr_data, 
+        downsampling.downsample(hr_data, 'Time', 'Value'), 
         x='Time', 
         y='Value',
         title=f"Heart Rate Throughout {display_date}",
@@ -540,26 +539,25 @@ def plot_daily_heart_rate(user, selected_date):
     fig.add_hline(y=peak_hr, line_dash="dash", line_color="#005B8D", 
                   annotation_text="Peak", annotation_position="top right")
     
-    active_periods = []
-    current_start = None
+    # Active periods run from the first reading above the threshold to the next reading at or below it,
+    # found on the full resolution data
     threshold = avg_hr * 1.1 
+    above = hr_data['Value'] > threshold
+    previous_above = above.shift(fill_value=False)
+
+    starts = hr_data.loc[above & ~previous_above, 'Time'].tolist()
+    ends = hr_data.loc[~above & previous_above, 'Time'].tolist()
+
+    if above.iloc[-1]:
+        ends.append(hr_data['Time'].iloc[-1])
     
-    for idx, row in hr_data.iterrows():
-        if row['Value'] > threshold and current_start is None:
-            current_start = row['Time']
-        elif row['Value'] <= threshold and current_start is not None:
-            active_periods.append((current_start, row['Time']))
-            current_start = None
-    
-    if current_start is not None:
-        active_periods.append((current_start, hr_data['Time'].iloc[-1]))
-    
-    for start, end in active_periods:
-        fig.add_vrect(
-            x0=start, x1=end,
-            fillcolor="#00B3BD", opacity=0.2,
-            layer="below", line_width=0
-        )
+    # Add all period rectangles at once, add_vrect re-validates every existing shape on each call
+    active_periods = [
+        dict(type="rect", xref="x", yref="y domain", x0=start, x1=end, y0=0, y1=1,
+             fillcolor="#00B3BD", opacity=0.2, layer="below", line_width=0)
+        for start, end in zip(starts, ends)
+    ]
+    fig.update_layout(shapes=list(fig.layout.shapes) + active_periods)
     
     fig.update_layout(
         xaxis=dict(
@@ -580,54 +578,37 @@ def plot_daily_heart_rate(user, selected_date):
     return fig
 
 
+def user_hours(name, user, start, end):
+    # Hourly rows of a user with start <= ActivityHour < end, read with a named statement on the (Id, ts) index
+    data = database.run(name, user, start, end)
+    data["ActivityHour"] = pd.to_datetime(data["ActivityHour"], unit="s")
+
+    return data
+
+@instrumentation.timed()
+@caching.cached
 def get_hourly_calories_data(user, start_date, end_date):
-    conn = sqlite3.connect('data/fitbit_database.db')
-    
-    query = f"""
-    SELECT Id, ActivityHour, Calories
-    FROM hourly_calories
-    WHERE Id = '{user}'
-    """
-    
-    data = pd.read_sql_query(query, conn)
-    conn.close()
+    # Indexed range read of the user's hours of the selected dates
+    filtered_data = user_hours("hourly_calories", user, start_date, pd.Timestamp(end_date) + pd.Timedelta(days=1))
     
-    data["ActivityHour"] = pd.to_datetime(data["ActivityHour"], format="%m/%d/%Y %I:%M:%S %p", errors='coerce')
-    
-    start_date = pd.Timestamp(start_date)
-    end_date = pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
-    filtered_data = data[(data["ActivityHour"] >= start_date) & (data["ActivityHour"] <= end_date)]
-    
-    filtered_data["Date"] = filtered_data["ActivityHour"].dt.date
+    filtered_data["Date"] = filtered_data["ActivityHour"].dt.normalize()
     filtered_data["Hour"] = filtered_data["ActivityHour"].dt.hour
     
     return filtered_data
 
+@instrumentation.timed()
+@caching.cached
 def get_calories_for_day(user, selected_date):
-    conn = sqlite3.connect('data/fitbit_database.db')
-    
-    query = f"""
-    SELECT Id, ActivityHour, Calories
-    FROM hourly_calories
-    WHERE Id = '{user}'
-    """
-    
-    data = pd.read_sql_query(query, conn)
-    conn.close()
-    
-    data["ActivityHour"] = pd.to_datetime(data["ActivityHour"], format="%m/%d/%Y %I:%M:%S %p", errors='coerce')
-    
-    if not isinstance(selected_date, pd.Timestamp):
-        selected_date = pd.Timestamp(selected_date)
-        
-    filtered_data = data[data["ActivityHour"].dt.date == selected_date.date()]
-    filtered_data = filtered_data.sort_values(by='ActivityHour')
+    selected_date = pd.Timestamp(selected_date).normalize()
+    filtered_data = user_hours("hourly_calories", user, selected_date, selected_date + pd.Timedelta(days=1))
     
     filtered_data["Hour"] = filtered_data["ActivityHour"].dt.hour
     filtered_data["HourFormatted"] = filtered_data["ActivityHour"].dt.strftime('%I %p')
     
     return filtered_data
 
+@instrumentation.timed()
+@caching.cached
 def plot_hourly_calories(user, start_date, end_date):
     data = get_hourly_calories_data(user, start_date, end_date)
     
@@ -668,6 +649,8 @@ def plot_hourly_calories(user, start_date, end_date):
     
     return fig
 
+@instrumentation.timed()
+@caching.cached
 def plot_daily_calories_pie(user, start_date, end_date):
     data = get_hourly_calories_data(user, start_date, end_date)
     
@@ -711,6 +694,8 @@ def plot_daily_calories_pie(user, start_date, end_date):
     
     return fig
 
+@instrumentation.timed()
+@caching.cached
 def plot_daily_calories_chart(user, selected_date):
     data = get_calories_for_day(user, selected_date)
     
@@ -783,54 +768,30 @@ def plot_daily_calories_chart(user, selected_date):
     return fig, total_calories, max_calories, max_hour_formatted
 
 
+@instrumentation.timed()
+@caching.cached
 def get_hourly_steps_data(user, start_date, end_date):
-    conn = sqlite3.connect('data/fitbit_database.db')
-    
-    query = f"""
-    SELECT Id, ActivityHour, StepTotal
-    FROM hourly_steps
-    WHERE Id = '{user}'
-    """
-    
-    data = pd.read_sql_query(query, conn)
-    conn.close()
+    # Indexed range read of the user's hours of the selected dates
+    filtered_data = user_hours("hourly_steps", user, start_date, pd.Timestamp(end_date) + pd.Timedelta(days=1))
     
-    data["ActivityHour"] = pd.to_datetime(data["ActivityHour"], format="%m/%d/%Y %I:%M:%S %p", errors='coerce')
-    
-    start_date = pd.Timestamp(start_date)
-    end_date = pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
-    filtered_data = data[(data["ActivityHour"] >= start_date) & (data["ActivityHour"] <= end_date)]
-    
-    filtered_data["Date"] = filtered_data["ActivityHour"].dt.date
+    filtered_data["Date"] = filtered_data["ActivityHour"].dt.normalize()
     filtered_data["Hour"] = filtered_data["ActivityHour"].dt.hour
     
     return filtered_data
 
+@instrumentation.timed()
+@caching.cached
 def get_steps_for_day(user, selected_date):
-    conn = sqlite3.connect('data/fitbit_database.db')
-    
-    query = f"""
-    SELECT Id, ActivityHour, StepTotal
-    FROM hourly_steps
-    WHERE Id = '{user}'
-    """
-    
-    data = pd.read_sql_query(query, conn)
-    conn.close()
-    
-    data["ActivityHour"] = pd.to_datetime(data["ActivityHour"], format="%m/%d/%Y %I:%M:%S %p", errors='coerce')
-    
-    if not isinstance(selected_date, pd.Timestamp):
-        selected_date = pd.Timestamp(selected_date)
-        
-    filtered_data = data[data["ActivityHour"].dt.date == selected_date.date()]
-    filtered_data = filtered_data.sort_values(by='ActivityHour')
+    selected_date = pd.Timestamp(selected_date).normalize()
+    filtered_data = user_hours("hourly_steps", user, selected_date, selected_date + pd.Timedelta(days=1))
     
     filtered_data["Hour"] = filtered_data["ActivityHour"].dt.hour
     filtered_data["HourFormatted"] = filtered_data["ActivityHour"].dt.strftime('%I %p')
     
     return filtered_data
 
+@instrumentation.timed()
+@caching.cached
 def plot_hourly_steps(user, start_date, end_date):
     data = get_hourly_steps_data(user, start_date, end_date)
     
@@ -871,6 +832,8 @@ def plot_hourly_steps(user, start_date, end_date):
     
     return fig
 
+@instrumentation.timed()
+@caching.cached
 def plot_daily_steps_pie(user, start_date, end_date):
     data = get_hourly_steps_data(user, start_date, end_date)
     
@@ -915,6 +878,8 @@ def plot_daily_steps_pie(user, start_date, end_date):
     
     return fig
 
+@instrumentation.timed()
+@caching.cached
 def plot_daily_steps_chart(user, selected_date):
     data = get_steps_for_day(user, selected_date)
     
@@ -986,54 +951,30 @@ def plot_daily_steps_chart(user, selected_date):
     
     return fig, total_steps, max_steps, max_hour_formatted
 
+@instrumentation.timed()
+@caching.cached
 def get_hourly_intensity_data(user, start_date, end_date):
-    conn = sqlite3.connect('data/fitbit_database.db')
-    
-    query = f"""
-    SELECT Id, ActivityHour, TotalIntensity, AverageIntensity
-    FROM hourly_intensity
-    WHERE Id = '{user}'
-    """
-    
-    data = pd.read_sql_query(query, conn)
-    conn.close()
+    # Indexed range read of the user's hours of the selected dates
+    filtered_data = user_hours("hourly_intensity", user, start_date, pd.Timestamp(end_date) + pd.Timedelta(days=1))
     
-    data["ActivityHour"] = pd.to_datetime(data["ActivityHour"], format="%m/%d/%Y %I:%M:%S %p", errors='coerce')
-    start_date = pd.Timestamp(start_date)
-    end_date = pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
-    filtered_data = data[(data["ActivityHour"] >= start_date) & (data["ActivityHour"] <= end_date)]
-    
-    filtered_data["Date"] = filtered_data["ActivityHour"].dt.date
+    filtered_data["Date"] = filtered_data["ActivityHour"].dt.normalize()
     filtered_data["Hour"] = filtered_data["ActivityHour"].dt.hour
     
     return filtered_data
 
+@instrumentation.timed()
+@caching.cached
 def get_intensity_for_day(user, selected_date):
-    conn = sqlite3.connect('data/fitbit_database.db')
-    
-    query = f"""
-    SELECT Id, ActivityHour, TotalIntensity, AverageIntensity
-    FROM hourly_intensity
-    WHERE Id = '{user}'
-    """
-    
-    data = pd.read_sql_query(query, conn)
-    conn.close()
-    
-    data["ActivityHour"] = pd.to_datetime(data["ActivityHour"], format="%m/%d/%Y %I:%M:%S %p", errors='coerce')
-    
-    if not isinstance(selected_date, pd.Timestamp):
-        selected_date = pd.Timestamp(selected_date)
-        
-    filtered_data = data[data["ActivityHour"].dt.date == selected_date.date()]
-    
-    filtered_data = filtered_data.sort_values(by='ActivityHour')
+    selected_date = pd.Timestamp(selected_date).normalize()
+    filtered_data = user_hours("hourly_intensity", user, selected_date, selected_date + pd.Timedelta(days=1))
     
     filtered_data["Hour"] = filtered_data["ActivityHour"].dt.hour
     filtered_data["HourFormatted"] = filtered_data["ActivityHour"].dt.strftime('%I %p')
     
     return filtered_data
 
+@instrumentation.timed()
+@caching.cached
 def plot_hourly_intensity(user, start_date, end_date):
     data = get_hourly_intensity_data(user, start_date, end_date)
     
@@ -1074,6 +1015,8 @@ def plot_hourly_intensity(user, start_date, end_date):
     
     return fig
 
+@instrumentation.timed()
+@caching.cached
 def plot_daily_intensity_pie(user, start_date, end_date):
     data = get_hourly_intensity_data(user, start_date, end_date)
     
@@ -1123,6 +1066,8 @@ def plot_daily_intensity_pie(user, start_date, end_date):
     return fig
 
 
+@instrumentation.timed()
+@caching.cached
 def plot_daily_intensity_chart(user, selected_date):
     data = get_intensity_for_day(user, selected_date)
     
@@ -1193,29 +1138,20 @@ def plot_daily_intensity_chart(user, selected_date):
     
     return fig, avg_intensity, max_intensity, max_hour_formatted
 
+@instrumentation.timed()
+@caching.cached
 def get_sleep_stage_data(user, start_date, end_date):
-    conn = sqlite3.connect("data/fitbit_database.db")
-    try:
-        query = f"SELECT date, value FROM minute_sleep WHERE Id = {user} ORDER BY date;"
-        sleep_stage_data = pd.read_sql(query, conn)
+    # Runs of minutes in the same sleep stage from the sleep_stages table, instead of one row per minute
+    dates = pd.date_range(pd.Timestamp(start_date), pd.Timestamp(end_date), freq='D')
+    sleep_stage_data = sleep_sessions.stages(user, dates)
+    
+    sleep_stage_data["date"] = sleep_stage_data["ts"]
+    sleep_stage_data["start"] = sleep_stage_data["ts"]
+    sleep_stage_data["end"] = sleep_stage_data["EndTs"]
         
-        if not sleep_stage_data.empty:
-            sleep_stage_data["date"] = pd.to_datetime(sleep_stage_data["date"])
-            sleep_stage_data = sleep_stage_data[
-                (sleep_stage_data["date"] >= pd.Timestamp(start_date)) &
-                (sleep_stage_data["date"] < pd.Timestamp(end_date) + pd.Timedelta(days=1))
-            ]
-            stage_map = {1: "Asleep", 2: "Restless", 3: "Awake"}
-            sleep_stage_data["Stage"] = sleep_stage_data["value"].map(stage_map)
-            sleep_stage_data["start"] = sleep_stage_data["date"]
-            sleep_stage_data["end"] = sleep_stage_data["start"] + pd.Timedelta(minutes=1)
-            
-        return sleep_stage_data
-    except Exception as e:
-        raise e
-    finally:
-        conn.close()
+    return sleep_stage_data[["date", "value", "Minutes", "Stage", "start", "end"]]
 
+@instrumentation.timed()
 def plot_sleep_duration_trend(filtered_data, avg_sleep_duration):
     fig = px.line(
         filtered_data,
@@ -1273,8 +1209,10 @@ def plot_sleep_duration_trend(filtered_data, avg_sleep_duration):
     
     return fig
 
+@instrumentation.timed()
 def plot_sleep_stage_distribution(sleep_stage_data):
-    stage_counts = sleep_stage_data["Stage"].value_counts().reset_index()
+    # Every row is a run of minutes, so the minutes per stage are summed instead of counting rows
+    stage_counts = sleep_stage_data.groupby("Stage")["Minutes"].sum().sort_values(ascending=False).rename("count").reset_index()
     
     fig = px.pie(
         stage_counts,
@@ -1315,6 +1253,7 @@ def plot_sleep_stage_distribution(sleep_stage_data):
     
     return fig
 
+@instrumentation.timed()
 def plot_sleep_timeline(daily_stages, selected_date):
     fig = px.timeline(
         daily_stages,
@@ -1355,39 +1294,21 @@ def plot_sleep_timeline(daily_stages, selected_date):
     return fig
 
 
+@instrumentation.timed()
+@caching.cached
 def plot_active_hours_heatmap(user, start_date, end_date):
-    conn = sqlite3.connect('data/fitbit_database.db')
-    
     # Get hourly steps data
-    query = f"""
-    SELECT Id, ActivityHour, StepTotal
-    FROM hourly_steps
-    WHERE Id = '{user}'
-    """
-    
-    steps_data = pd.read_sql_query(query, conn)
+    end = pd.Timestamp(end_date) + pd.Timedelta(days=1)
+    steps_data = user_hours("hourly_steps", user, start_date, end)
     
     # Get hourly intensity data
-    query = f"""
-    SELECT Id, ActivityHour, TotalIntensity
-    FROM hourly_intensity
-    WHERE Id = '{user}'
-    """
-    
-    intensity_data = pd.read_sql_query(query, conn)
-    
-    conn.close()
+    intensity_data = user_hours("hourly_intensity", user, start_date, end)[["Id", "ActivityHour", "TotalIntensity"]]
     
     if steps_data.empty and intensity_data.empty:
         return None
     
     # Process steps data
     if not steps_data.empty:
-        steps_data["ActivityHour"] = pd.to_datetime(steps_data["ActivityHour"], format="%m/%d/%Y %I:%M:%S %p", errors='coerce')
-        steps_data = steps_data[
-            (steps_data["ActivityHour"] >= pd.Timestamp(start_date)) & 
-            (steps_data["ActivityHour"] <= pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1))
-        ]
         steps_data["Hour"] = steps_data["ActivityHour"].dt.hour
         steps_data["DayOfWeek"] = steps_data["ActivityHour"].dt.dayofweek
         
@@ -1399,11 +1320,6 @@ def plot_active_hours_heatmap(user, start_date, end_date):
     
     # Process intensity data
     if not intensity_data.empty:
-        intensity_data["ActivityHour"] = pd.to_datetime(intensity_data["ActivityHour"], format="%m/%d/%Y %I:%M:%S %p", errors='coerce')
-        intensity_data = intensity_data[
-            (intensity_data["ActivityHour"] >= pd.Timestamp(start_date)) & 
-            (intensity_data["ActivityHour"] <= pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1))
-        ]
         intensity_data["Hour"] = intensity_data["ActivityHour"].dt.hour
         intensity_data["DayOfWeek"] = intensity_data["ActivityHour"].dt.dayofweek
         
@@ -0,0 +1,109 @@
+import os
+import shutil
+import sqlite3
+import sys
+
+import pandas as pd
+import pytest
+
+REPOSITORY = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(REPOSITORY, "scripts"))
+
+import benchmark
+import cleaning_fitbit_database
+import database
+
+USERS = 6
+DAYS = 10
+SPLIT = pd.Timestamp(benchmark.START_DATE) + pd.Timedelta(days=7)
+
+
+def clean(directory, incremental=False):
+    # data_cleaning reads and writes the data directory of the working directory
+    cwd = os.getcwd()
+    os.chdir(directory)
+
+    try:
+        cleaning_fitbit_database.data_cleaning(incremental=incremental, workers=2)
+    finally:
+        os.chdir(cwd)
+        database.close_all()
+
+
+def keep_days_before(db_path, split):
+    # Drop the rows of the original tables from the split day on, the rows a later export adds
+    con = sqlite3.connect(db_path)
+
+    for table, (column, time_format) in database.TIME_COLUMNS.items():
+        df = pd.read_sql_query(f"SELECT * FROM {table}", con)
+        times = pd.to_datetime(df[column], format=time_format)
+        df[times < split].to_sql(table, con, if_exists="replace", index=False)
+
+    con.commit()
+    con.close()
+
+
+def tables(db_path):
+    # Every table of a cleaned database with its rows in a fixed order
+    con = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    names = [row[0] for row in con.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")]
+    result = {}
+
+    for name in names:
+        df = pd.read_sql_query(f"SELECT * FROM {name}", con)
+        result[name] = df.sort_values(list(df.columns), na_position="last", kind="mergesort").reset_index(drop=True)
+
+    con.close()
+
+    return result
+
+
+@pytest.fixture(scope="module")
+def cleaned(tmp_path_factory):
+    # The same synthetic data cleaned at once and cleaned in two runs, the second one incremental
+    root = tmp_path_factory.mktemp("cleaning")
+    full, incremental = root / "full", root / "incremental"
+
+    cwd = os.getcwd()
+    os.chdir(REPOSITORY)
+
+    try:
+        benchmark.generate(str(full), USERS, days=DAYS)
+    finally:
+        os.chdir(cwd)
+
+    shutil.copytree(full / "data", incremental / "data")
+    original = incremental / "data" / "fitbit_database.db"
+
+    keep_days_before(original, SPLIT)
+    clean(incremental)
+
+    shutil.copy(full / "data" / "fitbit_database.db", original)
+    clean(incremental, incremental=True)
+
+    clean(full)
+
+    return tables(full / "data" / "cleaned_fitbit.db"), tables(incremental / "data" / "cleaned_fitbit.db")
+
+
+def test_incremental_run_creates_the_same_tables(cleaned):
+    full, incremental = cleaned
+
+    assert sorted(full) == sorted(incremental)
+    assert {"daily_activity", "heart_rate", "minute_sleep", "sleep_daily", "activity_daily", "features_daily", "features_hourly"} <= set(full)
+
+
+@pytest.mark.parametrize("table", ["daily_activity", "heart_rate", "hourly_calories", "hourly_intensity", "hourly_steps",
+                                   "minute_sleep", "weight_log", "ingest_state"])
+def test_base_tables_match_a_full_clean(cleaned, table):
+    full, incremental = cleaned
+
+    pd.testing.assert_frame_equal(incremental[table], full[table], check_dtype=False)
+
+
+def test_derived_tables_match_a_full_clean(cleaned):
+    full, incremental = cleaned
+    base = {"daily_activity", "heart_rate", "hourly_calories", "hourly_intensity", "hourly_steps", "minute_sleep", "weight_log", "ingest_state"}
+
+    for table in sorted(set(full) - base):
+        pd.testing.assert_frame_equal(incremental[table], full[table], check_dtype=False, rtol=1e-9, obj=table)
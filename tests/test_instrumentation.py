@@ -0,0 +1,59 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+
+import caching
+import instrumentation
+
+
+@instrumentation.timed()
+@caching.cached
+def hourly_bar(hours):
+    df = pd.DataFrame({"Hour": np.arange(hours), "StepTotal": np.arange(hours) * 10})
+    return px.bar(df, x="Hour", y="StepTotal")
+
+
+def test_cached_figure_keeps_its_arrays():
+    first = hourly_bar(24)
+    second = hourly_bar(24)
+
+    assert isinstance(second.data[0].x, np.ndarray)
+    assert list(second.data[0].y) == list(first.data[0].y)
+
+
+def test_rows_of_cached_figure_are_its_points():
+    hourly_bar.__wrapped__.cache.clear()
+    instrumentation.start()
+
+    hourly_bar(24)
+    hourly_bar(24)
+
+    spans = instrumentation.spans()
+    instrumentation.start(enabled=False)
+
+    assert [span["stage"] for span in spans] == ["figure", "figure"]
+    assert [span["rows"] for span in spans] == [24, 24]
+
+
+def test_section_spans_are_shown_apart_and_added_to_the_run():
+    instrumentation.start()
+
+    with instrumentation.span("sql", "before"):
+        pass
+
+    with instrumentation.section():
+        with instrumentation.span("figure", "fragment"):
+            pass
+
+        section_spans = [span["name"] for span in instrumentation.spans()]
+
+    run_spans = [span["name"] for span in instrumentation.spans()]
+    instrumentation.start(enabled=False)
+
+    assert section_spans == ["fragment"]
+    assert run_spans == ["before", "fragment"]
@@ -0,0 +1,56 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+
+import regression
+
+
+def sample(seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+
+    for user, (slope, intercept, n) in enumerate([(0.05, 1200.0, 30), (-0.02, 2500.0, 45), (0.1, 800.0, 12)]):
+        steps = rng.uniform(0, 20000, n)
+        calories = intercept + slope * steps + rng.normal(0, 150, n)
+        frames.append(pd.DataFrame({"Id": user, "TotalSteps": steps, "Calories": calories}))
+
+    df = pd.concat(frames, ignore_index=True)
+    df.loc[3, "Calories"] = np.nan
+
+    return df
+
+
+def assert_matches_linregress(result, data):
+    data = data.dropna()
+    expected = stats.linregress(data["TotalSteps"], data["Calories"])
+    terms = result.set_index("term")
+
+    assert terms.loc["TotalSteps", "coef"] == pytest.approx(expected.slope)
+    assert terms.loc["const", "coef"] == pytest.approx(expected.intercept)
+    assert terms.loc["TotalSteps", "std_err"] == pytest.approx(expected.stderr)
+    assert terms.loc["const", "std_err"] == pytest.approx(expected.intercept_stderr)
+    assert terms.loc["TotalSteps", "p_value"] == pytest.approx(expected.pvalue)
+    assert terms.loc["TotalSteps", "r2"] == pytest.approx(expected.rvalue ** 2)
+    assert terms.loc["TotalSteps", "n"] == len(data)
+
+
+def test_fit_without_groups_matches_linregress():
+    df = sample()
+
+    assert_matches_linregress(regression.fit(df, "Calories", "TotalSteps"), df)
+
+
+def test_fit_per_group_matches_linregress():
+    df = sample()
+    result = regression.fit(df, "Calories", "TotalSteps", by="Id")
+
+    assert sorted(result["Id"].unique()) == [0, 1, 2]
+
+    for user, data in df.groupby("Id"):
+        assert_matches_linregress(result[result["Id"] == user], data)